@@ -1,14 +1,59 @@
 # api/main.py
 
-from fastapi import FastAPI
+import logging
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from api.routes.profiles import router as profiles_router
 from api.services.jobs import start_worker
+from api.services.mongo import close_async_client, configure_threadpool, get_db
+from storage.indexes import ENSURE_INDEXES_ON_STARTUP, ensure_indexes
+from utils.metrics import HTTP_REQUEST_SECONDS, register_mongo_metrics, render_metrics, watch_pipeline_backlog
+
+logger = logging.getLogger(__name__)
+
+#  Before any handler, worker or backlog gauge builds the shared Mongo clients
+register_mongo_metrics()
 
 app = FastAPI(title="ScraperDB API", version="0.1")
 
 app.include_router(profiles_router)
 
+watch_pipeline_backlog(get_db)
+
+@app.middleware("http")
+async def _time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        #  Label by route template, not raw path, to keep label cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        HTTP_REQUEST_SECONDS.labels(request.method, path, status).observe(time.perf_counter() - start)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    #  Backlog gauges run blocking counts: keep them off the event loop
+    body = await run_in_threadpool(render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 @app.on_event("startup")
-def _startup():
-    #  Starts the in-process background worker thread
-    start_worker()
+async def _startup():
+    configure_threadpool()
+    if ENSURE_INDEXES_ON_STARTUP:
+        try:
+            await run_in_threadpool(ensure_indexes, get_db())
+        except Exception as exc:
+            logger.warning("Could not apply Mongo indexes at startup: %s", exc)
+    #  Starts the in-process job workers (JOB_WORKERS threads; 0 = separate worker nodes)
+    await run_in_threadpool(start_worker)
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await close_async_client()
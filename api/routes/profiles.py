@@ -1,20 +1,35 @@
 # api/routes/profiles.py
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime, timezone
 import os
 from bson import ObjectId
+from starlette.concurrency import run_in_threadpool
 
-from api.services.mongo import get_db
-from api.services.jobs import enqueue_job
-from api.services.search import search_tenders_for_profile
+from api.services.mongo import get_async_db, get_db
+from api.services.profile_ingest import remove_profile_document
+from api.services.progress import broker, job_events, job_snapshot
+from api.services.jobs import enqueue_job, new_job
+from api.services.search import normalize_filters, precomputed_matches_for_profile_async, search_tenders_for_profile
+from api.services.search_cache import search_cache
+from api.services.uploads import UploadTooLarge, safe_filename, stream_to_disk
+from embeddings.packed_vectors import WITHOUT_VECTORS
+from storage.doc_cost import PRIORITY_BY_DOC_TYPE, docling_cost, probe_pdf
+from utils.metrics import span
 
 router = APIRouter()
 
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 @router.post("/profiles")
-def create_profile():
-    db = get_db()
+async def create_profile():
+    db = get_async_db()
     profiles = db["company_profiles"]
 
     now = datetime.now(timezone.utc)
@@ -24,12 +39,15 @@ def create_profile():
         "created_at": now,
         "updated_at": now,
     }
-    res = profiles.insert_one(profile)
+    res = await profiles.insert_one(profile)
     return {"profile_id": str(res.inserted_id)}
 
 @router.post("/profiles/{profile_id}/documents")
-async def upload_profile_documents(profile_id: str, pdfs: List[UploadFile] = File(...)):
-    db = get_db()
+async def upload_profile_documents(
+    profile_id: str,
+    pdfs: List[UploadFile] = File(...),
+):
+    db = get_async_db()
     profiles = db["company_profiles"]
     docs = db["company_documents"]
     jobs = db["jobs"]
@@ -40,100 +58,173 @@ async def upload_profile_documents(profile_id: str, pdfs: List[UploadFile] = Fil
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid profile_id")
 
-    profile = profiles.find_one({"_id": profile_oid})
+    profile = await profiles.find_one({"_id": profile_oid}, WITHOUT_VECTORS)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
 
-    # Save PDFs to disk
+    # Validate every file before writing any of them
+    filenames = []
+    for f in pdfs:
+        try:
+            filename = safe_filename(f.filename)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        if not filename.lower().endswith(".pdf"):
+            raise HTTPException(status_code=400, detail=f"Only PDF allowed: {f.filename}")
+        filenames.append(filename)
+
+    # Stream PDFs to disk (chunked, hashed, size-capped)
     base_dir = os.path.join("data", "pdfs", "PROFILES", profile_id)
-    os.makedirs(base_dir, exist_ok=True)
+    await run_in_threadpool(os.makedirs, base_dir, exist_ok=True)
 
     now = datetime.now(timezone.utc)
 
-    inserted_doc_ids = []
-    for f in pdfs:
-        if not f.filename.lower().endswith(".pdf"):
-            raise HTTPException(status_code=400, detail=f"Only PDF allowed: {f.filename}")
-
-        save_path = os.path.join(base_dir, f.filename)
+    stored = []
+    try:
+        for f, filename in zip(pdfs, filenames):
+            stored.append(await stream_to_disk(f, os.path.join(base_dir, filename)))
+    except UploadTooLarge as exc:
+        for item in stored:
+            await run_in_threadpool(_remove_quietly, item.path)
+        raise HTTPException(status_code=413, detail=str(exc))
+    finally:
+        for f in pdfs:
+            await f.close()
 
-        content = await f.read()
-        with open(save_path, "wb") as out:
-            out.write(content)
+    # Cost pre-pass (page count / text layer): orders Docling work and this job's place in the queue
+    costs = [await run_in_threadpool(lambda p=item.path: docling_cost(probe_pdf(p), get_db())) for item in stored]
 
-        doc_rec = {
+    doc_recs = [
+        {
             "profile_id": profile_oid,
-            "document_name": f.filename,
-            "local_path": save_path,
+            "document_name": filename,
+            "local_path": item.path,
             "docling_status": "pending",
-            "size_kb": round(len(content) / 1024, 2),
+            "size_kb": round(item.size_bytes / 1024, 2),
+            "sha256": item.sha256,
+            "priority": PRIORITY_BY_DOC_TYPE["profile"],
+            "cost": cost,
             "created_at": now,
             "updated_at": now,
         }
-        r = docs.insert_one(doc_rec)
-        inserted_doc_ids.append(r.inserted_id)
-
-    # Create job
-    job = {
-        "profile_id": profile_oid,
-        "status": "queued",
-        "step": "docling",
-        "progress": 0,
-        "error": None,
-        "created_at": now,
-        "updated_at": now,
-    }
-    job_res = jobs.insert_one(job)
+        for filename, item, cost in zip(filenames, stored, costs)
+    ]
+    await docs.insert_many(doc_recs, ordered=False)
+
+    # Create job (durable: picked up by any worker, see api/services/jobs.py)
+    predicted_s = sum(c["predicted_s"] for c in costs)
+    job_res = await jobs.insert_one(new_job(profile_oid, now=now, predicted_s=predicted_s))
     job_id = str(job_res.inserted_id)
 
     # Update profile status
-    profiles.update_one({"_id": profile_oid}, {"$set": {"status": "PROCESSING", "updated_at": now}})
+    await profiles.update_one({"_id": profile_oid}, {"$set": {"status": "PROCESSING", "updated_at": now}})
 
-    # Enqueue job (async processing)
+    # Wake in-process workers; other workers find it on their next poll
     enqueue_job(job_id)
 
     return {"job_id": job_id, "profile_id": profile_id, "uploaded": len(pdfs)}
 
+@router.delete("/profiles/{profile_id}/documents/{document_id}")
+async def delete_profile_document(profile_id: str, document_id: str):
+    db = get_async_db()
+    profiles = db["company_profiles"]
+    try:
+        profile_oid = ObjectId(profile_id)
+        document_oid = ObjectId(document_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid profile_id or document_id")
+
+    profile = await profiles.find_one({"_id": profile_oid}, {"status": 1})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if profile.get("status") == "PROCESSING":
+        raise HTTPException(status_code=409, detail="Profile is processing. Please wait for the job to finish.")
+
+    # Subtracts the document's contribution; vector store calls are sync
+    needs_reindex = await run_in_threadpool(remove_profile_document, profile_oid, document_oid)
+    if needs_reindex is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    job_id = None
+    if needs_reindex:
+        now = datetime.now(timezone.utc)
+        job_res = await db["jobs"].insert_one(new_job(profile_oid, now=now))
+        job_id = str(job_res.inserted_id)
+        await profiles.update_one({"_id": profile_oid}, {"$set": {"status": "PROCESSING", "updated_at": now}})
+        enqueue_job(job_id)
+
+    return {"profile_id": profile_id, "document_id": document_id, "deleted": True, "job_id": job_id}
+
 @router.get("/jobs/{job_id}")
-def get_job_status(job_id: str):
-    db = get_db()
+async def get_job_status(job_id: str):
+    try:
+        job_oid = ObjectId(job_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid job_id")
+
+    # Running on a local worker that holds the lease: answer from memory, no Mongo read
+    latest = broker.latest(job_id)
+    if latest and latest.get("profile_id"):
+        return latest
+
+    db = get_async_db()
     jobs = db["jobs"]
+    job = await jobs.find_one({"_id": job_oid})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job_snapshot(job)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events: `progress` on every change, `end` once done/failed."""
     try:
         job_oid = ObjectId(job_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid job_id")
 
-    job = jobs.find_one({"_id": job_oid})
+    job = await get_async_db()["jobs"].find_one({"_id": job_oid})
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return {
-        "job_id": job_id,
-        "profile_id": str(job["profile_id"]),
-        "status": job["status"],
-        "step": job.get("step"),
-        "progress": job.get("progress", 0),
-        "error": job.get("error"),
-    }
+    return StreamingResponse(
+        job_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/profiles/{profile_id}")
-def get_profile(profile_id: str):
-    db = get_db()
+async def get_profile(profile_id: str):
+    db = get_async_db()
     profiles = db["company_profiles"]
     try:
         profile_oid = ObjectId(profile_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid profile_id")
 
-    profile = profiles.find_one({"_id": profile_oid})
+    profile = await profiles.find_one({"_id": profile_oid}, WITHOUT_VECTORS)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
 
     return {"profile_id": profile_id, "status": profile["status"]}
 
 @router.post("/profiles/{profile_id}/search")
-def search(profile_id: str, top_k: Optional[int] = 5):
-    db = get_db()
+async def search(
+    profile_id: str,
+    top_k: Optional[int] = 5,
+    pooling: Optional[str] = None,
+    multi_vector: Optional[bool] = None,
+    hybrid: Optional[bool] = None,
+    precomputed: bool = False,
+    source: Optional[List[str]] = Query(None),
+    document_type: Optional[List[str]] = Query(None),
+    published_after: Optional[datetime] = None,
+    published_before: Optional[datetime] = None,
+    closing_after: Optional[datetime] = None,
+    closing_before: Optional[datetime] = None,
+    status: Optional[str] = None,
+):
+    db = get_async_db()
     profiles = db["company_profiles"]
 
     try:
@@ -141,12 +232,66 @@ def search(profile_id: str, top_k: Optional[int] = 5):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid profile_id")
 
-    profile = profiles.find_one({"_id": profile_oid})
+    profile = await profiles.find_one({"_id": profile_oid}, WITHOUT_VECTORS)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
 
     if profile.get("status") != "READY":
         raise HTTPException(status_code=409, detail="Profile not READY yet. Please wait for processing.")
 
-    results = search_tenders_for_profile(profile_id=profile_id, top_k=int(top_k or 5))
+    top_k = int(top_k or 5)
+    try:
+        filters = normalize_filters(
+            source=source,
+            document_type=document_type,
+            published_after=published_after,
+            published_before=published_before,
+            closing_after=closing_after,
+            closing_before=closing_before,
+            status=status,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if precomputed:
+        results = await precomputed_matches_for_profile_async(profile_id, top_k=top_k, filters=filters)
+        return {"profile_id": profile_id, "results": results}
+
+    embedding_version = profile.get("profile_embedding_version") or str(profile.get("updated_at"))
+    # Keyed on the raw filter params: a resolved status=open bound moves with the clock
+    key = search_cache.make_key(
+        profile_id, embedding_version, top_k, pooling=pooling, multi_vector=multi_vector, hybrid=hybrid,
+        source=tuple(sorted(source)) if source else None,
+        document_type=tuple(sorted(document_type)) if document_type else None,
+        published_after=published_after, published_before=published_before,
+        closing_after=closing_after, closing_before=closing_before, status=status,
+    )
+
+    # Vector/BM25 scoring is CPU-bound and uses the sync clients: keep it off the loop
+    try:
+        with span("search", profile_id=profile_id, top_k=top_k, hybrid=hybrid, multi_vector=multi_vector):
+            results = await run_in_threadpool(
+                search_cache.get_or_compute,
+                key,
+                lambda: search_tenders_for_profile(
+                    profile_id=profile_id, top_k=top_k, pooling=pooling, multi_vector=multi_vector, hybrid=hybrid,
+                    filters=filters,
+                ),
+            )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return {"profile_id": profile_id, "results": results}
+
+@router.get("/profiles/{profile_id}/matches")
+async def get_profile_matches(profile_id: str, since: Optional[datetime] = None, limit: int = 20):
+    try:
+        ObjectId(profile_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid profile_id")
+
+    results = await precomputed_matches_for_profile_async(profile_id, top_k=max(1, min(limit, 200)), since=since)
+    return {"profile_id": profile_id, "results": results}
+
+@router.get("/search/cache/stats")
+def search_cache_stats():
+    return search_cache.stats()
@@ -1,53 +1,366 @@
 # api/services/jobs.py
+#
+# Durable job queue on the `jobs` collection. A job is claimed atomically
+# (find_one_and_update) and held under a lease the worker renews with
+# heartbeats; a job whose lease runs out (crashed worker, killed replica)
+# becomes claimable again. Failures are retried with exponential backoff up
+# to JOB_MAX_ATTEMPTS, higher `priority` is served first.
+#
+#   status: queued -> running -> done | failed   (running -> queued on retry)
+#
+# Workers run as threads inside the API (JOB_WORKERS, 0 = none) or as a
+# separate pool:
+#
+#   python -m api.services.jobs --threads 2 --processes 4
 
 from __future__ import annotations
 
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import socket
 import threading
-import queue
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 
 from api.services.mongo import get_db
-from api.services.profile_ingest import process_profile_job
+from api.services.profile_ingest import JobCancelled, process_profile_job
+from api.services.progress import flush_progress, hold_job, publish_progress, release_job
+from embeddings.flat_store import INTERPROCESS_LOCKING
+from embeddings.vector_store import VECTOR_BACKEND
+from storage.indexes import ENSURE_INDEXES_ON_STARTUP, ensure_indexes
+from utils.metrics import register_mongo_metrics
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "900"))
+JOB_DEFAULT_PRIORITY = int(os.getenv("JOB_DEFAULT_PRIORITY", "0"))
+
+JOBS_COLLECTION = "jobs"
+# Priority first, then shortest predicted Docling time (storage/doc_cost.py), then age
+_CLAIM_SORT = [("priority", DESCENDING), ("predicted_s", ASCENDING), ("available_at", ASCENDING), ("_id", ASCENDING)]
 
-_job_queue: "queue.Queue[str]" = queue.Queue()
-_worker_started = False
+logger = logging.getLogger(__name__)
+
+_wakeup = threading.Event()
+_workers: List[threading.Thread] = []
 _worker_lock = threading.Lock()
 
+def new_job(
+    profile_id: ObjectId,
+    priority: int = JOB_DEFAULT_PRIORITY,
+    now: Optional[datetime] = None,
+    predicted_s: float = 0.0,
+) -> Dict[str, Any]:
+    """A queued ingest job document, ready for insert_one."""
+    now = now or datetime.now(timezone.utc)
+    return {
+        "profile_id": profile_id,
+        "status": "queued",
+        "step": "docling",
+        "progress": 0,
+        "error": None,
+        "priority": int(priority),
+        "predicted_s": round(float(predicted_s), 2),
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "available_at": now,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
 def enqueue_job(job_id: str) -> None:
-    _job_queue.put(job_id)
+    """The job is already durable once inserted; this only wakes local workers."""
+    _wakeup.set()
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+def claim_job(db, worker_id: str) -> Optional[dict]:
+    """
+    Atomically take the best available job: queued and due, or running
+    under an expired lease with attempts left. Returns the claimed job.
+    """
+    now = datetime.now(timezone.utc)
+    return db[JOBS_COLLECTION].find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {
+                    "status": "running",
+                    "lease_expires_at": {"$lt": now},
+                    "$expr": {"$lt": ["$attempts", {"$ifNull": ["$max_attempts", JOB_MAX_ATTEMPTS]}]},
+                },
+            ]
+        },
+        {
+            "$set": {
+                "status": "running",
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "heartbeat_at": now,
+                "started_at": now,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=_CLAIM_SORT,
+        return_document=ReturnDocument.AFTER,
+    )
+
+def renew_lease(db, job_id: ObjectId, worker_id: str) -> bool:
+    """Extend the lease; False if another worker has taken the job over."""
+    now = datetime.now(timezone.utc)
+    res = db[JOBS_COLLECTION].update_one(
+        {"_id": job_id, "lease_owner": worker_id},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS), "heartbeat_at": now}},
+    )
+    return res.matched_count == 1
+
+def _release(db, job_id: ObjectId, worker_id: str) -> None:
+    db[JOBS_COLLECTION].update_one(
+        {"_id": job_id, "lease_owner": worker_id},
+        {"$set": {"lease_owner": None, "lease_expires_at": None}},
+    )
+
+def _fail_or_retry(db, job: dict, worker_id: str, exc: BaseException) -> None:
+    now = datetime.now(timezone.utc)
+    attempts = int(job.get("attempts", 1))
+    owned = {"_id": job["_id"], "lease_owner": worker_id}
+    if attempts < int(job.get("max_attempts") or JOB_MAX_ATTEMPTS):
+        delay = _retry_delay(attempts)
+        db[JOBS_COLLECTION].update_one(owned, {"$set": {
+            "status": "queued",
+            "error": str(exc),
+            "available_at": now + timedelta(seconds=delay),
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "updated_at": now,
+        }})
+        publish_progress(job["_id"], job["profile_id"], status="queued", error=str(exc))
+        logger.warning("Job %s failed (attempt %d), retrying in %.0fs: %s", job["_id"], attempts, delay, exc)
+        return
+
+    res = db[JOBS_COLLECTION].update_one(owned, {"$set": {
+        "status": "failed",
+        "step": "error",
+        "error": str(exc),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "updated_at": now,
+    }})
+    if res.matched_count:
+        db["company_profiles"].update_one(
+            {"_id": job["profile_id"]}, {"$set": {"status": "FAILED", "updated_at": now}}
+        )
+        publish_progress(job["_id"], job["profile_id"], status="failed", step="error", error=str(exc))
+    logger.error("Job %s failed after %d attempts: %s", job["_id"], attempts, exc)
+
+class _Heartbeat:
+    """
+    Renews a job's lease from a side thread while the job runs; sets `lost`
+    when another worker has taken the job over.
+    """
+
+    def __init__(self, db, job_id: ObjectId, worker_id: str) -> None:
+        self._stop = threading.Event()
+        self.lost = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(db, job_id, worker_id), daemon=True)
+
+    def _run(self, db, job_id: ObjectId, worker_id: str) -> None:
+        while not self._stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                flush_progress(job_id)
+                if not renew_lease(db, job_id, worker_id):
+                    logger.warning("Worker %s lost the lease on job %s", worker_id, job_id)
+                    self.lost.set()
+                    release_job(job_id)
+                    return
+            except Exception as exc:
+                # Transient: the next beat retries, well before the lease runs out
+                logger.warning("Heartbeat for job %s failed: %s", job_id, exc)
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+def run_claimed_job(db, job: dict, worker_id: str) -> None:
+    hold_job(job["_id"])
+    publish_progress(job["_id"], job["profile_id"], status="running", attempts=job.get("attempts", 1), error=None)
+    try:
+        with _Heartbeat(db, job["_id"], worker_id) as heartbeat:
+            process_profile_job(str(job["_id"]), cancelled=heartbeat.lost)
+    except JobCancelled as exc:
+        # The new owner runs and records the job; nothing of ours to write
+        logger.warning("Worker %s abandoned job %s: %s", worker_id, job["_id"], exc)
+    except Exception as exc:
+        try:
+            _fail_or_retry(db, job, worker_id, exc)
+        except Exception:
+            logger.exception("Could not record failure of job %s", job["_id"])
+    else:
+        _release(db, job["_id"], worker_id)
+    finally:
+        # Whoever runs the job next owns its progress; stop serving ours
+        release_job(job["_id"])
+
+def recover_orphaned_jobs(db) -> Dict[str, int]:
+    """
+    Startup sweep: backfill queue fields on jobs written before the durable
+    queue, requeue running jobs nobody holds a lease on, fail expired ones
+    that are out of attempts, and requeue profiles left in PROCESSING with
+    no live job.
+    """
+    jobs = db[JOBS_COLLECTION]
+    now = datetime.now(timezone.utc)
+    counts = {"backfilled": 0, "requeued": 0, "failed": 0, "profiles_requeued": 0}
+
+    counts["backfilled"] = jobs.update_many(
+        {"status": "queued", "available_at": {"$exists": False}},
+        [{"$set": {
+            "available_at": {"$ifNull": ["$created_at", now]},
+            "priority": {"$ifNull": ["$priority", JOB_DEFAULT_PRIORITY]},
+            "attempts": {"$ifNull": ["$attempts", 0]},
+        }}],
+    ).modified_count
 
-def start_worker() -> None:
-    global _worker_started
+    # Running under the old in-memory worker: no lease, and that process is gone
+    counts["requeued"] = jobs.update_many(
+        {"status": "running", "lease_expires_at": None},
+        [{"$set": {
+            "status": "queued",
+            "available_at": now,
+            "priority": {"$ifNull": ["$priority", JOB_DEFAULT_PRIORITY]},
+            "attempts": {"$ifNull": ["$attempts", 0]},
+            "updated_at": now,
+        }}],
+    ).modified_count
+
+    exhausted = {
+        "status": "running",
+        "lease_expires_at": {"$lt": now},
+        "$expr": {"$gte": ["$attempts", {"$ifNull": ["$max_attempts", JOB_MAX_ATTEMPTS]}]},
+    }
+    for job in jobs.find(exhausted, {"profile_id": 1}):
+        res = jobs.update_one(
+            {"_id": job["_id"], **exhausted},
+            {"$set": {"status": "failed", "step": "error", "error": "lease expired after final attempt",
+                      "lease_owner": None, "lease_expires_at": None, "updated_at": now}},
+        )
+        if res.modified_count:
+            counts["failed"] += 1
+            db["company_profiles"].update_one(
+                {"_id": job["profile_id"]}, {"$set": {"status": "FAILED", "updated_at": now}}
+            )
+
+    active = set(jobs.distinct("profile_id", {"status": {"$in": ["queued", "running"]}}))
+    for profile in db["company_profiles"].find({"status": "PROCESSING"}, {"_id": 1}):
+        if profile["_id"] in active:
+            continue
+        jobs.update_one(
+            {"profile_id": profile["_id"], "status": "queued"},
+            {"$setOnInsert": new_job(profile["_id"], now=now)},
+            upsert=True,
+        )
+        counts["profiles_requeued"] += 1
+
+    if any(counts.values()):
+        logger.info("Job recovery: %s", counts)
+    return counts
+
+def _worker_loop(worker_id: str, stop: Optional[threading.Event] = None) -> None:
+    db = get_db()
+    while stop is None or not stop.is_set():
+        try:
+            job = claim_job(db, worker_id)
+        except Exception as exc:
+            logger.warning("Worker %s could not claim a job: %s", worker_id, exc)
+            job = None
+        if job is None:
+            _wakeup.wait(JOB_POLL_SECONDS)
+            _wakeup.clear()
+            continue
+        run_claimed_job(db, job, worker_id)
+
+def _worker_id(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+def _prepare(db) -> None:
+    if ENSURE_INDEXES_ON_STARTUP:
+        ensure_indexes(db, ["jobs", "company_profiles", "company_documents", "docling_outputs"])
+    recover_orphaned_jobs(db)
+
+def start_worker(threads: int = JOB_WORKERS) -> None:
+    """Start the in-process worker threads (no-op if JOB_WORKERS=0 or already started)."""
     with _worker_lock:
-        if _worker_started:
+        if _workers or threads <= 0:
             return
-        t = threading.Thread(target=_worker_loop, daemon=True)
-        t.start()
-        _worker_started = True
-
-def _worker_loop():
-    while True:
-        job_id = _job_queue.get()
         try:
-            process_profile_job(job_id)
+            _prepare(get_db())
         except Exception as exc:
-            # Last-resort job failure update
-            db = get_db()
-            jobs = db["jobs"]
-            try:
-                jobs.update_one(
-                    {"_id": ObjectId(job_id)},
-                    {
-                        "$set": {
-                            "status": "failed",
-                            "step": "error",
-                            "error": str(exc),
-                            "updated_at": datetime.now(timezone.utc),
-                        }
-                    },
-                )
-            except Exception:
-                pass
-        finally:
-            _job_queue.task_done()
+            logger.warning("Job queue startup sweep failed: %s", exc)
+        for i in range(threads):
+            t = threading.Thread(target=_worker_loop, args=(_worker_id(i),), name=f"job-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+def run_workers(threads: int) -> None:
+    """Blocking worker pool for a dedicated process or node."""
+    # Spawned worker processes start without the parent's pymongo listeners
+    register_mongo_metrics()
+    pool = [
+        threading.Thread(target=_worker_loop, args=(_worker_id(i),), name=f"job-worker-{i}", daemon=True)
+        for i in range(max(1, threads))
+    ]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(processName)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Run profile-ingest workers against the jobs collection")
+    parser.add_argument("--threads", type=int, default=max(1, JOB_WORKERS), help="worker threads per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--recover-only", action="store_true", help="run the startup sweep and exit")
+    args = parser.parse_args()
+
+    if args.processes > 1 and VECTOR_BACKEND in ("flat", "hnsw") and not INTERPROCESS_LOCKING:
+        # Profile chunks go to one flat store; without flock its writers are only safe within a process
+        parser.error(f"--processes > 1 needs file locking for VECTOR_BACKEND={VECTOR_BACKEND}; use --threads")
+
+    register_mongo_metrics()
+    _prepare(get_db())
+    if args.recover_only:
+        return
+
+    if args.processes <= 1:
+        run_workers(args.threads)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=run_workers, args=(args.threads,), name=f"jobs-{i}") for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,43 @@
 # api/services/mongo.py
+#
+# get_db():       blocking pymongo client, for the worker, scripts and the
+#                 CPU-bound search path that already runs in the threadpool.
+#                 This is the process-wide client from storage/mongo.py, so
+#                 the API shares one pool with everything it imports.
+# get_async_db(): pymongo's native asyncio client, for the API handlers, so
+#                 a request waiting on Mongo holds no worker thread.
+#
+# Both clients share the pool/timeout settings in storage/mongo.py.
 
 import os
-from pymongo import MongoClient
-from dotenv import load_dotenv
 
-load_dotenv()
+import anyio.to_thread
+from pymongo import AsyncMongoClient
 
-_MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-_DB_NAME = "tender_db"
+from storage.mongo import DB_NAME, MONGO_URI, client_options, get_db
 
-_client = None
+# Threads for sync work offloaded from handlers (search, disk I/O); anyio's default is 40
+API_THREADPOOL_SIZE = int(os.getenv("API_THREADPOOL_SIZE", "0"))
 
-def get_db():
-    global _client
-    if _client is None:
-        _client = MongoClient(_MONGO_URI)
-    return _client[_DB_NAME]
+_async_client = None
+
+def get_async_db():
+    """
+    Async database handle. The client binds to the running event loop on
+    first use, so only call this from inside the app's loop.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncMongoClient(MONGO_URI, **client_options())
+    return _async_client[DB_NAME]
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        client, _async_client = _async_client, None
+        await client.close()
+
+def configure_threadpool(size: int = API_THREADPOOL_SIZE) -> None:
+    """Resize the threadpool behind run_in_threadpool (call from the running loop)."""
+    if size > 0:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = size
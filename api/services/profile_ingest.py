@@ -2,22 +2,57 @@
 
 from __future__ import annotations
 
+import logging
+import os
+import threading
+import time
 from datetime import datetime, timezone
 from bson import ObjectId
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
 
-from docling.document_converter import DocumentConverter
+import numpy as np
 
 from api.services.mongo import get_db
-from embeddings.chunker import chunk_text
-from embeddings.tender_embedder import TenderEmbedder
-from embeddings.vector_store import get_chroma_collection
+from api.services.progress import report_progress
+from docling_processor import get_converter
+from embeddings.bm25_index import extract_keywords
+from embeddings.chunker import iter_chunks
+from embeddings.match_matrix import score_profile
+from embeddings.packed_vectors import pack_profile_vectors
+from embeddings.partitions import get_tender_index
+from embeddings.profile_state import CONTRIBUTION_FIELD, KEYWORDS_PER_DOCUMENT, STATE_FIELD, Contribution, ProfileState
+from embeddings.tender_embedder import get_embedder
+from embeddings.vector_store import get_vector_store
+from storage.doc_cost import COST_FIELD, index_cost, record_cost
+from utils.metrics import CHUNK_SECONDS, DOCLING_SECONDS_PER_PAGE, span
 
 # ✅ Reuse your existing chunk size & batch size patterns
 CHUNK_SIZE = 500
+CHUNK_TOKENS = 128  # token budget per chunk (clamped to the model limit)
 BATCH_SIZE = 64
+PROFILE_COLLECTION = "profile_embeddings"
+STATE_UPDATE_RETRIES = 5
+# Rescore profile_matches for a profile once it is READY or its embedding changed
+MATCH_ON_READY = os.getenv("MATCH_ON_READY", "1") == "1"
 
-def process_profile_job(job_id: str) -> None:
+logger = logging.getLogger(__name__)
+
+class JobCancelled(RuntimeError):
+    """The worker lost the job's lease; another worker owns it now."""
+
+def process_profile_job(job_id: str, cancelled: Optional[threading.Event] = None) -> None:
+    """
+    Run one ingest job. `cancelled` is set by the lease heartbeat when the
+    lease is lost; the job then stops between documents (JobCancelled).
+    """
+    with span("profile_job", job_id=job_id) as traced:
+        _run_profile_job(job_id, traced, cancelled)
+
+def _check_cancelled(job_id: str, cancelled: Optional[threading.Event]) -> None:
+    if cancelled is not None and cancelled.is_set():
+        raise JobCancelled(f"job {job_id} was taken over by another worker")
+
+def _run_profile_job(job_id: str, traced, cancelled: Optional[threading.Event] = None) -> None:
     db = get_db()
     jobs = db["jobs"]
     profiles = db["company_profiles"]
@@ -29,25 +64,46 @@ def process_profile_job(job_id: str) -> None:
         return
 
     profile_id = job["profile_id"]
-    now = datetime.now(timezone.utc)
+    traced.set(profile_id=str(profile_id))
+
+    # Progress writes only land while this claim still holds the lease
+    owner = job.get("lease_owner")
 
     # Mark job running
-    jobs.update_one(
-        {"_id": ObjectId(job_id)},
-        {"$set": {"status": "running", "step": "docling", "progress": 5, "updated_at": now}},
-    )
+    report_progress(job_id, profile_id, lease_owner=owner, status="running", step="docling", progress=5)
 
-    converter = DocumentConverter()
+    converter = get_converter()
 
     # 1) Docling pending company documents
-    pending_docs = list(company_docs.find({"profile_id": profile_id, "docling_status": "pending"}))
+    # Cheapest first, so most of the profile is usable before a huge scan finishes
+    pending_docs = list(
+        company_docs.find({"profile_id": profile_id, "docling_status": "pending"}).sort(f"{COST_FIELD}.predicted_s", 1)
+    )
 
     for i, doc in enumerate(pending_docs):
+        _check_cancelled(job_id, cancelled)
         doc_id = doc["_id"]
         pdf_path = doc["local_path"]
 
         try:
-            result = converter.convert(pdf_path)
+            with span("docling", document_id=doc_id, doc_type="profile") as convert_span:
+                start = time.perf_counter()
+                result = converter.convert(pdf_path)
+                pages = len(getattr(result, "pages", None) or [])
+                convert_span.set(pages=pages)
+            seconds = time.perf_counter() - start
+            DOCLING_SECONDS_PER_PAGE.labels("profile").observe(seconds / max(pages, 1))
+            cost = doc.get(COST_FIELD) or {}
+            record_cost(
+                db, doc_id, "docling", seconds,
+                collection=company_docs.name,
+                doc_type="profile",
+                pages=pages or cost.get("pages"),
+                size_bytes=cost.get("size_bytes"),
+                has_text_layer=cost.get("has_text_layer"),
+                predicted_docling_s=cost.get("predicted_s"),
+            )
+            text = result.document.export_to_text()
 
             # Save docling output (reuse same collection, but tag doc_type=profile)
             docling_outputs.update_one(
@@ -57,7 +113,8 @@ def process_profile_job(job_id: str) -> None:
                         "doc_type": "profile",                 # ✅ important
                         "profile_id": profile_id,              # ✅ important
                         "document_id": doc_id,
-                        "text": result.document.export_to_text(),
+                        "text": text,
+                        "index_cost": index_cost(len(text)),
                         "tables": [],
                         "sections": None,
                         "extracted_at": datetime.utcnow(),
@@ -69,55 +126,57 @@ def process_profile_job(job_id: str) -> None:
 
             company_docs.update_one(
                 {"_id": doc_id},
-                {"$set": {"docling_status": "done", "updated_at": datetime.now(timezone.utc)}},
+                {"$set": {"docling_status": "done", "updated_at": datetime.now(timezone.utc)}, "$unset": {"docling_error": ""}},
             )
         except Exception as e:
+            # Stays pending so a retry converts it again; the job queue
+            # (jobs._fail_or_retry) decides between retry and FAILED
             company_docs.update_one(
                 {"_id": doc_id},
-                {"$set": {"docling_status": "failed", "updated_at": datetime.now(timezone.utc)}},
-            )
-            jobs.update_one(
-                {"_id": ObjectId(job_id)},
-                {"$set": {"status": "failed", "step": "docling", "error": str(e), "updated_at": datetime.now(timezone.utc)}},
+                {"$set": {"docling_error": str(e), "updated_at": datetime.now(timezone.utc)}},
             )
-            profiles.update_one(
-                {"_id": profile_id},
-                {"$set": {"status": "FAILED", "updated_at": datetime.now(timezone.utc)}},
-            )
-            return
+            raise
 
-        # progress update (docling)
-        pct = 5 + int(((i + 1) / max(1, len(pending_docs))) * 45)
-        jobs.update_one(
-            {"_id": ObjectId(job_id)},
-            {"$set": {"progress": pct, "updated_at": datetime.now(timezone.utc)}},
-        )
+        # progress update (docling; coalesced)
+        report_progress(job_id, profile_id, lease_owner=owner, progress=5 + int(((i + 1) / max(1, len(pending_docs))) * 45))
 
-    # 2) Embed profile docling outputs into profile_embeddings
-    jobs.update_one(
-        {"_id": ObjectId(job_id)},
-        {"$set": {"step": "embedding", "progress": 55, "updated_at": datetime.now(timezone.utc)}},
-    )
-
-    profile_collection = get_chroma_collection(name="profile_embeddings")
-    embedder = TenderEmbedder()
+    # 2) Embed only documents not yet folded into the profile state
+    report_progress(job_id, profile_id, lease_owner=owner, step="embedding", progress=55)
 
-    outputs = list(docling_outputs.find({"doc_type": "profile", "profile_id": profile_id}))
+    profile_collection = get_vector_store(name=PROFILE_COLLECTION)
+    embedder = get_embedder()
 
-    all_vectors: List[List[float]] = []
-    total_chunks = 0
+    new_doc_ids = [
+        d["_id"]
+        for d in company_docs.find(
+            {"profile_id": profile_id, "docling_status": "done", "embedding_status": {"$ne": "indexed"}},
+            {"_id": 1},
+        )
+    ]
+    outputs = list(docling_outputs.find(
+        {"doc_type": "profile", "profile_id": profile_id, "document_id": {"$in": new_doc_ids}}
+    ))
 
-    for out in outputs:
-        document_id = str(out["document_id"])
+    for n_done, out in enumerate(outputs, start=1):
+        _check_cancelled(job_id, cancelled)
+        doc_oid = out["document_id"]
+        document_id = str(doc_oid)
         text = out.get("text") or ""
-        if not text.strip():
-            continue
+        start = time.perf_counter()
+        chunks = [
+            c.text
+            for c in iter_chunks(
+                text,
+                max_len=min(CHUNK_TOKENS, embedder.max_tokens),
+                length_fn=embedder.count_tokens,
+            )
+        ] if text.strip() else []
+        CHUNK_SECONDS.labels("profile").observe(time.perf_counter() - start)
 
-        chunks = chunk_text(text, max_chars=CHUNK_SIZE)
-        if not chunks:
-            continue
+        # A re-run replaces whatever an interrupted attempt left behind
+        profile_collection.delete(where=_vector_where(profile_id, doc_oid))
 
-        # batch embed
+        doc_vectors: List[List[float]] = []
         for b_start in range(0, len(chunks), BATCH_SIZE):
             batch = chunks[b_start:b_start + BATCH_SIZE]
             vectors = embedder.embed(batch)
@@ -136,33 +195,176 @@ def process_profile_job(job_id: str) -> None:
                 embeddings=vectors,
                 metadatas=metadatas
             )
+            doc_vectors.extend(vectors)
+        record_cost(db, doc_oid, "embed", time.perf_counter() - start, chunk_count=len(doc_vectors), text_chars=len(text))
 
-            all_vectors.extend(vectors)
-            total_chunks += len(batch)
+        doc_set = {"embedding_status": "indexed", "chunk_count": len(doc_vectors), "updated_at": datetime.now(timezone.utc)}
+        if doc_vectors:
+            keywords = extract_keywords([text], top_n=KEYWORDS_PER_DOCUMENT)
+            applied = []
 
-        # embedding progress (rough)
-        jobs.update_one(
-            {"_id": ObjectId(job_id)},
-            {"$set": {"progress": min(95, 55 + int((total_chunks / max(1, total_chunks)) * 40)), "updated_at": datetime.now(timezone.utc)}},
-        )
+            def add_document(state: ProfileState) -> None:
+                contrib = state.contribution(doc_vectors, keywords)
+                state.add(document_id, contrib)
+                applied[:] = [contrib]
+
+            _update_profile_state(profiles, profile_id, embedder.dim, add_document)
+            doc_set[CONTRIBUTION_FIELD] = applied[0].to_doc()
+        company_docs.update_one({"_id": doc_oid}, {"$set": doc_set})
+
+        # embedding progress (per document; coalesced)
+        report_progress(job_id, profile_id, lease_owner=owner, progress=min(95, 55 + int(n_done / len(outputs) * 40)))
 
-    # 3) Compute a single "profile embedding" for fast tender search (mean vector)
-    profile_embedding = None
-    if all_vectors:
-        dim = len(all_vectors[0])
-        mean = [0.0] * dim
-        for v in all_vectors:
-            for k in range(dim):
-                mean[k] += float(v[k])
-        mean = [x / len(all_vectors) for x in mean]
-        profile_embedding = mean
+    # 3) Multi-vector mode: re-cluster only when the profile outgrew its centroids
+    _recluster_if_needed(db, profile_collection, profile_id, embedder.dim)
 
+    _check_cancelled(job_id, cancelled)
     profiles.update_one(
         {"_id": profile_id},
-        {"$set": {"status": "READY", "profile_embedding": profile_embedding, "updated_at": datetime.now(timezone.utc)}},
+        {"$set": {"status": "READY", "updated_at": datetime.now(timezone.utc)}},
     )
+    _rescore_matches(db, profile_id)
 
-    jobs.update_one(
-        {"_id": ObjectId(job_id)},
-        {"$set": {"status": "done", "step": "ready", "progress": 100, "updated_at": datetime.now(timezone.utc)}},
-    )
+    report_progress(job_id, profile_id, lease_owner=owner, status="done", step="ready", progress=100)
+
+
+def _rescore_matches(db, profile_id: ObjectId) -> None:
+    """Replace the profile's precomputed matches; search falls back to live queries if this fails."""
+    if not MATCH_ON_READY:
+        return
+    try:
+        score_profile(db, profile_id, get_tender_index(db))
+    except Exception:
+        logger.exception("Failed to score profile %s against tenders", profile_id)
+
+
+def _vector_where(profile_id: ObjectId, document_id: ObjectId) -> dict:
+    return {"$and": [{"profile_id": str(profile_id)}, {"document_id": str(document_id)}]}
+
+
+def _published_fields(state: ProfileState) -> dict:
+    """What search reads, derived from the running state."""
+    centroids, centroid_sizes = state.centroids()
+    return {
+        # packed BinData + profile_vector_format (embeddings/packed_vectors.py)
+        **pack_profile_vectors(state.embedding(), centroids),
+        "profile_centroid_sizes": centroid_sizes,
+        # Lexical query for hybrid (BM25) search
+        "profile_keywords": state.keywords(),
+        "profile_chunk_count": state.count,
+    }
+
+
+def _update_profile_state(profiles, profile_id: ObjectId, dim: int, mutate: Callable[[ProfileState], Any]) -> Optional[ProfileState]:
+    """
+    Read-modify-write of profile_state, guarded by its rev so concurrent
+    jobs/deletes cannot lose each other's contributions (`mutate` may run
+    more than once). The published vectors are rewritten in the same update.
+    """
+    for _ in range(STATE_UPDATE_RETRIES):
+        profile = profiles.find_one({"_id": profile_id}, {STATE_FIELD: 1})
+        if profile is None:
+            return None
+        state = ProfileState.from_profile(profile, dim)
+        mutate(state)
+        guard = {f"{STATE_FIELD}.rev": state.rev} if profile.get(STATE_FIELD) else {STATE_FIELD: None}
+        res = profiles.update_one(
+            {"_id": profile_id, **guard},
+            {
+                "$set": {STATE_FIELD: state.to_doc(), **_published_fields(state), "updated_at": datetime.now(timezone.utc)},
+                "$inc": {"profile_embedding_version": 1},
+            },
+        )
+        if res.matched_count:
+            state.rev += 1
+            return state
+    raise RuntimeError(f"Profile {profile_id}: profile_state kept changing, gave up after {STATE_UPDATE_RETRIES} tries")
+
+
+def _vectors_by_document(profile_collection, profile_id: ObjectId) -> Dict[str, np.ndarray]:
+    res = profile_collection.get(where={"profile_id": str(profile_id)}, include=["embeddings", "metadatas"])
+    embeddings = res.get("embeddings")
+    grouped: Dict[str, List[Any]] = {}
+    for emb, meta in zip(embeddings if embeddings is not None else [], res.get("metadatas") or []):
+        grouped.setdefault(str((meta or {}).get("document_id")), []).append(emb)
+    return {doc_id: np.asarray(rows, dtype=np.float32) for doc_id, rows in grouped.items()}
+
+
+def _recluster_if_needed(db, profile_collection, profile_id: ObjectId, dim: int) -> None:
+    """
+    k-means over the profile's stored chunk vectors (no re-embedding), then
+    re-tag every document's centroid contribution with the new epoch.
+    """
+    profiles = db["company_profiles"]
+    profile = profiles.find_one({"_id": profile_id}, {STATE_FIELD: 1})
+    if profile is None or not ProfileState.from_profile(profile, dim).needs_recluster():
+        return
+
+    vectors = _vectors_by_document(profile_collection, profile_id)
+    updates: Dict[str, Dict[str, Any]] = {}
+
+    def recluster(state: ProfileState) -> None:
+        updates.clear()
+        updates.update(state.recluster(vectors))
+
+    if _update_profile_state(profiles, profile_id, dim, recluster) is None:
+        return
+    company_docs = db["company_documents"]
+    for document_id, fields in updates.items():
+        company_docs.update_one(
+            {"_id": ObjectId(document_id), CONTRIBUTION_FIELD: {"$ne": None}},
+            {"$set": {f"{CONTRIBUTION_FIELD}.{k}": v for k, v in fields.items()}},
+        )
+
+
+def remove_profile_document(profile_id: ObjectId, document_id: ObjectId) -> Optional[bool]:
+    """
+    Delete one company document: its chunk vectors, docling output and file,
+    and subtract its contribution from the profile. Returns None if the
+    document does not exist, otherwise whether the profile needs a full
+    re-index (documents from before profile_state, which have no
+    contribution to subtract).
+    """
+    db = get_db()
+    profiles = db["company_profiles"]
+    company_docs = db["company_documents"]
+
+    doc = company_docs.find_one({"_id": document_id, "profile_id": profile_id})
+    if not doc:
+        return None
+
+    profile_collection = get_vector_store(name=PROFILE_COLLECTION)
+    profile_collection.delete(where=_vector_where(profile_id, document_id))
+
+    needs_reindex = False
+    if doc.get(CONTRIBUTION_FIELD):
+        contrib = Contribution.from_doc(doc[CONTRIBUTION_FIELD])
+        state = _update_profile_state(
+            profiles, profile_id, contrib.dim, lambda st: st.subtract(str(document_id), contrib)
+        )
+        if state is not None:
+            _recluster_if_needed(db, profile_collection, profile_id, contrib.dim)
+    elif doc.get("docling_status") == "done":
+        profile = profiles.find_one({"_id": profile_id}, {STATE_FIELD: 1, "profile_embedding": 1})
+        if profile and not profile.get(STATE_FIELD) and profile.get("profile_embedding") is not None:
+            # Folded into a pre-profile_state embedding: rebuild from the rest
+            needs_reindex = True
+            company_docs.update_many({"profile_id": profile_id}, {"$unset": {"embedding_status": ""}})
+
+    db["docling_outputs"].delete_many({"document_id": document_id, "doc_type": "profile"})
+    company_docs.delete_one({"_id": document_id})
+    if doc.get("local_path"):
+        try:
+            os.remove(doc["local_path"])
+        except OSError:
+            pass
+
+    if not company_docs.count_documents({"profile_id": profile_id}, limit=1):
+        profiles.update_one(
+            {"_id": profile_id},
+            {"$set": {"status": "UPLOADING", **pack_profile_vectors(None), "updated_at": datetime.now(timezone.utc)}},
+        )
+    if not needs_reindex:
+        # The embedding changed (or is gone): its stored matches are stale
+        _rescore_matches(db, profile_id)
+    return needs_reindex
@@ -0,0 +1,325 @@
+# api/services/progress.py
+#
+# Job progress fan-out. Workers call report_progress(); every update is
+# published at once to in-process subscribers (the SSE endpoint), while the
+# Mongo write is coalesced: status/step changes and terminal states are
+# written immediately, plain progress ticks at most every
+# JOB_PROGRESS_WRITE_SECONDS (the job heartbeat flushes whatever is left).
+#
+# Subscribers on an API process without local workers follow the job
+# through a Mongo change stream instead (see job_events).
+#
+# The in-memory snapshot is only kept while a local worker holds the job's
+# lease (hold_job .. release_job); once the job is requeued, released or
+# taken over, the job document is the only source of truth. Writes carry
+# the reporting worker's lease_owner, so a worker that lost the lease
+# cannot overwrite the new owner's progress.
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from api.services.mongo import get_async_db, get_db
+
+JOB_PROGRESS_WRITE_SECONDS = float(os.getenv("JOB_PROGRESS_WRITE_SECONDS", "2"))
+# local | changestream | auto (= local when this process runs job workers)
+JOB_EVENTS_SOURCE = os.getenv("JOB_EVENTS_SOURCE", "auto")
+# SSE keep-alive; on a quiet stream this is also when the job is re-read
+JOB_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+TERMINAL_STATUSES = ("done", "failed")
+SNAPSHOT_FIELDS = ("status", "step", "progress", "error", "attempts")
+
+logger = logging.getLogger(__name__)
+
+
+def job_snapshot(job: dict) -> Dict[str, Any]:
+    """Client-facing view of a job document (also the SSE payload)."""
+    return {
+        "job_id": str(job["_id"]),
+        "profile_id": str(job["profile_id"]) if job.get("profile_id") else None,
+        "status": job.get("status"),
+        "step": job.get("step"),
+        "progress": job.get("progress", 0),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+    }
+
+
+class ProgressBroker:
+    """
+    Latest snapshot per job plus asyncio subscribers. publish() is called
+    from worker threads and hands events to each subscriber's loop. Only
+    jobs held by a local worker keep a latest snapshot.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._held: set = set()
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def latest(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            snap = self._latest.get(job_id)
+            return dict(snap) if snap else None
+
+    def publish(self, snapshot: Dict[str, Any]) -> None:
+        job_id = snapshot["job_id"]
+        with self._lock:
+            if job_id not in self._held or snapshot.get("status") in TERMINAL_STATUSES:
+                self._latest.pop(job_id, None)
+            else:
+                self._latest[job_id] = dict(snapshot)
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, dict(snapshot))
+            except RuntimeError:
+                pass  # loop closed; the subscriber is going away
+
+    def hold(self, job_id: str) -> None:
+        with self._lock:
+            self._held.add(job_id)
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._held.discard(job_id)
+            self._latest.pop(job_id, None)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subs = [s for s in self._subscribers.get(job_id, ()) if s[1] is not queue]
+            if subs:
+                self._subscribers[job_id] = subs
+            else:
+                self._subscribers.pop(job_id, None)
+
+
+broker = ProgressBroker()
+
+
+class _ProgressWriter:
+    """Coalesces job progress writes: per job, the last written state and time."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict[str, Any]] = {}
+
+    def report(
+        self, job_id: str, profile_id: Any, fields: Dict[str, Any], force: bool = False, lease_owner: Optional[str] = None
+    ) -> None:
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(job_id, {"snapshot": {"job_id": job_id}, "written": {}, "written_at": 0.0})
+            if lease_owner is not None:
+                state["lease_owner"] = lease_owner
+            owner = state.get("lease_owner")
+            snap = state["snapshot"]
+            if profile_id is not None:
+                snap["profile_id"] = str(profile_id)
+            snap.update(fields)
+            written = state["written"]
+            terminal = snap.get("status") in TERMINAL_STATUSES
+            changed = any(snap.get(k) != written.get(k) for k in ("status", "step", "error"))
+            due = force or terminal or changed or now - state["written_at"] >= JOB_PROGRESS_WRITE_SECONDS
+            pending = {k: snap[k] for k in SNAPSHOT_FIELDS if k in snap and snap[k] != written.get(k)}
+            if due and pending:
+                state["written"] = {**written, **pending}
+                state["written_at"] = now
+            if terminal:
+                self._state.pop(job_id, None)
+            published = dict(snap)
+
+        broker.publish(published)
+        if due and pending:
+            self._write(job_id, pending, owner)
+
+    def written(self, job_id: str, profile_id: Any, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            state = self._state.setdefault(job_id, {"snapshot": {"job_id": job_id}, "written": {}, "written_at": 0.0})
+            if profile_id is not None:
+                state["snapshot"]["profile_id"] = str(profile_id)
+            state["snapshot"].update(fields)
+            state["written"].update(fields)
+            state["written_at"] = time.monotonic()
+            published = dict(state["snapshot"])
+            if published.get("status") in TERMINAL_STATUSES:
+                self._state.pop(job_id, None)
+        broker.publish(published)
+
+    def forget(self, job_id: str) -> None:
+        with self._lock:
+            self._state.pop(job_id, None)
+
+    def flush(self, job_id: str) -> None:
+        with self._lock:
+            state = self._state.get(job_id)
+            if not state:
+                return
+            snap, written = state["snapshot"], state["written"]
+            pending = {k: snap[k] for k in SNAPSHOT_FIELDS if k in snap and snap[k] != written.get(k)}
+            if not pending:
+                return
+            state["written"] = {**written, **pending}
+            state["written_at"] = time.monotonic()
+            owner = state.get("lease_owner")
+        self._write(job_id, pending, owner)
+
+    @staticmethod
+    def _write(job_id: str, fields: Dict[str, Any], lease_owner: Optional[str] = None) -> None:
+        query: Dict[str, Any] = {"_id": ObjectId(job_id)}
+        if lease_owner is not None:
+            query["lease_owner"] = lease_owner
+        get_db()["jobs"].update_one(
+            query,
+            {"$set": {**fields, "updated_at": datetime.now(timezone.utc)}},
+        )
+
+
+_writer = _ProgressWriter()
+
+
+def report_progress(
+    job_id: str, profile_id: Any = None, force: bool = False, lease_owner: Optional[str] = None, **fields: Any
+) -> None:
+    """
+    Record a job's status/step/progress/error: published to local
+    subscribers now, written to Mongo now or coalesced (see module doc).
+    With `lease_owner`, writes only apply while that worker holds the job.
+    """
+    _writer.report(str(job_id), profile_id, fields, force=force, lease_owner=lease_owner)
+
+
+def publish_progress(job_id: str, profile_id: Any = None, **fields: Any) -> None:
+    """Publish state the caller has already written to the job document."""
+    _writer.written(str(job_id), profile_id, fields)
+
+
+def flush_progress(job_id: str) -> None:
+    """Write out a coalesced progress tick, if any (called from the heartbeat)."""
+    _writer.flush(str(job_id))
+
+
+def hold_job(job_id: Any) -> None:
+    """A local worker has claimed the job: serve its snapshot from memory."""
+    broker.hold(str(job_id))
+
+
+def release_job(job_id: Any) -> None:
+    """
+    The job left this process (finished, requeued, released or lease lost):
+    drop its in-memory snapshot and coalescing state.
+    """
+    broker.release(str(job_id))
+    _writer.forget(str(job_id))
+
+
+def _use_change_stream() -> bool:
+    if JOB_EVENTS_SOURCE == "changestream":
+        return True
+    if JOB_EVENTS_SOURCE == "local":
+        return False
+    from api.services.jobs import JOB_WORKERS
+
+    return JOB_WORKERS <= 0
+
+
+async def _watch_job(job_oid: ObjectId, queue: asyncio.Queue, opened: asyncio.Event) -> None:
+    """Push a snapshot per change of the job; `opened` is set once the stream is live (or has failed)."""
+    db = get_async_db()
+    pipeline = [{"$match": {"documentKey._id": job_oid, "operationType": {"$in": ["update", "replace"]}}}]
+    try:
+        async with await db["jobs"].watch(pipeline, full_document="updateLookup") as stream:
+            opened.set()
+            async for change in stream:
+                doc = change.get("fullDocument")
+                if doc:
+                    queue.put_nowait(job_snapshot(doc))
+    except PyMongoError as exc:
+        # Standalone servers have no change streams: fall back to keep-alive re-reads
+        logger.warning("Job change stream unavailable (%s); falling back to periodic reads", exc)
+        queue.put_nowait(None)
+    finally:
+        opened.set()
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def job_events(job: dict) -> AsyncIterator[str]:
+    """
+    SSE stream for one job: the current state, then every change until the
+    job is done or failed. `job` is the document read when the client
+    connected; it is read again once the subscription and change stream
+    are open, so an update landing in between is not lost. Quiet streams
+    re-read the job on every keep-alive in either mode.
+    """
+    job_id = str(job["_id"])
+    current = job_snapshot(job)
+    if current["status"] in TERMINAL_STATUSES:
+        yield _sse("progress", current)
+        yield _sse("end", current)
+        return
+
+    queue = broker.subscribe(job_id)
+    watcher = None
+    try:
+        if _use_change_stream():
+            opened = asyncio.Event()
+            watcher = asyncio.create_task(_watch_job(job["_id"], queue, opened))
+            await opened.wait()
+
+        doc = await get_async_db()["jobs"].find_one({"_id": job["_id"]})
+        if doc:
+            current = job_snapshot(doc)
+        # A local worker's coalesced ticks may be ahead of the job document
+        # (latest() is None unless this process holds the job's lease)
+        current = {**current, **(broker.latest(job_id) or {})}
+        yield _sse("progress", current)
+        if current["status"] in TERMINAL_STATUSES:
+            yield _sse("end", current)
+            return
+
+        while True:
+            try:
+                snap = await asyncio.wait_for(queue.get(), JOB_EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Quiet stream: the job may be running on another node, or
+                # the change stream may have missed it
+                doc = await get_async_db()["jobs"].find_one({"_id": job["_id"]})
+                snap = job_snapshot(doc) if doc else None
+                if snap is None or {**current, **snap} == current:
+                    yield ": keep-alive\n\n"
+                    continue
+            if snap is None:  # change stream gave up; keep-alive re-reads carry on
+                continue
+            merged = {**current, **snap}
+            if merged == current:
+                continue
+            current = merged
+            yield _sse("progress", current)
+            if current["status"] in TERMINAL_STATUSES:
+                yield _sse("end", current)
+                return
+    finally:
+        broker.unsubscribe(job_id, queue)
+        if watcher is not None:
+            watcher.cancel()
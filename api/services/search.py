@@ -2,13 +2,51 @@
 
 from __future__ import annotations
 
+import math
+import os
+import time
 from bson import ObjectId
-from typing import Any, Dict, List
 from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from api.services.mongo import get_async_db, get_db
+from embeddings.bm25_index import get_bm25_index
+from embeddings.match_matrix import MATCHES_COLLECTION
+from embeddings.packed_vectors import unpack_centroids, unpack_embedding
+from embeddings.partitions import TENDER_PARTITIONING, get_tender_index
+from embeddings.vector_store import get_vector_store
+
+SNIPPET_CHARS = 350
+
+# Tender-level retrieval: chunks are over-fetched and grouped by tender_id
+POOLING_FUNCTIONS = ("max", "mean_top_m")
+SEARCH_POOLING = os.getenv("SEARCH_POOLING", "max")
+SEARCH_POOL_M = int(os.getenv("SEARCH_POOL_M", "3"))
+SEARCH_OVERFETCH = float(os.getenv("SEARCH_OVERFETCH", "4"))        # initial chunks per wanted tender
+SEARCH_MAX_CHUNKS = int(os.getenv("SEARCH_MAX_CHUNKS", "2000"))     # widening budget
+SEARCH_TIME_BUDGET_MS = float(os.getenv("SEARCH_TIME_BUDGET_MS", "300"))
+
+# Multi-vector mode: query with the profile's k-means centroids
+SEARCH_MULTI_VECTOR = os.getenv("SEARCH_MULTI_VECTOR", "0") == "1"
+SEARCH_MAX_CENTROIDS = int(os.getenv("SEARCH_MAX_CENTROIDS", "4"))
+
+# Hybrid mode: BM25 over the profile's keywords, fused with the vector ranking.
+# Off by default; `score` stays the cosine similarity either way and the
+# fused value is returned separately as `rrf_score`.
+SEARCH_HYBRID = os.getenv("SEARCH_HYBRID", "0") == "1"
+SEARCH_LEXICAL_CANDIDATES = int(os.getenv("SEARCH_LEXICAL_CANDIDATES", "200"))
+SEARCH_RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+
+# Filters pushed down into Chroma `where` and the profile_matches query
+TENDER_STATUSES = ("open", "closed")
+_KEYWORD_FILTERS = ("source", "document_type")
+_RANGE_FILTERS = {
+    "published_after": ("published_ts", "$gte"),
+    "published_before": ("published_ts", "$lte"),
+    "closing_after": ("closing_ts", "$gte"),
+    "closing_before": ("closing_ts", "$lte"),
+}
 
-from api.services.mongo import get_db
-from embeddings.vector_store import get_chroma_collection
-from embeddings.tender_embedder import TenderEmbedder
 
 def _similarity_from_distance(distance: float) -> float:
     # For cosine distance in Chroma: similarity ≈ 1 - distance
@@ -17,74 +55,484 @@ def _similarity_from_distance(distance: float) -> float:
     except Exception:
         return 0.0
 
-def search_tenders_for_profile(profile_id: str, top_k: int = 5) -> List[Dict[str, Any]]:
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(float(x) * float(y) for x, y in zip(a, b))
+    norm = math.sqrt(sum(float(x) * float(x) for x in a)) * math.sqrt(sum(float(y) * float(y) for y in b))
+    return max(0.0, dot / norm) if norm else 0.0
+
+
+def _to_oid(value: Any) -> Optional[ObjectId]:
+    try:
+        return ObjectId(value) if value else None
+    except Exception:
+        return None
+
+
+def _epoch(value: Any) -> int:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+def normalize_filters(
+    source: Any = None,
+    document_type: Any = None,
+    published_after: Any = None,
+    published_before: Any = None,
+    closing_after: Any = None,
+    closing_before: Any = None,
+    status: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Canonical filter spec: {field: [values]} for keyword filters and
+    {field: {op: epoch}} for the date fields the indexer stores as
+    published_ts / closing_ts. `status` is shorthand for a closing_ts bound
+    relative to now. Empty dict means "no filter".
+    """
+    raw = {
+        "source": source,
+        "document_type": document_type,
+        "published_after": published_after,
+        "published_before": published_before,
+        "closing_after": closing_after,
+        "closing_before": closing_before,
+    }
+    spec: Dict[str, Any] = {}
+    for name in _KEYWORD_FILTERS:
+        value = raw[name]
+        values = [value] if isinstance(value, str) else [v for v in (value or []) if v]
+        if values:
+            spec[name] = sorted(set(values))
+    for name, (field, op) in _RANGE_FILTERS.items():
+        if raw[name] is not None:
+            spec.setdefault(field, {})[op] = _epoch(raw[name])
+
+    if status:
+        if status not in TENDER_STATUSES:
+            raise ValueError(f"Unknown status {status!r}; expected one of {TENDER_STATUSES}")
+        now = int(datetime.now(timezone.utc).timestamp())
+        bounds = spec.setdefault("closing_ts", {})
+        if status == "open":
+            bounds["$gte"] = max(bounds.get("$gte", now), now)
+        else:
+            bounds["$lt"] = now
+    return spec
+
+
+def _chroma_where(spec: Dict[str, Any]) -> Optional[dict]:
+    """Chroma allows one operator per field clause, so ranges become $and terms."""
+    clauses = []
+    for field, cond in spec.items():
+        if isinstance(cond, dict):
+            clauses.extend({field: {op: value}} for op, value in sorted(cond.items()))
+        elif len(cond) == 1:
+            clauses.append({field: cond[0]})
+        else:
+            clauses.append({field: {"$in": list(cond)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _mongo_filter(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Same spec as a Mongo query on profile_matches rows."""
+    query: Dict[str, Any] = {}
+    for field, cond in spec.items():
+        query[field] = dict(cond) if isinstance(cond, dict) else {"$in": list(cond)}
+    return query
+
+
+def _pool(sims: List[float], pooling: str, pool_m: int) -> float:
+    if pooling == "mean_top_m":
+        top = sorted(sims, reverse=True)[: max(1, pool_m)]
+        return sum(top) / len(top)
+    return max(sims)
+
+
+def _tender_key(meta: dict, chunk_id: str) -> str:
+    return meta.get("tender_id") or f"doc:{meta.get('document_id') or chunk_id}"
+
+
+def _group_by_tender(res: dict) -> Dict[str, dict]:
+    """
+    Group a (multi-)query Chroma result by tender. A chunk returned for
+    several query vectors counts once, with its best similarity.
+    """
+    best_per_chunk: Dict[str, tuple] = {}
+    rows = zip(
+        res.get("ids") or [],
+        res.get("documents") or [],
+        res.get("metadatas") or [],
+        res.get("distances") or [],
+    )
+    for ids, documents, metadatas, distances in rows:
+        for chunk_id, doc_text, meta, dist in zip(ids, documents, metadatas, distances):
+            sim = _similarity_from_distance(dist)
+            prev = best_per_chunk.get(chunk_id)
+            if prev is None or sim > prev[0]:
+                best_per_chunk[chunk_id] = (sim, doc_text, meta or {})
+
+    groups: Dict[str, dict] = {}
+    for chunk_id, (sim, doc_text, meta) in best_per_chunk.items():
+        key = _tender_key(meta, chunk_id)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = {"key": key, "sims": [sim], "best": sim, "chunk_id": chunk_id, "document": doc_text, "metadata": meta}
+            continue
+        group["sims"].append(sim)
+        if sim > group["best"]:
+            group.update(best=sim, chunk_id=chunk_id, document=doc_text, metadata=meta)
+    return groups
+
+
+def _grouped_top_k(
+    collection,
+    query_embeddings: Sequence[Sequence[float]],
+    top_k: int,
+    pooling: str,
+    pool_m: int,
+    where: Optional[dict] = None,
+) -> List[dict]:
+    """
+    Tender-level ranking: over-fetch chunks, group by tender, and keep widening
+    (sized from the observed chunks-per-tender ratio) until top_k distinct
+    tenders are found or the chunk/time budget is spent. Several query
+    vectors (multi-vector profiles) go out as one batched query and are
+    fused per chunk by max similarity. `where` restricts the scan to
+    eligible chunks. Returns every tender seen, best first; callers
+    truncate (hybrid fusion looks past top_k).
+    """
+    total = collection.count()
+    if total <= 0 or top_k <= 0:
+        return []
+
+    deadline = time.monotonic() + SEARCH_TIME_BUDGET_MS / 1000.0
+    budget = max(top_k, min(SEARCH_MAX_CHUNKS, total))
+    n = min(budget, max(top_k, math.ceil(top_k * SEARCH_OVERFETCH)))
+
+    while True:
+        res = collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=n,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        groups = _group_by_tender(res)
+        # Fewer rows than asked for: the (filtered) collection is exhausted
+        exhausted = max((len(ids) for ids in res.get("ids") or []), default=0) < n
+        if len(groups) >= top_k or exhausted or n >= budget or time.monotonic() >= deadline:
+            break
+        chunks_per_tender = n / max(1, len(groups))
+        n = min(budget, max(n * 2, math.ceil(chunks_per_tender * top_k * 1.25)))
+
+    for group in groups.values():
+        group["score"] = _pool(group["sims"], pooling, pool_m)
+    return sorted(groups.values(), key=lambda g: g["score"], reverse=True)
+
+
+def _lexical_ranking(keywords: Sequence, limit: int) -> List[dict]:
+    """BM25 candidates grouped by tender (max chunk score), best first."""
+    try:
+        hits = get_bm25_index().search(keywords, top_n=limit)
+    except Exception:
+        return []
+
+    groups: Dict[str, dict] = {}
+    for chunk_id, meta, score in hits:
+        key = _tender_key(meta, chunk_id)
+        if key not in groups:
+            groups[key] = {"key": key, "score": score, "chunk_id": chunk_id, "metadata": meta}
+    return list(groups.values())
+
+
+def _eligible_chunks(collection, chunk_ids: List[str], where: Optional[dict]) -> set:
+    """
+    Subset of chunk_ids present in `collection` and matching `where` (BM25
+    segments carry no filter fields and span every partition).
+    """
+    try:
+        got = collection.get(ids=chunk_ids, where=where, include=[])
+    except Exception:
+        return set()
+    return set(got.get("ids") or [])
+
+
+def _rrf_fuse(vector_ranked: List[dict], lexical_ranked: List[dict], top_k: int) -> List[dict]:
+    """
+    Reciprocal-rank fusion: rrf = sum of 1 / (SEARCH_RRF_K + rank) over
+    both rankings. Ranks, not raw scores, so cosine and BM25 need no
+    calibration against each other. Hits are ordered by rrf; `score` keeps
+    the cosine similarity (None for lexical-only hits until their stored
+    vector is fetched).
+    """
+    fused: Dict[str, dict] = {}
+    for rank, hit in enumerate(vector_ranked, start=1):
+        fused[hit["key"]] = {**hit, "vector_score": hit["score"], "lexical_score": None,
+                             "rrf": 1.0 / (SEARCH_RRF_K + rank)}
+    for rank, hit in enumerate(lexical_ranked, start=1):
+        entry = fused.get(hit["key"])
+        if entry is None:
+            # Lexical-only: chunk text is filled in from Chroma later
+            entry = fused[hit["key"]] = {**hit, "score": None, "sims": [], "document": None,
+                                         "vector_score": None, "rrf": 0.0}
+        entry["lexical_score"] = hit["score"]
+        entry["rrf"] += 1.0 / (SEARCH_RRF_K + rank)
+
+    return sorted(fused.values(), key=lambda h: h["rrf"], reverse=True)[:top_k]
+
+
+def _fetch_chunks(collection, chunk_ids: List[str]) -> Dict[str, dict]:
+    """Stored vector, text and metadata of the winning chunks, by chunk id."""
+    if not chunk_ids:
+        return {}
+    try:
+        got = collection.get(ids=chunk_ids, include=["embeddings", "documents", "metadatas"])
+    except Exception:
+        return {}
+    ids = got.get("ids") or []
+    embeddings = got.get("embeddings")
+    if embeddings is None:
+        embeddings = [None] * len(ids)
+    documents = got.get("documents") or [None] * len(ids)
+    metadatas = got.get("metadatas") or [None] * len(ids)
+    return {
+        cid: {"embedding": emb, "document": doc, "metadata": meta or {}}
+        for cid, emb, doc, meta in zip(ids, embeddings, documents, metadatas)
+    }
+
+
+_TENDER_DOC_FIELDS = {"tender_id": 1, "pdf_url": 1, "local_path": 1}
+
+
+def _tender_docs_query(metadatas: Sequence[dict]) -> Tuple[Optional[dict], set, set]:
+    """
+    One $in round-trip for every result: match by tender_id, falling back
+    to _id == document_id. Returns (query or None, tender_oids, doc_oids).
+    """
+    tender_oids = {oid for oid in (_to_oid(m.get("tender_id")) for m in metadatas) if oid}
+    doc_oids = {oid for oid in (_to_oid(m.get("document_id")) for m in metadatas) if oid}
+
+    clauses = []
+    if tender_oids:
+        clauses.append({"tender_id": {"$in": list(tender_oids)}})
+    if doc_oids:
+        clauses.append({"_id": {"$in": list(doc_oids)}})
+    return ({"$or": clauses} if clauses else None), tender_oids, doc_oids
+
+
+def _index_tender_docs(records, tender_oids: set, doc_oids: set) -> Dict[str, dict]:
+    """{"tender:<id>" | "doc:<id>": record}"""
+    found: Dict[str, dict] = {}
+    for rec in records:
+        if rec.get("tender_id") in tender_oids:
+            found.setdefault(f"tender:{rec['tender_id']}", rec)
+        if rec["_id"] in doc_oids:
+            found[f"doc:{rec['_id']}"] = rec
+    return found
+
+
+def _lookup_tender_docs(tender_docs, metadatas: Sequence[dict]) -> Dict[str, dict]:
+    query, tender_oids, doc_oids = _tender_docs_query(metadatas)
+    if query is None:
+        return {}
+    return _index_tender_docs(tender_docs.find(query, _TENDER_DOC_FIELDS), tender_oids, doc_oids)
+
+
+async def _lookup_tender_docs_async(tender_docs, metadatas: Sequence[dict]) -> Dict[str, dict]:
+    query, tender_oids, doc_oids = _tender_docs_query(metadatas)
+    if query is None:
+        return {}
+    records = await tender_docs.find(query, _TENDER_DOC_FIELDS).to_list(None)
+    return _index_tender_docs(records, tender_oids, doc_oids)
+
+
+def _best_profile_snippets(profile_collection, profile_id: str, tender_vectors: Sequence[Any]) -> List[str]:
+    """
+    “Because…”: best matching chunk of *this* profile for every tender chunk,
+    in a single multi-query reusing the tender chunk vectors from Chroma.
+    Tenders whose vector could not be fetched get an empty snippet.
+    """
+    snippets = [""] * len(tender_vectors)
+    positions = [i for i, v in enumerate(tender_vectors) if v is not None]
+    if not positions:
+        return snippets
+    try:
+        pr = profile_collection.query(
+            query_embeddings=[tender_vectors[i] for i in positions],
+            n_results=1,
+            where={"profile_id": profile_id},
+            include=["documents"],
+        )
+    except Exception:
+        return snippets
+
+    for i, docs in zip(positions, pr.get("documents") or []):
+        snippets[i] = ((docs or [""])[0] or "")[:SNIPPET_CHARS]
+    return snippets
+
+
+def search_tenders_for_profile(
+    profile_id: str,
+    top_k: int = 5,
+    pooling: Optional[str] = None,
+    pool_m: Optional[int] = None,
+    multi_vector: Optional[bool] = None,
+    hybrid: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    `filters` is a normalize_filters() spec; it is applied inside the
+    vector scan, so top_k counts only eligible tenders.
+    """
+    pooling = pooling or SEARCH_POOLING
+    if pooling not in POOLING_FUNCTIONS:
+        raise ValueError(f"Unknown pooling {pooling!r}; expected one of {POOLING_FUNCTIONS}")
+    pool_m = pool_m or SEARCH_POOL_M
+    multi_vector = SEARCH_MULTI_VECTOR if multi_vector is None else multi_vector
+    hybrid = SEARCH_HYBRID if hybrid is None else hybrid
+    where = _chroma_where(filters or {})
+
     db = get_db()
     profiles = db["company_profiles"]
     tender_docs = db["tender_documents"]
 
-    profile = profiles.find_one({"_id": ObjectId(profile_id)})
-    if not profile or not profile.get("profile_embedding"):
+    profile = profiles.find_one(
+        {"_id": ObjectId(profile_id)},
+        {"profile_embedding": 1, "profile_centroids": 1, "profile_vector_format": 1, "profile_keywords": 1},
+    )
+    embedding = unpack_embedding(profile) if profile else None
+    if embedding is None:
         return []
 
-    query_embedding = profile["profile_embedding"]
+    query_embeddings = [embedding.tolist()]
+    centroids = unpack_centroids(profile) if multi_vector else None
+    if centroids is not None and len(centroids):
+        # Largest clusters first; the cap bounds query cost
+        query_embeddings = centroids[: max(1, SEARCH_MAX_CENTROIDS)].tolist()
 
-    tender_collection = get_chroma_collection(name="tender_embeddings")
-    profile_collection = get_chroma_collection(name="profile_embeddings")
-    embedder = TenderEmbedder()
+    # Only the partitions the filters can match (single collection when unpartitioned)
+    tender_collection = get_tender_index(db, filters)
+    profile_collection = get_vector_store(name="profile_embeddings")
 
-    # 1) Query tenders using profile embedding
-    res = tender_collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"],
-    )
+    # 1) Distinct tenders for the profile embedding (or its centroids)
+    hits = _grouped_top_k(tender_collection, query_embeddings, top_k, pooling, pool_m, where=where)
+
+    # 1b) Hybrid: fuse with BM25 candidates for the profile's keywords
+    lexical = []
+    if hybrid and profile.get("profile_keywords"):
+        lexical = _lexical_ranking(profile["profile_keywords"], SEARCH_LEXICAL_CANDIDATES)
+        if lexical and (where or TENDER_PARTITIONING):
+            eligible = _eligible_chunks(tender_collection, [h["chunk_id"] for h in lexical], where)
+            lexical = [h for h in lexical if h["chunk_id"] in eligible]
+    hits = _rrf_fuse(hits, lexical, top_k) if lexical else hits[:top_k]
 
-    documents = (res.get("documents") or [[]])[0]
-    metadatas = (res.get("metadatas") or [[]])[0]
-    distances = (res.get("distances") or [[]])[0]
+    # 2) Stored vector (and, for lexical-only hits, text and cosine) of each best chunk
+    chunks = _fetch_chunks(tender_collection, [h["chunk_id"] for h in hits])
+    tender_vectors = []
+    for hit in hits:
+        stored = chunks.get(hit["chunk_id"]) or {}
+        vector = stored.get("embedding")
+        if hit["document"] is None:
+            hit["document"] = stored.get("document")
+            hit["metadata"] = stored.get("metadata") or hit["metadata"]
+        if hit["score"] is None:
+            hit["score"] = max((_cosine(q, vector) for q in query_embeddings), default=0.0) if vector is not None else 0.0
+        tender_vectors.append(vector)
+    metadatas = [h["metadata"] for h in hits]
+
+    # 3) Pull tender PDF url/path for all results at once
+    tender_pdfs = _lookup_tender_docs(tender_docs, metadatas)
+
+    # 4) Batched “because” using each tender's best chunk vector
+    profile_snippets = _best_profile_snippets(profile_collection, profile_id, tender_vectors)
 
     results: List[Dict[str, Any]] = []
 
-    for doc_text, meta, dist in zip(documents, metadatas, distances):
+    for hit, meta, profile_snippet in zip(hits, metadatas, profile_snippets):
         tender_document_id = meta.get("document_id")  # your tender index stores this
         tender_id = meta.get("tender_id")
 
-        # Pull tender PDF url/path for user
-        tender_pdf = None
-        if tender_id:
-            tender_pdf = tender_docs.find_one({"tender_id": ObjectId(tender_id)})
-        if not tender_pdf and tender_document_id:
-            # fallback: some people store by _id/document_id
-            try:
-                tender_pdf = tender_docs.find_one({"_id": ObjectId(tender_document_id)})
-            except Exception:
-                tender_pdf = None
-
-        # 2) “Because…”: find best matching profile snippet for this tender snippet
-        tender_snippet = (doc_text or "")[:350]
-
-        profile_snippet = ""
-        try:
-            emb = embedder.embed(tender_snippet)[0]
-            pr = profile_collection.query(
-                query_embeddings=[emb],
-                n_results=1,
-                include=["documents", "metadatas", "distances"],
-            )
-            profile_snippet = ((pr.get("documents") or [[]])[0] or [""])[0]
-            profile_snippet = (profile_snippet or "")[:350]
-        except Exception:
-            profile_snippet = ""
+        tender_pdf = tender_pdfs.get(f"tender:{tender_id}") or tender_pdfs.get(f"doc:{tender_document_id}")
 
-        results.append({
+        result = {
             "tender_id": str(tender_id) if tender_id else None,
-            "score": round(_similarity_from_distance(dist), 4),
+            "score": round(hit["score"], 4),
+            "matched_chunks": len(hit["sims"]),
             "pdf_url": tender_pdf.get("pdf_url") if tender_pdf else None,
             "local_path": tender_pdf.get("local_path") if tender_pdf else None,
             "because": {
-                "tender_snippet": tender_snippet,
+                "tender_snippet": (hit["document"] or "")[:SNIPPET_CHARS],
                 "profile_snippet": profile_snippet,
             },
-        })
+        }
+        if "rrf" in hit:
+            result["rrf_score"] = round(hit["rrf"], 6)
+            result["vector_score"] = round(hit["vector_score"], 4) if hit["vector_score"] is not None else None
+            result["lexical_score"] = round(hit["lexical_score"], 4) if hit["lexical_score"] is not None else None
+        results.append(result)
 
     return results
+
+
+def _precomputed_query(
+    profile_id: str,
+    since: Optional[datetime],
+    filters: Optional[Dict[str, Any]],
+) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+    query: Dict[str, Any] = {**_mongo_filter(filters or {}), "profile_id": ObjectId(profile_id)}
+    sort = [("score", -1)]
+    if since is not None:
+        query["matched_at"] = {"$gt": since}
+        sort = [("matched_at", -1), ("score", -1)]
+    return query, sort
+
+
+def _precomputed_results(rows: List[dict], tender_pdfs: Dict[str, dict]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    for row in rows:
+        tender_id = row.get("tender_id")
+        tender_pdf = tender_pdfs.get(f"tender:{tender_id}") or tender_pdfs.get(f"doc:{row.get('document_id')}")
+        results.append({
+            "tender_id": str(tender_id) if tender_id else None,
+            "score": round(float(row.get("score", 0.0)), 4),
+            "matched_at": row.get("matched_at"),
+            "pdf_url": tender_pdf.get("pdf_url") if tender_pdf else None,
+            "local_path": tender_pdf.get("local_path") if tender_pdf else None,
+            "because": None,
+        })
+    return results
+
+
+def precomputed_matches_for_profile(
+    profile_id: str,
+    top_k: int = 5,
+    since: Optional[datetime] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Serve from the profile_matches table (embeddings/match_matrix.py).
+    With `since`, returns only tenders that started matching after it
+    (the "new matching tenders" feed), newest first. `filters` go into
+    the query; rows written before document_type was stored only match
+    document_type filters after a --rebuild.
+    """
+    db = get_db()
+    query, sort = _precomputed_query(profile_id, since, filters)
+    rows = list(db[MATCHES_COLLECTION].find(query).sort(sort).limit(top_k))
+    return _precomputed_results(rows, _lookup_tender_docs(db["tender_documents"], rows))
+
+
+async def precomputed_matches_for_profile_async(
+    profile_id: str,
+    top_k: int = 5,
+    since: Optional[datetime] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """precomputed_matches_for_profile on the async client, for the API."""
+    db = get_async_db()
+    query, sort = _precomputed_query(profile_id, since, filters)
+    rows = await db[MATCHES_COLLECTION].find(query).sort(sort).limit(top_k).to_list(None)
+    return _precomputed_results(rows, await _lookup_tender_docs_async(db["tender_documents"], rows))
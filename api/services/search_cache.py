@@ -0,0 +1,112 @@
+# api/services/search_cache.py
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from api.services.mongo import get_db
+from embeddings.index_state import get_generation
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+# How long a read of the tender-index generation is trusted before re-reading
+SEARCH_GENERATION_REFRESH = float(os.getenv("SEARCH_GENERATION_REFRESH", "1.0"))
+
+
+class SearchCache:
+    """
+    LRU + TTL cache of search results. Every entry is tagged with the
+    tender-index generation it was computed against; an entry from an older
+    generation is treated as a miss and dropped.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl_seconds: float = SEARCH_CACHE_TTL) -> None:
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+        self._generation_read_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(profile_id: str, embedding_version: Any, top_k: int, **filters: Any) -> Hashable:
+        frozen = tuple(sorted((k, v if isinstance(v, Hashable) else repr(v)) for k, v in filters.items() if v is not None))
+        return (profile_id, embedding_version, top_k, frozen)
+
+    def current_generation(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if self._generation is not None and now - self._generation_read_at < SEARCH_GENERATION_REFRESH:
+                return self._generation
+        generation = get_generation(get_db())
+        with self._lock:
+            self._generation, self._generation_read_at = generation, now
+        return generation
+
+    def get(self, key: Hashable, generation: int) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return False, None
+
+            entry_generation, expires_at, value = entry
+            if entry_generation != generation:
+                del self._entries[key]
+                self._stats["invalidations"] += 1
+                self._stats["misses"] += 1
+                return False, None
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return True, value
+
+    def put(self, key: Hashable, generation: int, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        # Read the generation *before* computing so results that raced with
+        # an index commit are tagged with the older generation.
+        generation = self.current_generation()
+        hit, value = self.get(key, generation)
+        if hit:
+            return value
+        value = compute()
+        self.put(key, generation, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "generation": self._generation,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+search_cache = SearchCache()
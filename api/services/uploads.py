@@ -0,0 +1,90 @@
+# api/services/uploads.py
+#
+# Streams UploadFile bodies to disk in fixed-size chunks. File I/O and
+# hashing run in the threadpool so the event loop never blocks on disk,
+# and at most one chunk per upload is held in memory.
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from typing import NamedTuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, filename: str, max_bytes: int) -> None:
+        super().__init__(f"{filename} exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    size_bytes: int
+    sha256: str
+
+
+def safe_filename(filename: str) -> str:
+    """Client filenames may carry directories ("../x.pdf", "C:\\a\\b.pdf")."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid filename: {filename!r}")
+    return name
+
+
+def _write_chunk(fh, hasher, data: bytes) -> None:
+    fh.write(data)
+    hasher.update(data)
+
+
+def _discard(fh, tmp_path: str) -> None:
+    fh.close()
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def _commit(fh, tmp_path: str, dest_path: str) -> None:
+    fh.close()
+    os.replace(tmp_path, dest_path)
+
+
+async def stream_to_disk(
+    upload: UploadFile,
+    dest_path: str,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_BYTES,
+) -> StoredUpload:
+    """
+    Copy `upload` to `dest_path` chunk by chunk, hashing and size-checking
+    as it goes. The file appears at `dest_path` only once complete; on
+    UploadTooLarge (or any error) nothing is left behind.
+    """
+    dest_dir = os.path.dirname(dest_path) or "."
+    fd, tmp_path = await run_in_threadpool(tempfile.mkstemp, prefix=".upload_", suffix=".part", dir=dest_dir)
+    fh = os.fdopen(fd, "wb")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            data = await upload.read(chunk_size)
+            if not data:
+                break
+            size += len(data)
+            if size > max_bytes:
+                raise UploadTooLarge(upload.filename or dest_path, max_bytes)
+            await run_in_threadpool(_write_chunk, fh, hasher, data)
+    except BaseException:
+        await run_in_threadpool(_discard, fh, tmp_path)
+        raise
+
+    await run_in_threadpool(_commit, fh, tmp_path, dest_path)
+    return StoredUpload(dest_path, size, hasher.hexdigest())
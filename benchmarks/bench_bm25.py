@@ -0,0 +1,89 @@
+# benchmarks/bench_bm25.py
+#
+# Build time, on-disk size and query latency of the BM25 segment index
+# (embeddings/bm25_index.py) on synthetic tender chunks.
+#
+#   python -m benchmarks.bench_bm25 --docs 2000 --queries 200
+
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_chunker import make_text
+from embeddings.bm25_index import Bm25Index, Bm25Writer, extract_keywords, tokenize
+from embeddings.chunker import iter_chunks
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(n_docs: int, doc_kb: int, n_queries: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "bm25"
+        writer = Bm25Writer(str(root))
+
+        n_chunks = 0
+        t0 = time.perf_counter()
+        for d in range(n_docs):
+            text = make_text(doc_kb * 1024, seed=seed + d)
+            for i, chunk in enumerate(iter_chunks(text)):
+                writer.add(f"doc{d}_chunk_{i}", chunk.text, f"tender{d}", f"doc{d}")
+                n_chunks += 1
+            writer.commit()  # one segment per tender, as the indexer does
+        build = time.perf_counter() - t0
+
+        index = Bm25Index(str(root))
+        stats = index.stats()
+        terms = sorted(set(tokenize(make_text(64 * 1024, seed=seed))))
+
+        # Free-text queries plus profile-style weighted keyword queries
+        queries = []
+        for q in range(n_queries):
+            if q % 2:
+                queries.append(" ".join(rng.choices(terms, k=rng.randint(2, 8))))
+            else:
+                queries.append(extract_keywords([make_text(4096, seed=seed * 1000 + q)], top_n=32))
+
+        latencies = []
+        for query in queries:
+            t = time.perf_counter()
+            index.search(query, top_n=200)
+            latencies.append((time.perf_counter() - t) * 1000.0)
+
+        return {
+            "docs": n_docs,
+            "chunks": n_chunks,
+            "segments": stats.get("segments"),
+            "build_s": round(build, 3),
+            "chunks_per_s": round(n_chunks / build, 1) if build else None,
+            "disk_mb": round(_dir_size(root) / 1024 / 1024, 2),
+            "query_p50_ms": round(_percentile(latencies, 0.50), 3),
+            "query_p99_ms": round(_percentile(latencies, 0.99), 3),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--doc-kb", type=int, default=32, help="text size per tender")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    r = run(args.docs, args.doc_kb, args.queries)
+    for key, value in r.items():
+        print(f"{key:>14}: {value}")
+
+
+if __name__ == "__main__":
+    main()
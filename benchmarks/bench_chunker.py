@@ -0,0 +1,102 @@
+# benchmarks/bench_chunker.py
+#
+# Throughput / linearity benchmark for embeddings.chunker on multi-MB
+# tender-like texts.
+#
+#   python -m benchmarks.bench_chunker --sizes 1,4,16 --tokens
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+from embeddings.chunker import iter_chunks
+
+_WORDS = (
+    "tender bid bidder supply installation commissioning CCTV camera bulletproof jacket "
+    "ministry home affairs earnest money deposit EMD technical evaluation financial "
+    "annexure clause contractor delivery warranty specification quantity rate item "
+    "schedule inspection penalty liquidated damages performance security"
+).split()
+
+
+def make_text(target_bytes: int, seed: int = 42) -> str:
+    """Paragraphs of sentences, numbered clauses and table-ish rows."""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    clause = 0
+    while size < target_bytes:
+        kind = rng.random()
+        if kind < 0.15:
+            clause += 1
+            line = f"{clause}. " + " ".join(rng.choices(_WORDS, k=rng.randint(4, 12))).capitalize() + "."
+        elif kind < 0.35:
+            line = " | ".join(
+                [f"Item-{rng.randint(1, 999)}", rng.choice(_WORDS), str(rng.randint(1, 5000)), f"{rng.random() * 1e5:.2f}"]
+            )
+        else:
+            sentences = [
+                " ".join(rng.choices(_WORDS, k=rng.randint(6, 30))).capitalize() + rng.choice(".!?")
+                for _ in range(rng.randint(1, 12))
+            ]
+            line = " ".join(sentences)
+        parts.append(line)
+        size += len(line) + 1
+    return "\n".join(parts)
+
+
+def _token_length_fn(use_model: bool) -> Callable[[str], int]:
+    if use_model:
+        from embeddings.tender_embedder import TenderEmbedder
+
+        return TenderEmbedder().count_tokens
+    # Cheap proxy when the model is not available
+    return lambda s: len(s.split())
+
+
+def run(size_mb: float, max_len: int, overlap: int, length_fn: Optional[Callable[[str], int]]) -> dict:
+    text = make_text(int(size_mb * 1024 * 1024))
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    count = 0
+    for _ in iter_chunks(text, max_len=max_len, overlap_chars=overlap, length_fn=length_fn):
+        count += 1
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "size_mb": size_mb,
+        "chunks": count,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(size_mb / elapsed, 2) if elapsed else None,
+        "peak_alloc_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,2,4,8", help="comma separated sizes in MB")
+    parser.add_argument("--max-len", type=int, default=None)
+    parser.add_argument("--overlap", type=int, default=80)
+    parser.add_argument("--tokens", action="store_true", help="budget in tokens instead of chars")
+    parser.add_argument("--model", action="store_true", help="use the embedder's tokenizer for --tokens")
+    args = parser.parse_args()
+
+    length_fn = _token_length_fn(args.model) if args.tokens else None
+    max_len = args.max_len or (128 if args.tokens else 500)
+
+    print(f"mode={'tokens' if args.tokens else 'chars'} max_len={max_len} overlap={args.overlap}")
+    for size in [float(s) for s in args.sizes.split(",") if s.strip()]:
+        r = run(size, max_len, args.overlap, length_fn)
+        print(
+            f"{r['size_mb']:>7.1f} MB  {r['chunks']:>8d} chunks  {r['seconds']:>8.3f}s  "
+            f"{r['mb_per_s']:>7} MB/s  peak {r['peak_alloc_mb']} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# benchmarks/bench_import.py
+#
+# Cold import time of the entry-point modules, each in a fresh interpreter,
+# plus the side effects an import must not have: a MongoClient, background
+# threads, or heavy libraries (torch / sentence_transformers / docling /
+# chromadb / hnswlib) pulled in before anything is embedded or converted.
+# Those belong on first use (storage/mongo.get_db, tender_embedder.get_embedder,
+# docling_processor.get_converter, vector_store.get_vector_store).
+#
+# Exits 1 when a module is over --budget-ms, fails to import, or has side
+# effects, so it can gate CI; benchmarks/suite.py tracks the timings per commit.
+#
+#   python -m benchmarks.bench_import
+#   python -m benchmarks.bench_import --modules embeddings.index_tenders --top 15
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+MODULES = (
+    "api.main",
+    "indexing_daemon",
+    "docling_processor",
+    "embeddings.index_tenders",
+    "embeddings.index_profiles",
+    "embeddings.match_matrix",
+    "storage.indexes",
+    "storage.doc_cost",
+    "scrapers.mha.mha_scraper",
+)
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "docling", "chromadb", "hnswlib")
+DEFAULT_BUDGET_MS = 1000.0
+
+# Runs in the child: time the import, then look for what it left behind
+_PROBE = """
+import gc, json, sys, threading, time
+t0 = time.perf_counter()
+import {module}
+ms = (time.perf_counter() - t0) * 1000.0
+clients = 0
+if "pymongo" in sys.modules:
+    from pymongo import MongoClient
+    clients = sum(1 for o in gc.get_objects() if isinstance(o, MongoClient))
+print(json.dumps({{
+    "ms": ms,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+    "mongo_clients": clients,
+    "threads": [t.name for t in threading.enumerate() if t is not threading.main_thread()],
+}}))
+"""
+
+
+def _parse_importtime(stderr: str) -> List[tuple]:
+    """(self_us, cumulative_us, name) rows of `python -X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            rows.append((int(self_us), int(cumulative_us), name.strip()))
+        except ValueError:
+            continue
+    return rows
+
+
+def measure(module: str, repeat: int = 5, top: int = 0) -> Dict[str, Any]:
+    """Median cold import time of `module` over `repeat` fresh interpreters, and its side effects."""
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    env = dict(os.environ, METRICS_FILE="", METRICS_SPAN_LOG="")
+    times: List[float] = []
+    last: Dict[str, Any] = {}
+    rows: List[tuple] = []
+    for i in range(max(1, repeat)):
+        # -X importtime only on the first run: it slows the import it reports on
+        args = [sys.executable, "-X", "importtime", "-c", code] if i == 0 and top else [sys.executable, "-c", code]
+        proc = subprocess.run(args, capture_output=True, text=True, cwd=REPO_ROOT, env=env)
+        if proc.returncode != 0:
+            err = [l for l in proc.stderr.strip().splitlines() if not l.startswith("import time:")]
+            return {"module": module, "error": (err or ["failed"])[-1]}
+        last = json.loads(proc.stdout.strip().splitlines()[-1])
+        times.append(last["ms"])
+        if i == 0 and top:
+            rows = _parse_importtime(proc.stderr)
+
+    result: Dict[str, Any] = {
+        "module": module,
+        "import_ms": round(statistics.median(times), 1),
+        "heavy": last["heavy"],
+        "mongo_clients": last["mongo_clients"],
+        "threads": last["threads"],
+    }
+    if top:
+        result["top_self_ms"] = [
+            (name, round(self_us / 1000.0, 1)) for self_us, _, name in sorted(rows, reverse=True)[:top]
+        ]
+    return result
+
+
+def problems(result: Dict[str, Any], budget_ms: float) -> List[str]:
+    if "error" in result:
+        return [f"import failed: {result['error']}"]
+    found = []
+    if result["import_ms"] > budget_ms:
+        found.append(f"{result['import_ms']} ms > budget {budget_ms:g} ms")
+    if result["heavy"]:
+        found.append(f"imports {', '.join(result['heavy'])}")
+    if result["mongo_clients"]:
+        found.append(f"creates {result['mongo_clients']} MongoClient(s)")
+    if result["threads"]:
+        found.append(f"starts threads {', '.join(result['threads'])}")
+    return found
+
+
+def summary(modules: Sequence[str] = MODULES, repeat: int = 5) -> Dict[str, Any]:
+    """Flat per-module timings for benchmarks/suite.py (`<module>_ms`, lower is better)."""
+    out: Dict[str, Any] = {}
+    errors = 0
+    for module in modules:
+        r = measure(module, repeat)
+        if "error" in r:
+            errors += 1
+        else:
+            out[f"{module}_ms"] = r["import_ms"]
+    out["errors"] = errors
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", default=",".join(MODULES), help="comma separated module names")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS)))
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports (self time) per module")
+    args = parser.parse_args()
+
+    failed = False
+    for module in [m.strip() for m in args.modules.split(",") if m.strip()]:
+        r = measure(module, args.repeat, args.top)
+        found = problems(r, args.budget_ms)
+        failed = failed or bool(found)
+        timing = f"{r['import_ms']:>8.1f} ms" if "import_ms" in r else f"{'-':>8} ms"
+        print(f"{module:<28} {timing}  {'FAIL ' + '; '.join(found) if found else 'ok'}")
+        for name, ms in r.get("top_self_ms", []):
+            print(f"{'':<30}{ms:>8.1f} ms  {name}")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
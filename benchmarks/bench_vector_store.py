@@ -0,0 +1,144 @@
+# benchmarks/bench_vector_store.py
+#
+# Build time, query p50/p99 and peak RSS of the vector-store backends
+# (embeddings/vector_store.py) on synthetic clustered 384-dim chunks.
+# Every (backend, size) runs in a fresh subprocess so RSS is not shared.
+#
+#   python -m benchmarks.bench_vector_store --sizes 100000,1000000,5000000 --backends flat,hnsw,chroma
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DIM = 384
+BATCH = 4096
+
+
+def _vectors(rng: np.random.Generator, centers: np.ndarray, n: int) -> np.ndarray:
+    picks = centers[rng.integers(len(centers), size=n)]
+    return (picks + 0.35 * rng.standard_normal((n, centers.shape[1]))).astype(np.float32)
+
+
+def _open_store(backend: str, path: str):
+    if backend == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+
+        client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+        return client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+
+    from embeddings.flat_store import FlatVectorStore
+
+    return FlatVectorStore(os.path.join(path, "bench"), use_hnsw=backend == "hnsw")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def worker(backend: str, size: int, n_queries: int, top_k: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, DIM)).astype(np.float32)
+    sources = ["MHA", "CPPP", "GEM", "DEFENCE"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = _open_store(backend, tmp)
+
+        t0 = time.perf_counter()
+        for start in range(0, size, BATCH):
+            n = min(BATCH, size - start)
+            store.upsert(
+                ids=[f"tender:{(start + i) // 40}:{(start + i) % 40}" for i in range(n)],
+                embeddings=_vectors(rng, centers, n),
+                documents=[""] * n,
+                metadatas=[{"source": sources[(start + i) % 4], "document_id": str((start + i) // 40)} for i in range(n)],
+            )
+        store.count()  # flat/hnsw: maps rows and (hnsw) builds the graph
+        build = time.perf_counter() - t0
+
+        queries = _vectors(rng, centers, n_queries)
+        latencies = {"unfiltered": [], "filtered": []}
+        results = []
+        for q in queries:
+            t = time.perf_counter()
+            res = store.query(query_embeddings=[q.tolist()], n_results=top_k, include=["distances"])
+            latencies["unfiltered"].append((time.perf_counter() - t) * 1000.0)
+            results.append(res["ids"][0])
+        for q in queries:
+            t = time.perf_counter()
+            store.query(query_embeddings=[q.tolist()], n_results=top_k, where={"source": "MHA"}, include=["distances"])
+            latencies["filtered"].append((time.perf_counter() - t) * 1000.0)
+
+        out = {"backend": backend, "size": size, "build_s": round(build, 2)}
+        for name, values in latencies.items():
+            out[f"{name}_p50_ms"] = round(float(np.percentile(values, 50)), 2)
+            out[f"{name}_p99_ms"] = round(float(np.percentile(values, 99)), 2)
+
+        if backend == "hnsw" and getattr(store, "use_hnsw", False):
+            # recall@k of the graph against exact search over the same rows
+            store.use_hnsw = False
+            hits = 0
+            for q, approx in zip(queries, results):
+                exact = store.query(query_embeddings=[q.tolist()], n_results=top_k, include=[])["ids"][0]
+                hits += len(set(exact) & set(approx))
+            out["recall_at_k"] = round(hits / (top_k * len(queries)), 4)
+
+        out["peak_rss_mb"] = _peak_rss_mb()
+        out["disk_mb"] = round(
+            sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(tmp) for f in files) / 1024 / 1024, 1
+        )
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--backends", default="flat,hnsw,chroma")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.backends, int(args.sizes), args.queries, args.top_k, args.seed)))
+        return
+
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            proc = subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.bench_vector_store", "--worker",
+                    "--backends", backend, "--sizes", str(size),
+                    "--queries", str(args.queries), "--top-k", str(args.top_k), "--seed", str(args.seed),
+                ],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                err = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+                print(f"{backend:>7} {size:>9,d}  error: {err}")
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            recall = f"  recall@{args.top_k} {r['recall_at_k']}" if "recall_at_k" in r else ""
+            print(
+                f"{backend:>7} {size:>9,d}  build {r['build_s']:>8}s  "
+                f"p50/p99 {r['unfiltered_p50_ms']}/{r['unfiltered_p99_ms']} ms  "
+                f"filtered {r['filtered_p50_ms']}/{r['filtered_p99_ms']} ms  "
+                f"rss {r['peak_rss_mb']} MB  disk {r['disk_mb']} MB{recall}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/corpus.py
+#
+# Reproducible synthetic tender corpus: docling_outputs-shaped records with
+# body text, shared boilerplate (terms, eligibility, contact blocks), docling
+# style tables and a long-tailed length distribution, plus company profile
+# text drawn from the same vocabulary so searches have something to match.
+#
+#   python -m benchmarks.corpus --tenders 5 --seed 1   # print a summary
+
+from __future__ import annotations
+
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from benchmarks.bench_chunker import _WORDS, make_text
+
+SOURCES = ("MHA", "CPPP", "GEM", "DEFENCE")
+DOCUMENT_TYPES = ("MHA_PDF", "NIT", "CORRIGENDUM", "BOQ")
+
+_TOPICS = (
+    "CCTV surveillance cameras and network video recorders for border outposts",
+    "bulletproof jackets and ballistic helmets for paramilitary forces",
+    "annual maintenance contract for data centre servers and storage",
+    "construction of barracks and boundary wall with allied civil works",
+    "supply of diesel generator sets with installation and commissioning",
+    "hiring of vehicles on monthly rental basis for field offices",
+    "procurement of laptops, printers and UPS for regional offices",
+    "consultancy for design and supervision of road works",
+)
+
+_BOILERPLATE = (
+    "The bidder shall submit the earnest money deposit in the form of a demand draft or bank guarantee. "
+    "Bids received without EMD shall be summarily rejected. The competent authority reserves the right "
+    "to accept or reject any or all bids without assigning any reason.",
+    "Eligibility: the bidder must have an average annual turnover of not less than the amount specified "
+    "in the schedule during the last three financial years, and must not be blacklisted by any "
+    "government department.",
+    "Liquidated damages at the rate of half percent per week of delay, subject to a maximum of ten "
+    "percent of the contract value, shall be levied for delay in delivery.",
+    "For any clarification bidders may contact the procurement cell during office hours. Corrigenda, "
+    "if any, will be published on the portal only.",
+)
+
+
+def _table(rng: random.Random, n_rows: int) -> Dict[str, Any]:
+    """Docling-style table record; the indexer embeds its `text`."""
+    header = "S.No | Item | Quantity | Unit | Estimated rate"
+    rows = [
+        f"{r + 1} | {' '.join(rng.choices(_WORDS, k=rng.randint(2, 5)))} | {rng.randint(1, 5000)} | "
+        f"{rng.choice(('Nos', 'Sets', 'Lot', 'Kg'))} | {rng.random() * 1e5:.2f}"
+        for r in range(n_rows)
+    ]
+    return {"num_rows": n_rows + 1, "num_cols": 5, "text": "\n".join([header] + rows)}
+
+
+def _length(rng: random.Random, median_kb: float) -> int:
+    # Most notices are short, a few run to hundreds of pages
+    return int(min(rng.lognormvariate(0, 0.9) * median_kb, median_kb * 40) * 1024)
+
+
+def make_tender(index: int, seed: int = 42, median_kb: float = 12.0) -> Dict[str, Any]:
+    """One docling_outputs-shaped tender record (without _id / document_id)."""
+    rng = random.Random(seed * 1_000_003 + index)
+    topic = rng.choice(_TOPICS)
+    published = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=rng.randint(0, 600))
+    body = make_text(_length(rng, median_kb), seed=seed * 7919 + index)
+    boilerplate = "\n\n".join(rng.sample(_BOILERPLATE, k=rng.randint(2, len(_BOILERPLATE))))
+    text = f"Tender for {topic}.\n\n{body}\n\n{boilerplate}"
+    return {
+        "doc_type": "tender",
+        "source": rng.choice(SOURCES),
+        "document_type": rng.choice(DOCUMENT_TYPES),
+        "title": f"Tender for {topic}",
+        "tender_ref_no": f"BENCH/{seed}/{index:06d}",
+        "published_at": published,
+        "closing_at": published + timedelta(days=rng.randint(7, 45)),
+        "text": text,
+        "tables": [_table(rng, rng.randint(3, 40)) for _ in range(rng.randint(0, 3))],
+        "sections": None,
+        "docling_version": "v1",
+        "indexed": False,
+    }
+
+
+def make_corpus(n_tenders: int, seed: int = 42, median_kb: float = 12.0) -> List[Dict[str, Any]]:
+    return [make_tender(i, seed=seed, median_kb=median_kb) for i in range(n_tenders)]
+
+
+def make_company_text(seed: int = 42, size_kb: int = 24) -> str:
+    """Capability statement of a bidder working in a few of the corpus topics."""
+    rng = random.Random(seed)
+    topics = rng.sample(_TOPICS, k=3)
+    intro = "Company profile. We have executed contracts for " + "; ".join(topics) + "."
+    return intro + "\n\n" + make_text(size_kb * 1024, seed=seed + 17)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenders", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--median-kb", type=float, default=12.0)
+    args = parser.parse_args()
+
+    for doc in make_corpus(args.tenders, args.seed, args.median_kb):
+        table_chars = sum(len(t["text"]) for t in doc["tables"])
+        print(f"{doc['tender_ref_no']}  {doc['source']:<8} {len(doc['text']) / 1024:>8.1f} KB text  "
+              f"{len(doc['tables'])} tables ({table_chars / 1024:.1f} KB)  {doc['title']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/eval_recall.py
+#
+# recall@k of compressed (PCA + int8 + rescoring) search against exact flat
+# search, using the READY company profiles as queries. Codecs are fitted in
+# memory for each --dims value, so the store itself is not modified.
+#
+#   VECTOR_BACKEND=flat python -m benchmarks.eval_recall --dims 64,128,256 --k 5,10,50
+#   python -m benchmarks.eval_recall --sample-queries 500   # no Mongo: sampled chunks as queries
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from embeddings.packed_vectors import FORMAT_FIELD, unpack_centroids, unpack_embedding
+from embeddings.quantization import COMPRESS_SAMPLE, RESCORE_FACTOR, PcaInt8Codec, blocked_top_k, compressed_top_k
+from embeddings.vector_store import get_vector_store
+
+
+def _profile_queries(with_centroids: bool) -> np.ndarray:
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("DB_NAME", "tender_db")]
+    rows = []
+    for doc in db["company_profiles"].find(
+        {"status": "READY", "profile_embedding": {"$ne": None}},
+        {"profile_embedding": 1, "profile_centroids": 1, FORMAT_FIELD: 1},
+    ):
+        vec = unpack_embedding(doc)
+        if vec is None:
+            continue
+        rows.append(vec)
+        if with_centroids:
+            rows.extend(unpack_centroids(doc))
+    return np.asarray(rows, dtype=np.float32).reshape(-1, rows[0].shape[0] if rows else 0)
+
+
+def _unit(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _recall(exact: np.ndarray, approx: np.ndarray, k: int) -> float:
+    hits = [len(set(e[:k][e[:k] >= 0]) & set(a[:k][a[:k] >= 0])) for e, a in zip(exact, approx)]
+    denom = sum(min(k, int((e[:k] >= 0).sum())) for e in exact)
+    return sum(hits) / denom if denom else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", default=os.getenv("TENDER_CHROMA_COLLECTION", "tender_embeddings"))
+    parser.add_argument("--dims", default="64,128,256")
+    parser.add_argument("--k", default="5,10,50")
+    parser.add_argument("--rescore-factor", type=float, default=RESCORE_FACTOR)
+    parser.add_argument("--sample", type=int, default=COMPRESS_SAMPLE, help="rows used to fit each codec")
+    parser.add_argument("--centroids", action="store_true", help="also query with profile centroids")
+    parser.add_argument("--sample-queries", type=int, default=0, help="use N random stored chunks as queries")
+    args = parser.parse_args()
+
+    store = get_vector_store(name=args.collection)
+    if not hasattr(store, "snapshot"):
+        raise SystemExit("recall evaluation needs VECTOR_BACKEND=flat or hnsw")
+    vectors, alive = store.snapshot()
+    live = np.flatnonzero(alive)
+    if not len(live):
+        raise SystemExit(f"{args.collection} is empty")
+
+    rng = np.random.default_rng(0)
+    if args.sample_queries:
+        picks = np.sort(rng.choice(live, size=min(args.sample_queries, len(live)), replace=False))
+        queries = np.asarray(vectors[picks], dtype=np.float32)
+    else:
+        queries = _profile_queries(args.centroids)
+    if not len(queries):
+        raise SystemExit("no queries (no READY profiles); try --sample-queries")
+    queries = _unit(queries)
+
+    ks = sorted(int(k) for k in args.k.split(",") if k.strip())
+    top = min(max(ks), len(live))
+    print(f"{len(live):,} live rows, {len(queries)} queries, k={ks}, rescore x{args.rescore_factor}")
+
+    t = time.perf_counter()
+    exact, _ = blocked_top_k(queries, vectors, alive, top)
+    exact_ms = (time.perf_counter() - t) * 1000.0 / len(queries)
+    print(f"{'exact':>10}  {exact_ms:8.2f} ms/query  {vectors.shape[1] * 4:>5} B/row")
+
+    sample = np.sort(rng.choice(live, size=min(args.sample, len(live)), replace=False))
+    fit_rows = np.asarray(vectors[sample])
+    for dims in [int(d) for d in args.dims.split(",") if d.strip()]:
+        codec = PcaInt8Codec.fit(fit_rows, dims)
+        codes = np.concatenate(
+            [codec.encode(np.asarray(vectors[a : a + 65536])) for a in range(0, len(vectors), 65536)]
+        )
+        t = time.perf_counter()
+        approx, _ = compressed_top_k(queries, codec, codes, vectors, alive, top, args.rescore_factor)
+        ms = (time.perf_counter() - t) * 1000.0 / len(queries)
+        recalls = "  ".join(f"recall@{k} {_recall(exact, approx, k):.4f}" for k in ks)
+        print(
+            f"{'pca' + str(codec.dims) + '-i8':>10}  {ms:8.2f} ms/query  {codec.dims:>5} B/row  "
+            f"var {100 * codec.explained:5.1f}%  {recalls}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# benchmarks/load_test.py
+#
+# Load test for the FastAPI app (api/main.py) on localhost. Seeds Mongo and
+# the vector store with --profiles READY profiles and --tenders indexed
+# tenders, then drives a weighted mix of create-profile, upload, job-poll
+# and search requests at --rate requests/s (open loop) for --duration
+# seconds, and reports throughput, error rate and p50/p95/p99 latency per
+# endpoint. Latency is measured from each request's scheduled send time, so
+# a saturated server shows up as latency instead of a lower offered rate.
+#
+#   python -m benchmarks.load_test --serve --seed-data --rate 50 --duration 60
+#   python -m benchmarks.load_test --url http://127.0.0.1:8000 --mix search=1 --rate 200 \
+#       --slo search:p95=300 --slo search:errors=0.01
+#
+# Seeding and --serve use DB_NAME (default "loadtest" here, never the
+# pipeline's database unless asked) and the configured CHROMA_PATH /
+# FLAT_STORE_PATH / BM25_PATH; a server started separately must share them.
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from benchmarks.corpus import SOURCES, make_corpus
+
+ENDPOINTS = ("create", "upload", "poll", "search")
+DEFAULT_MIX = "search=70,poll=15,upload=10,create=5"
+DEFAULT_DB_NAME = "loadtest"
+
+
+def _minimal_pdf(text: str) -> bytes:
+    """A valid one-page PDF with a line of text (docling-convertible)."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def seed(n_profiles: int, n_tenders: int, seed_value: int) -> None:
+    """Index --tenders synthetic tenders and create --profiles READY profiles."""
+    from pymongo import MongoClient
+
+    from benchmarks.suite import insert_corpus, seed_profile
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)[os.environ["DB_NAME"]]
+    if n_tenders:
+        insert_corpus(db, make_corpus(n_tenders, seed_value))
+    import embeddings.index_tenders as index_tenders  # env-configured at import
+    from embeddings.tender_embedder import get_embedder
+
+    t0 = time.perf_counter()
+    indexed = index_tenders.index_pending_tenders(limit=0)
+    print(f"seeded {indexed} tenders in {time.perf_counter() - t0:.1f}s")
+    t0 = time.perf_counter()
+    for i in range(n_profiles):
+        seed_profile(db, get_embedder(), seed_value + i)
+    print(f"seeded {n_profiles} profiles in {time.perf_counter() - t0:.1f}s")
+
+
+def _ready_profiles(limit: int = 1000) -> List[str]:
+    from pymongo import MongoClient
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)[os.environ["DB_NAME"]]
+    return [str(p["_id"]) for p in db["company_profiles"].find({"status": "READY"}, {"_id": 1}).limit(limit)]
+
+
+class _State:
+    """Ids produced during the run, shared between request threads."""
+
+    def __init__(self, ready_profiles: List[str]) -> None:
+        self.lock = threading.Lock()
+        self.ready_profiles = ready_profiles
+        self.new_profiles: List[str] = []
+        self.jobs: List[str] = []
+
+    def pick(self, items: List[str]) -> Optional[str]:
+        with self.lock:
+            return random.choice(items) if items else None
+
+    def add(self, items: List[str], value: str) -> None:
+        with self.lock:
+            items.append(value)
+            if len(items) > 10_000:
+                del items[: len(items) // 2]
+
+
+class LoadTest:
+    def __init__(self, base_url: str, state: _State, timeout: float, pdf_kb: int) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.state = state
+        self.timeout = timeout
+        self.pdf = _minimal_pdf("Load test capability statement " + "x" * max(0, pdf_kb * 1024 - 64))
+        self._local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.status_codes: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    # ---- endpoints: each returns the response, or None when there is nothing to call yet ----
+    def create(self) -> requests.Response:
+        res = self._session().post(f"{self.base_url}/profiles", timeout=self.timeout)
+        if res.ok:
+            self.state.add(self.state.new_profiles, res.json()["profile_id"])
+        return res
+
+    def upload(self) -> Optional[requests.Response]:
+        profile_id = self.state.pick(self.state.new_profiles)
+        if profile_id is None:
+            return None
+        res = self._session().post(
+            f"{self.base_url}/profiles/{profile_id}/documents",
+            files=[("pdfs", (f"capability_{random.randrange(10**9)}.pdf", self.pdf, "application/pdf"))],
+            timeout=self.timeout,
+        )
+        if res.ok:
+            self.state.add(self.state.jobs, res.json()["job_id"])
+        return res
+
+    def poll(self) -> Optional[requests.Response]:
+        job_id = self.state.pick(self.state.jobs)
+        if job_id is None:
+            return None
+        return self._session().get(f"{self.base_url}/jobs/{job_id}", timeout=self.timeout)
+
+    def search(self) -> Optional[requests.Response]:
+        profile_id = self.state.pick(self.state.ready_profiles)
+        if profile_id is None:
+            return None
+        # Varied parameters so the result cache does not answer everything
+        params: List[Tuple[str, Any]] = [("top_k", random.choice((5, 10, 20)))]
+        if random.random() < 0.3:
+            params.append(("source", random.choice(SOURCES)))
+        if random.random() < 0.2:
+            params.append(("hybrid", "false"))
+        return self._session().post(f"{self.base_url}/profiles/{profile_id}/search", params=params, timeout=self.timeout)
+
+    def record(self, endpoint: str, scheduled: float, call: Callable[[], Optional[requests.Response]]) -> None:
+        try:
+            res = call()
+            status = res.status_code if res is not None else None
+        except requests.RequestException:
+            status = -1
+        if status is None:
+            return  # nothing to call yet (no job / profile of that kind)
+        elapsed = (time.perf_counter() - scheduled) * 1000.0
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            self.status_codes[endpoint][status] += 1
+            if status < 200 or status >= 400:
+                self.errors[endpoint] += 1
+
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r} in --mix; expected {ENDPOINTS}")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("--mix needs at least one positive weight")
+    return mix
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+
+def run(test: LoadTest, mix: Dict[str, float], rate: float, duration: float, concurrency: int) -> Dict[str, Any]:
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    calls = {n: getattr(test, n) for n in names}
+    interval = 1.0 / rate
+    late = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        i = 0
+        while True:
+            scheduled = start + i * interval
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -interval:
+                late += 1  # the generator itself fell behind (client-side limit)
+            endpoint = random.choices(names, weights)[0]
+            pool.submit(test.record, endpoint, scheduled, calls[endpoint])
+            i += 1
+    elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for endpoint in names:
+        lat = test.latencies.get(endpoint, [])
+        n = len(lat)
+        endpoints[endpoint] = {
+            "requests": n,
+            "throughput_rps": round(n / elapsed, 2) if elapsed else None,
+            "error_rate": round(test.errors.get(endpoint, 0) / n, 4) if n else None,
+            "p50_ms": _percentile(lat, 0.50),
+            "p95_ms": _percentile(lat, 0.95),
+            "p99_ms": _percentile(lat, 0.99),
+            "status_codes": dict(test.status_codes.get(endpoint, {})),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "offered_rps": rate,
+        "achieved_rps": round(total / elapsed, 2) if elapsed else None,
+        "duration_s": round(elapsed, 1),
+        "late_dispatches": late,
+        "endpoints": endpoints,
+    }
+
+
+def check_slos(report: Dict[str, Any], slos: List[str]) -> List[str]:
+    """
+    `endpoint:p95=300` (ms) or `endpoint:errors=0.01` (fraction);
+    returns the objectives that were missed.
+    """
+    missed = []
+    for slo in slos:
+        target, _, limit = slo.partition("=")
+        endpoint, _, metric = target.partition(":")
+        stats = report["endpoints"].get(endpoint)
+        if stats is None or not limit:
+            raise ValueError(f"Bad --slo {slo!r}; expected endpoint:p95=300 or endpoint:errors=0.01")
+        key = "error_rate" if metric == "errors" else f"{metric}_ms"
+        value = stats.get(key)
+        if value is None or value > float(limit):
+            missed.append(f"{endpoint} {metric} {value} > {limit}")
+    return missed
+
+
+def _wait_for_server(url: str, proc: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"API server exited with code {proc.returncode}")
+        try:
+            requests.get(f"{url}/metrics", timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise SystemExit(f"API server did not come up on {url} within {timeout:.0f}s")
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Load test the tender API on localhost")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--serve", action="store_true", help="start api.main:app with uvicorn on --url's port")
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn worker processes for --serve")
+    parser.add_argument("--db", default=os.getenv("LOADTEST_DB_NAME", DEFAULT_DB_NAME), help="Mongo database to seed/serve")
+    parser.add_argument("--seed-data", action="store_true", help="seed --profiles / --tenders before the run")
+    parser.add_argument("--profiles", type=int, default=20)
+    parser.add_argument("--tenders", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights, e.g. search=70,poll=15,upload=10,create=5")
+    parser.add_argument("--rate", type=float, default=20.0, help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=64, help="client threads (max in-flight requests)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout, seconds")
+    parser.add_argument("--pdf-kb", type=int, default=16, help="size of each uploaded PDF")
+    parser.add_argument("--slo", action="append", default=[], help="endpoint:p95=300 or endpoint:errors=0.01 (repeatable)")
+    parser.add_argument("--out", default=None, help="write the report as JSON")
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = args.db
+    random.seed(args.seed)
+    mix = _parse_mix(args.mix)
+
+    if args.seed_data:
+        seed(args.profiles, args.tenders, args.seed)
+
+    server = None
+    if args.serve:
+        port = args.url.rsplit(":", 1)[-1].strip("/")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api.main:app", "--port", port, "--workers", str(args.server_workers),
+             "--log-level", "warning"],
+            env=dict(os.environ),
+        )
+        _wait_for_server(args.url, server)
+
+    try:
+        ready = _ready_profiles()
+        if "search" in mix and not ready:
+            print(f"warning: no READY profiles in {args.db}; run with --seed-data for search traffic")
+        test = LoadTest(args.url, _State(ready), args.timeout, args.pdf_kb)
+        if "upload" in mix or "poll" in mix:
+            test.create()  # something to upload to from the first request on
+        report = run(test, mix, args.rate, args.duration, args.concurrency)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report["params"] = {"mix": mix, "db": args.db, "profiles": len(ready), "concurrency": args.concurrency}
+    print(
+        f"offered {report['offered_rps']} rps, achieved {report['achieved_rps']} rps over {report['duration_s']}s"
+        f" ({report['late_dispatches']} late dispatches)"
+    )
+    for endpoint, s in report["endpoints"].items():
+        print(
+            f"{endpoint:>7}  {s['requests']:>6d} req  {s['throughput_rps'] or 0:>7.2f} rps  "
+            f"err {s['error_rate'] if s['error_rate'] is not None else '-':>6}  "
+            f"p50/p95/p99 {s['p50_ms']}/{s['p95_ms']}/{s['p99_ms']} ms  {s['status_codes']}"
+        )
+
+    missed = check_slos(report, args.slo)
+    report["slo_missed"] = missed
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    for line in missed:
+        print(f"SLO MISSED {line}")
+    if missed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
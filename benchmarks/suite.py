@@ -0,0 +1,335 @@
+# benchmarks/suite.py
+#
+# Component benchmarks on the synthetic corpus (benchmarks/corpus.py):
+#
+#   chunk   chunk_text over the corpus text + tables
+#   embed   TenderEmbedder.embed at several batch sizes
+#   index   index_pending_tenders end to end (temporary vector store / BM25
+#           directories, throwaway Mongo database on MONGO_URI)
+#   search  search_tenders_for_profile against that index (vector, hybrid)
+#   import  cold import time of the entry-point modules (benchmarks/bench_import.py)
+#
+# index/search run in a subprocess so the env-configured modules pick up the
+# temporary paths and database. Results are written as JSON, one file per
+# commit; --baseline compares against an earlier file and exits 1 when a
+# metric regressed by more than --threshold.
+#
+#   python -m benchmarks.suite --tenders 200
+#   python -m benchmarks.suite --only chunk,embed --baseline benchmarks/results/abc1234.json
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.corpus import make_company_text, make_corpus
+
+COMPONENTS = ("chunk", "embed", "index", "search", "import")
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_THRESHOLD = 0.15
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _corpus_texts(tenders: int, seed: int) -> List[str]:
+    texts = []
+    for doc in make_corpus(tenders, seed):
+        texts.append("\n".join([doc["text"]] + [t["text"] for t in doc["tables"]]))
+    return texts
+
+
+def bench_chunk(tenders: int, seed: int, repeat: int = 3) -> Dict[str, Any]:
+    from embeddings.chunker import chunk_text
+
+    texts = _corpus_texts(tenders, seed)
+    total_mb = sum(len(t) for t in texts) / 1024 / 1024
+    best = None
+    chunks = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        chunks = sum(len(chunk_text(t)) for t in texts)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "corpus_mb": round(total_mb, 2),
+        "chunks": chunks,
+        "seconds": round(best, 4),
+        "mb_per_s": round(total_mb / best, 2) if best else None,
+    }
+
+
+def bench_embed(tenders: int, seed: int, batch_sizes: Sequence[int], max_texts: int = 512) -> Dict[str, Any]:
+    from embeddings.chunker import chunk_text
+    from embeddings.tender_embedder import TenderEmbedder
+
+    t0 = time.perf_counter()
+    embedder = TenderEmbedder()
+    embedder.embed(["warm up"])
+    out: Dict[str, Any] = {"model": embedder.model_name, "load_s": round(time.perf_counter() - t0, 3)}
+
+    texts = [c for t in _corpus_texts(tenders, seed) for c in chunk_text(t)][:max_texts]
+    out["texts"] = len(texts)
+    for batch_size in batch_sizes:
+        t0 = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            embedder.embed(texts[start:start + batch_size])
+        elapsed = time.perf_counter() - t0
+        out[f"batch{batch_size}_texts_per_s"] = round(len(texts) / elapsed, 1) if elapsed else None
+    return out
+
+
+def insert_corpus(db, corpus: List[Dict[str, Any]]) -> None:
+    """raw_tenders + tender_documents rows and pending docling_outputs for `corpus`."""
+    now = datetime.now(timezone.utc)
+    for doc in corpus:
+        tender_doc = {k: doc[k] for k in ("source", "tender_ref_no", "document_type", "published_at", "closing_at")}
+        tender_doc.update({"docling_status": "done", "local_path": f"/bench/{doc['tender_ref_no']}.pdf", "updated_at": now})
+        doc["tender_id"] = db["raw_tenders"].insert_one({"title": doc["title"], **tender_doc}).inserted_id
+        doc["document_id"] = db["tender_documents"].insert_one({"tender_id": doc["tender_id"], **tender_doc}).inserted_id
+        doc["extracted_at"] = now
+    db["docling_outputs"].insert_many(corpus)
+
+
+def seed_profile(db, embedder, seed: int) -> str:
+    """A READY profile built the way profile_ingest builds one."""
+    import numpy as np
+    from embeddings.bm25_index import extract_keywords
+    from embeddings.chunker import chunk_text
+    from embeddings.packed_vectors import pack_profile_vectors
+    from embeddings.profile_state import ProfileState
+    from embeddings.vector_store import get_vector_store
+
+    text = make_company_text(seed)
+    chunks = chunk_text(text)
+    vectors = embedder.embed(chunks)
+    profile_id = db["company_profiles"].insert_one({"status": "UPLOADING"}).inserted_id
+    document_id = uuid.uuid4().hex[:24]
+
+    get_vector_store(name="profile_embeddings").upsert(
+        ids=[f"profile_{profile_id}_{document_id}_{i}" for i in range(len(chunks))],
+        documents=chunks,
+        embeddings=vectors,
+        metadatas=[
+            {"doc_type": "profile", "profile_id": str(profile_id), "document_id": document_id, "chunk_index": i}
+            for i in range(len(chunks))
+        ],
+    )
+
+    state = ProfileState(embedder.dim)
+    state.add(document_id, state.contribution(vectors, extract_keywords([text], top_n=256)))
+    if state.needs_recluster():
+        state.recluster({document_id: np.asarray(vectors, dtype=np.float32)})
+    centroids, sizes = state.centroids()
+    db["company_profiles"].update_one(
+        {"_id": profile_id},
+        {"$set": {
+            **pack_profile_vectors(state.embedding(), centroids),
+            "profile_centroid_sizes": sizes,
+            "profile_keywords": state.keywords(),
+            "profile_chunk_count": state.count,
+            "status": "READY",
+        }},
+    )
+    return str(profile_id)
+
+
+def worker(tenders: int, seed: int, queries: int, top_k: int) -> Dict[str, Any]:
+    """index + search; runs with DB_NAME / CHROMA_PATH / BM25_PATH pointing at scratch space."""
+    import logging
+
+    from pymongo import MongoClient
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+    client.admin.command("ping")
+    db = client[os.environ["DB_NAME"]]
+    try:
+        insert_corpus(db, make_corpus(tenders, seed))
+
+        import embeddings.index_tenders as index_tenders
+        from embeddings.tender_embedder import get_embedder
+
+        t0 = time.perf_counter()
+        get_embedder().embed(["warm up"])  # the model loads on first use
+        setup = time.perf_counter() - t0
+        logging.getLogger().setLevel(logging.WARNING)
+
+        t0 = time.perf_counter()
+        indexed = index_tenders.index_pending_tenders(limit=0)
+        index_s = time.perf_counter() - t0
+        chunks = sum(d.get("chunk_count", 0) for d in db["docling_outputs"].find({}, {"chunk_count": 1}))
+        out: Dict[str, Any] = {
+            "index": {
+                "tenders": indexed,
+                "chunks": chunks,
+                "setup_s": round(setup, 3),
+                "seconds": round(index_s, 3),
+                "tenders_per_s": round(indexed / index_s, 2) if index_s else None,
+                "chunks_per_s": round(chunks / index_s, 1) if index_s else None,
+            }
+        }
+
+        from api.services.search import search_tenders_for_profile
+
+        profile_id = seed_profile(db, get_embedder(), seed)
+        search: Dict[str, Any] = {}
+        for mode, hybrid in (("vector", False), ("hybrid", True)):
+            search_tenders_for_profile(profile_id, top_k=top_k, hybrid=hybrid)  # warm caches / mmaps
+            latencies = []
+            for _ in range(queries):
+                t = time.perf_counter()
+                search_tenders_for_profile(profile_id, top_k=top_k, hybrid=hybrid)
+                latencies.append((time.perf_counter() - t) * 1000.0)
+            search[f"{mode}_p50_ms"] = round(_percentile(latencies, 0.50), 2)
+            search[f"{mode}_p99_ms"] = round(_percentile(latencies, 0.99), 2)
+        out["search"] = search
+        return out
+    finally:
+        db.client.drop_database(db.name)
+
+
+def _run_worker(args) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_NAME=f"bench_{uuid.uuid4().hex[:8]}",
+            CHROMA_PATH=os.path.join(tmp, "chroma"),
+            FLAT_STORE_PATH=os.path.join(tmp, "vectors"),
+            BM25_PATH=os.path.join(tmp, "bm25"),
+            METRICS_FILE="",
+        )
+        proc = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.suite", "--worker",
+                "--tenders", str(args.tenders), "--seed", str(args.seed),
+                "--queries", str(args.queries), "--top-k", str(args.top_k),
+            ],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+    if proc.returncode != 0:
+        err = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+        return {"index": {"error": err}, "search": {"error": err}}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parents[1],
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _higher_is_better(metric: str) -> Optional[bool]:
+    """Direction of a metric by its suffix; None for counts and config echoes."""
+    if metric.endswith("_per_s"):
+        return True
+    if metric == "seconds" or metric.endswith(("_s", "_ms")):
+        return False
+    return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Metrics that got worse than `baseline` by more than `threshold` (a fraction)."""
+    regressions = []
+    for component, metrics in results.get("results", {}).items():
+        base = baseline.get("results", {}).get(component) or {}
+        for metric, value in metrics.items():
+            higher = _higher_is_better(metric)
+            old = base.get(metric)
+            if higher is None or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (old - value) / old if higher else (value - old) / old
+            if change > threshold:
+                regressions.append(f"{component}.{metric}: {old} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default=",".join(COMPONENTS), help=f"comma separated subset of {','.join(COMPONENTS)}")
+    parser.add_argument("--tenders", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-sizes", default="1,8,32,64,128")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--out", default=None, help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed regression, e.g. 0.15 = 15%%")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.tenders, args.seed, args.queries, args.top_k)))
+        return
+
+    only = [c.strip() for c in args.only.split(",") if c.strip()]
+    unknown = set(only) - set(COMPONENTS)
+    if unknown:
+        parser.error(f"unknown components: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, Any] = {}
+    if "chunk" in only:
+        results["chunk"] = bench_chunk(args.tenders, args.seed)
+    if "embed" in only:
+        try:
+            results["embed"] = bench_embed(args.tenders, args.seed, [int(b) for b in args.batch_sizes.split(",") if b.strip()])
+        except Exception as exc:
+            results["embed"] = {"error": f"{type(exc).__name__}: {exc}"}
+    if "index" in only or "search" in only:
+        for component, metrics in _run_worker(args).items():
+            if component in only:
+                results[component] = metrics
+    if "import" in only:
+        from benchmarks.bench_import import summary as import_summary
+
+        results["import"] = import_summary()
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": {"tenders": args.tenders, "seed": args.seed, "queries": args.queries, "top_k": args.top_k},
+        "results": results,
+    }
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{commit or 'worktree'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2) + "\n")
+
+    for component, metrics in results.items():
+        print(f"{component:>7}  " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+    print(f"wrote {out}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("params") != report["params"]:
+            print(f"warning: baseline params {baseline.get('params')} differ from {report['params']}")
+        regressions = compare(report, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,38 @@
 from __future__ import annotations
 
-from docling.document_converter import DocumentConverter
-from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 import os
+import threading
+import time
 import argparse
 
+from storage.doc_cost import (
+    COST_FIELD, FAST_LANE, SCHEDULE_SORT, SLOW_LANE, backfill_costs, doc_priority, index_cost, record_cost,
+)
+from storage.mongo import get_db
+from utils.metrics import DOCLING_SECONDS_PER_PAGE, register_mongo_metrics, span, start_file_exporter
+
 load_dotenv()
 
-mongo_uri = os.getenv("MONGO_URI") or "mongodb://localhost:27017"
-db_name = os.getenv("DB_NAME", "tender_db")
+_converter = None
+_converter_lock = threading.Lock()
 
-client = MongoClient(mongo_uri)
-db = client[db_name]
 
-docling_outputs = db["docling_outputs"]
-converter = DocumentConverter()
+def get_converter():
+    """
+    The process-wide Docling converter, built on first use. Importing docling
+    and loading its layout/OCR models takes seconds, so it is not done at
+    import time; the daemon's workers and the profile worker share it.
+    """
+    global _converter
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                from docling.document_converter import DocumentConverter
+
+                _converter = DocumentConverter()
+    return _converter
 
 
 def _serialize_docling_value(value):
@@ -38,11 +54,133 @@ def _serialize_docling_value(value):
     return str(value)
 
 
-def process_pending_documents(collection_name: str, limit: int = 10):
+def _page_count(result) -> int:
+    pages = getattr(result, "pages", None)
+    if pages:
+        return len(pages)
+    num_pages = getattr(result.document, "num_pages", None)
+    return int(num_pages()) if callable(num_pages) else 0
+
+
+def process_document(documents, doc) -> bool:
+    """
+    Run Docling for one pending document record and store the output.
+    Returns True when a docling_outputs record is ready for indexing.
+    """
+    with span(
+        "docling",
+        document_id=doc["_id"],
+        tender_id=doc.get("tender_id"),
+        profile_id=doc.get("profile_id"),
+        doc_type=doc.get("doc_type", "tender"),
+    ):
+        return _process_document(documents, doc)
+
+
+def _process_document(documents, doc) -> bool:
+    document_id = doc["_id"]
+    pdf_path = doc.get("local_path")
+
+    if not pdf_path:
+        print(f"❌ Missing local_path for document_id={document_id}")
+        documents.update_one({"_id": document_id}, {"$set": {"docling_status": "failed"}})
+        return False
+
+    doc_type = doc.get("doc_type", "tender")  # IMPORTANT
+    tender_id = doc.get("tender_id") if doc_type == "tender" else None
+    profile_id = doc.get("profile_id") if doc_type == "profile" else None
+    source = doc.get("source")
+    db = documents.database
+    docling_outputs = db["docling_outputs"]
+
+    # If already processed, mark done and skip
+    if docling_outputs.find_one({"document_id": document_id}, {"_id": 1}):
+        documents.update_one({"_id": document_id}, {"$set": {"docling_status": "done"}})
+        print(f"Skipping already processed doc: {pdf_path}")
+        return False
+
+    print(f"📄 Docling ({doc_type}) → {pdf_path}")
+
+    try:
+        with span("docling_convert") as convert_span:
+            start = time.perf_counter()
+            result = get_converter().convert(pdf_path)
+            pages = _page_count(result)
+            convert_span.set(pages=pages)
+        seconds = time.perf_counter() - start
+        DOCLING_SECONDS_PER_PAGE.labels(doc_type).observe(seconds / max(pages, 1))
+
+        # Cost ledger: actual seconds next to what the pre-pass predicted
+        cost = doc.get(COST_FIELD) or {}
+        record_cost(
+            db, document_id, "docling", seconds,
+            collection=documents.name,
+            doc_type=doc_type,
+            pages=pages or cost.get("pages"),
+            size_bytes=cost.get("size_bytes"),
+            has_text_layer=cost.get("has_text_layer"),
+            predicted_docling_s=cost.get("predicted_s"),
+        )
+
+        text = result.document.export_to_text()
+        tables_value = getattr(result.document, "tables", None)
+        sections_value = getattr(result.document, "sections", None)
+
+        docling_outputs.update_one(
+            {"document_id": document_id},
+            {
+                "$set": {
+                    "doc_type": doc_type,           # ✅ key fix
+                    "tender_id": tender_id,
+                    "profile_id": profile_id,
+                    "source": source,
+                    "document_id": document_id,
+                    # filterable tender metadata, carried through to the index
+                    "document_type": doc.get("document_type"),
+                    "published_at": doc.get("published_at"),
+                    "closing_at": doc.get("closing_at"),
+                    "text": text,
+                    "tables": _serialize_docling_value(tables_value),
+                    "sections": _serialize_docling_value(sections_value),
+                    "extracted_at": datetime.now(timezone.utc),
+                    "docling_version": "v1",
+                    # reset index flags on fresh extract
+                    "indexed": False,
+                    # indexing queue order (storage/doc_cost.py)
+                    "priority": doc_priority(doc),
+                    "index_cost": index_cost(len(text)),
+                },
+                "$unset": {
+                    "indexed_at": "",
+                    "chunk_count": "",
+                    "index_error": "",
+                    "failed_at": "",
+                    "index_attempts": "",
+                },
+            },
+            upsert=True,
+        )
+
+        documents.update_one({"_id": document_id}, {"$set": {"docling_status": "done"}})
+        print("✅ Docling success")
+        return True
+
+    except Exception as e:
+        documents.update_one({"_id": document_id}, {"$set": {"docling_status": "failed"}})
+        print("❌ Docling failed:", e)
+        return False
+
+
+def process_pending_documents(collection_name: str, limit: int = 10, lane: str = "all"):
     """
     Process PDFs that are not yet passed through Docling.
     Supports doc_type separation (tender/profile/etc).
+    limit=0 processes every pending document.
+
+    Highest priority, then cheapest predicted cost first; lane="fast" or
+    "slow" restricts the run to one side of the slow-lane threshold.
     """
+    db = get_db()
     documents = db[collection_name]
 
     pending_query = {"docling_status": "pending"}
@@ -50,78 +188,32 @@ def process_pending_documents(collection_name: str, limit: int = 10):
         print(f"No pending documents to process in {collection_name}.")
         return
 
-    pending_docs = documents.find(pending_query, limit=limit)
+    # Pre-pass for rows written before costs existed (page count / size / text layer)
+    probed = backfill_costs(db, collection_name)
+    if probed:
+        print(f"Probed {probed} pending documents")
 
-    for doc in pending_docs:
-        document_id = doc["_id"]
-        pdf_path = doc.get("local_path")
-
-        if not pdf_path:
-            print(f"❌ Missing local_path for document_id={document_id}")
-            documents.update_one({"_id": document_id}, {"$set": {"docling_status": "failed"}})
-            continue
-
-        doc_type = doc.get("doc_type", "tender")  # IMPORTANT
-        tender_id = doc.get("tender_id") if doc_type == "tender" else None
-        profile_id = doc.get("profile_id") if doc_type == "profile" else None
-        source = doc.get("source")
-
-        # If already processed, mark done and skip
-        if docling_outputs.find_one({"document_id": document_id}, {"_id": 1}):
-            documents.update_one({"_id": document_id}, {"$set": {"docling_status": "done"}})
-            print(f"Skipping already processed doc: {pdf_path}")
-            continue
-
-        print(f"📄 Docling ({doc_type}) → {pdf_path}")
-
-        try:
-            result = converter.convert(pdf_path)
-
-            tables_value = getattr(result.document, "tables", None)
-            sections_value = getattr(result.document, "sections", None)
-
-            docling_outputs.update_one(
-                {"document_id": document_id},
-                {
-                    "$set": {
-                        "doc_type": doc_type,           # ✅ key fix
-                        "tender_id": tender_id,
-                        "profile_id": profile_id,
-                        "source": source,
-                        "document_id": document_id,
-                        "text": result.document.export_to_text(),
-                        "tables": _serialize_docling_value(tables_value),
-                        "sections": _serialize_docling_value(sections_value),
-                        "extracted_at": datetime.now(timezone.utc),
-                        "docling_version": "v1",
-                        # reset index flags on fresh extract
-                        "indexed": False,
-                    },
-                    "$unset": {
-                        "indexed_at": "",
-                        "chunk_count": "",
-                        "index_error": "",
-                        "failed_at": "",
-                    },
-                },
-                upsert=True,
-            )
+    if lane == SLOW_LANE:
+        pending_query[f"{COST_FIELD}.lane"] = SLOW_LANE
+    elif lane == FAST_LANE:
+        pending_query[f"{COST_FIELD}.lane"] = {"$ne": SLOW_LANE}
 
-            documents.update_one({"_id": document_id}, {"$set": {"docling_status": "done"}})
-            print("✅ Docling success")
+    pending_docs = documents.find(pending_query, limit=limit).sort(SCHEDULE_SORT)
 
-        except Exception as e:
-            documents.update_one({"_id": document_id}, {"$set": {"docling_status": "failed"}})
-            print("❌ Docling failed:", e)
+    for doc in pending_docs:
+        process_document(documents, doc)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--collection", default=os.getenv("DOCS_COLLECTION", "tender_documents"))
     parser.add_argument("--limit", type=int, default=int(os.getenv("DOCLING_LIMIT", "10")))
+    parser.add_argument("--lane", choices=("all", FAST_LANE, SLOW_LANE), default="all", help="slow = huge documents only")
     args = parser.parse_args()
 
-    process_pending_documents(collection_name=args.collection, limit=args.limit)
+    register_mongo_metrics()
+    start_file_exporter()
+    process_pending_documents(collection_name=args.collection, limit=args.limit, lane=args.lane)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,396 @@
+# embeddings/bm25_index.py
+#
+# Compact on-disk BM25 index over the same chunks the tender indexer writes
+# to Chroma, for exact-token matches (reference numbers, item codes, product
+# names) that MiniLM vectors handle poorly.
+#
+# Layout (log-structured, one writer):
+#   <path>/manifest.json           segments + per-segment tombstones (readers)
+#   <path>/live.json               document_id -> segment (writer only)
+#   <path>/seg-000001/terms.json   term -> [offset, length] into postings
+#   <path>/seg-000001/postings.npy uint32 local doc numbers   (memory-mapped)
+#   <path>/seg-000001/tfs.npy      uint16 term frequencies    (memory-mapped)
+#   <path>/seg-000001/doc_lens.npy uint32 doc lengths         (memory-mapped)
+#   <path>/seg-000001/docs.json    [chunk_id, tender_id, document_id] per doc
+#
+# Every commit writes a new immutable segment; re-indexing a document
+# tombstones its chunks in older segments. Small segments are merged once
+# there are more than BM25_MAX_SEGMENTS.
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import threading
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_BM25_ROOT = os.getenv(
+    "BM25_PATH",
+    str(Path(__file__).resolve().parents[1] / "data" / "bm25"),
+)
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_MAX_SEGMENTS = int(os.getenv("BM25_MAX_SEGMENTS", "16"))
+BM25_MERGE_FACTOR = int(os.getenv("BM25_MERGE_FACTOR", "8"))
+
+# Keeps reference numbers / item codes whole: "f.no.25011/1/2023", "item-12"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[./\-][a-z0-9]+)*")
+_PARTS = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall "
+    "should that the this to was were will with which all any may not no "
+    "such other than be been being into per".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound codes also emit their parts."""
+    out: List[str] = []
+    for tok in _TOKEN.findall(text.lower()):
+        if tok not in _STOPWORDS:
+            out.append(tok)
+        if any(c in tok for c in "./-"):
+            out.extend(p for p in _PARTS.findall(tok) if p not in _STOPWORDS)
+    return out
+
+
+def extract_keywords(texts: Iterable[str], top_n: int = 64) -> List[List]:
+    """
+    Most frequent informative terms of a text collection, as [term, count]
+    pairs (a list, since terms may contain '.' which Mongo keys can't).
+    Used as the lexical query for a company profile.
+    """
+    counts: Counter = Counter()
+    for text in texts:
+        counts.update(t for t in tokenize(text or "") if len(t) > 2 and not t.isdigit())
+    return [[term, count] for term, count in counts.most_common(top_n)]
+
+
+def _write_json_atomic(path: Path, payload) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _load_json(path: Path, default):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _load_manifest(root: Path) -> dict:
+    return _load_json(root / "manifest.json", {"version": 0, "next_seq": 1, "segments": {}})
+
+
+def _build_segment(path: Path, docs: Sequence[Tuple[str, Optional[str], str]], token_lists: Sequence[List[str]]) -> None:
+    postings_by_term: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    doc_lens = np.zeros(len(docs), dtype=np.uint32)
+    for i, tokens in enumerate(token_lists):
+        doc_lens[i] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            postings_by_term[term].append((i, tf))
+    _write_segment(path, docs, doc_lens, postings_by_term)
+
+
+def _write_segment(path: Path, docs, doc_lens: np.ndarray, postings_by_term) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    terms: Dict[str, List[int]] = {}
+    total = sum(len(p) for p in postings_by_term.values())
+    postings = np.empty(total, dtype=np.uint32)
+    tfs = np.empty(total, dtype=np.uint16)
+    offset = 0
+    for term in sorted(postings_by_term):
+        # list of (doc, tf) pairs, or an (n, 2) array from a merge
+        arr = np.asarray(postings_by_term[term], dtype=np.int64).reshape(-1, 2)
+        n = len(arr)
+        terms[term] = [offset, n]
+        postings[offset : offset + n] = arr[:, 0]
+        tfs[offset : offset + n] = np.minimum(arr[:, 1], 65535)
+        offset += n
+
+    np.save(tmp / "postings.npy", postings)
+    np.save(tmp / "tfs.npy", tfs)
+    np.save(tmp / "doc_lens.npy", doc_lens.astype(np.uint32))
+    _write_json_atomic(tmp / "terms.json", terms)
+    _write_json_atomic(tmp / "docs.json", [list(d) for d in docs])
+    os.replace(tmp, path)
+
+
+class _Segment:
+    def __init__(self, path: Path) -> None:
+        self.name = path.name
+        with open(path / "terms.json", encoding="utf-8") as f:
+            self.terms: Dict[str, List[int]] = json.load(f)
+        with open(path / "docs.json", encoding="utf-8") as f:
+            self.docs: List[List] = json.load(f)
+        self.postings = np.load(path / "postings.npy", mmap_mode="r")
+        self.tfs = np.load(path / "tfs.npy", mmap_mode="r")
+        self.doc_lens = np.load(path / "doc_lens.npy", mmap_mode="r")
+        self.document_ids = np.asarray([d[2] for d in self.docs], dtype=object)
+        self.alive = np.ones(len(self.docs), dtype=bool)
+        self._tombstones = 0
+
+    def apply_tombstones(self, deleted: List[str]) -> None:
+        if len(deleted) == self._tombstones:
+            return
+        self.alive = ~np.isin(self.document_ids, np.asarray(deleted, dtype=object))
+        self._tombstones = len(deleted)
+
+
+class Bm25Index:
+    """Reader: reloads segments when the manifest changes on disk."""
+
+    def __init__(self, path: str) -> None:
+        self.root = Path(path)
+        self._lock = threading.Lock()
+        self._mtime: Optional[Tuple[int, int]] = None
+        self._segments: Dict[str, _Segment] = {}
+        self._n_docs = 0
+        self._avgdl = 0.0
+
+    def _refresh(self) -> None:
+        try:
+            st = (self.root / "manifest.json").stat()
+        except FileNotFoundError:
+            self._segments, self._n_docs, self._mtime = {}, 0, None
+            return
+        mtime = (st.st_mtime_ns, st.st_size)
+        if mtime == self._mtime:
+            return
+
+        manifest = _load_manifest(self.root)
+        segments: Dict[str, _Segment] = {}
+        for name, info in manifest["segments"].items():
+            seg = self._segments.get(name)
+            if seg is None:
+                try:
+                    seg = _Segment(self.root / name)
+                except FileNotFoundError:
+                    # Merged away between reading the manifest and the segment
+                    return
+            seg.apply_tombstones(info.get("deleted", []))
+            segments[name] = seg
+
+        n_docs = sum(int(s.alive.sum()) for s in segments.values())
+        total_len = sum(float(np.asarray(s.doc_lens)[s.alive].sum()) for s in segments.values())
+        self._segments = segments
+        self._n_docs = n_docs
+        self._avgdl = total_len / n_docs if n_docs else 0.0
+        self._mtime = mtime
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return {"segments": len(self._segments), "docs": self._n_docs, "avgdl": round(self._avgdl, 2)}
+
+    def search(self, query, top_n: int = 100) -> List[Tuple[str, dict, float]]:
+        """
+        BM25 over all live chunks. `query` is text, a list of terms, or
+        [term, weight] pairs. Returns [(chunk_id, {tender_id, document_id}, score)].
+        """
+        if isinstance(query, str):
+            weights = Counter(tokenize(query))
+        else:
+            weights = Counter()
+            for item in query:
+                if isinstance(item, (list, tuple)):
+                    weights[str(item[0])] += float(item[1])
+                else:
+                    weights[str(item)] += 1.0
+        if not weights:
+            return []
+
+        with self._lock:
+            self._refresh()
+            segments = list(self._segments.values())
+            n_docs, avgdl = self._n_docs, self._avgdl
+        if not n_docs:
+            return []
+
+        df: Counter = Counter()
+        for seg in segments:
+            for term in weights:
+                entry = seg.terms.get(term)
+                if entry:
+                    df[term] += entry[1]
+        idf = {t: float(np.log(1.0 + (n_docs - d + 0.5) / (d + 0.5))) for t, d in df.items()}
+
+        candidates: List[Tuple[float, str, dict]] = []
+        for seg in segments:
+            scores = np.zeros(len(seg.docs), dtype=np.float32)
+            for term, qw in weights.items():
+                entry = seg.terms.get(term)
+                if not entry:
+                    continue
+                off, length = entry
+                docs = np.asarray(seg.postings[off : off + length], dtype=np.int64)
+                tf = np.asarray(seg.tfs[off : off + length], dtype=np.float32)
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * np.asarray(seg.doc_lens[docs], dtype=np.float32) / avgdl)
+                scores[docs] += qw * idf[term] * tf * (BM25_K1 + 1.0) / (tf + norm)
+            scores[~seg.alive] = 0.0
+
+            hit = np.flatnonzero(scores)
+            if not len(hit):
+                continue
+            if len(hit) > top_n:
+                hit = hit[np.argpartition(-scores[hit], top_n - 1)[:top_n]]
+            for i in hit:
+                chunk_id, tender_id, document_id = seg.docs[i]
+                candidates.append((float(scores[i]), chunk_id, {"tender_id": tender_id, "document_id": document_id}))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [(chunk_id, meta, score) for score, chunk_id, meta in candidates[:top_n]]
+
+
+class Bm25Writer:
+    """
+    One writer per index per process (the tender indexer). Indexing threads
+    use add_document(), which writes a document's chunks as one segment;
+    add()/commit() buffer across calls and suit single-threaded bulk loads.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._docs: List[Tuple[str, Optional[str], str]] = []
+        self._tokens: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, chunk_id: str, text: str, tender_id: Optional[str], document_id: str) -> None:
+        with self._lock:
+            self._docs.append((chunk_id, tender_id, document_id))
+            self._tokens.append(tokenize(text or ""))
+
+    def add_document(
+        self, document_id: str, tender_id: Optional[str], chunks: Sequence[Tuple[str, str]]
+    ) -> Optional[str]:
+        """
+        Write one document's (chunk_id, text) pairs as their own segment.
+        Buffering and committing under one lock matters: tombstones are per
+        document_id, so a commit from another thread that caught half of
+        this document's chunks would be tombstoned by this one.
+        """
+        docs = [(chunk_id, tender_id, document_id) for chunk_id, _ in chunks]
+        tokens = [tokenize(text or "") for _, text in chunks]
+        with self._lock:
+            return self._write_segment(docs, tokens)
+
+    def commit(self) -> Optional[str]:
+        """Write buffered chunks as a new segment; returns its name."""
+        with self._lock:
+            docs, tokens = self._docs, self._tokens
+            self._docs, self._tokens = [], []
+            return self._write_segment(docs, tokens)
+
+    def _write_segment(self, docs: List[Tuple[str, Optional[str], str]], tokens: List[List[str]]) -> Optional[str]:
+        # Caller holds self._lock
+        if not docs:
+            return None
+        manifest, live = self._load()
+        name = f"seg-{manifest['next_seq']:06d}"
+        _build_segment(self.root / name, docs, tokens)
+
+        for document_id in {d[2] for d in docs}:
+            self._tombstone(manifest, live, document_id)
+            live[document_id] = name
+        manifest["segments"][name] = {"docs": len(docs), "deleted": []}
+        manifest["next_seq"] += 1
+
+        merged: List[str] = []
+        if len(manifest["segments"]) > BM25_MAX_SEGMENTS:
+            by_size = sorted(manifest["segments"].items(), key=lambda kv: kv[1]["docs"] - len(kv[1]["deleted"]))
+            merged = [n for n, _ in by_size[: max(2, BM25_MERGE_FACTOR)]]
+            self._merge(manifest, live, merged)
+        self._save(manifest, live, merged)
+        return name
+
+    def delete_document(self, document_id: str) -> None:
+        with self._lock:
+            manifest, live = self._load()
+            if self._tombstone(manifest, live, document_id):
+                live.pop(document_id, None)
+                self._save(manifest, live, [])
+
+    def compact(self) -> None:
+        """Merge every segment into one, dropping tombstoned chunks."""
+        with self._lock:
+            manifest, live = self._load()
+            names = list(manifest["segments"])
+            if len(names) > 1 or any(s["deleted"] for s in manifest["segments"].values()):
+                self._merge(manifest, live, names)
+                self._save(manifest, live, names)
+
+    def _load(self) -> Tuple[dict, Dict[str, str]]:
+        return _load_manifest(self.root), _load_json(self.root / "live.json", {})
+
+    def _save(self, manifest: dict, live: Dict[str, str], dropped_segments: List[str]) -> None:
+        manifest["version"] += 1
+        _write_json_atomic(self.root / "live.json", live)
+        _write_json_atomic(self.root / "manifest.json", manifest)
+        # Unreferenced now; readers already holding memmaps keep working on POSIX
+        for name in dropped_segments:
+            shutil.rmtree(self.root / name, ignore_errors=True)
+
+    @staticmethod
+    def _tombstone(manifest: dict, live: Dict[str, str], document_id: str) -> bool:
+        previous = live.get(document_id)
+        if previous and previous in manifest["segments"]:
+            manifest["segments"][previous]["deleted"].append(document_id)
+            return True
+        return False
+
+    def _merge(self, manifest: dict, live: Dict[str, str], names: List[str]) -> None:
+        docs: List[List] = []
+        doc_lens: List[np.ndarray] = []
+        postings_by_term: Dict[str, List[np.ndarray]] = defaultdict(list)
+
+        for name in names:
+            seg = _Segment(self.root / name)
+            seg.apply_tombstones(manifest["segments"][name]["deleted"])
+            remap = np.full(len(seg.docs), -1, dtype=np.int64)
+            alive_idx = np.flatnonzero(seg.alive)
+            remap[alive_idx] = np.arange(len(docs), len(docs) + len(alive_idx))
+            docs.extend(seg.docs[i] for i in alive_idx)
+            doc_lens.append(np.asarray(seg.doc_lens)[alive_idx])
+
+            for term, (off, length) in seg.terms.items():
+                mapped = remap[np.asarray(seg.postings[off : off + length], dtype=np.int64)]
+                keep = mapped >= 0
+                if keep.any():
+                    tf = np.asarray(seg.tfs[off : off + length], dtype=np.int64)[keep]
+                    postings_by_term[term].append(np.stack([mapped[keep], tf], axis=1))
+
+        merged_name = f"seg-{manifest['next_seq']:06d}"
+        manifest["next_seq"] += 1
+        merged_postings = {term: np.concatenate(parts) for term, parts in postings_by_term.items()}
+        lens = np.concatenate(doc_lens) if doc_lens else np.zeros(0, dtype=np.uint32)
+        _write_segment(self.root / merged_name, docs, lens, merged_postings)
+
+        for name in names:
+            manifest["segments"].pop(name, None)
+        manifest["segments"][merged_name] = {"docs": len(docs), "deleted": []}
+        for document_id, seg_name in list(live.items()):
+            if seg_name in names:
+                live[document_id] = merged_name
+
+
+def index_path(name: str) -> str:
+    return os.path.join(DEFAULT_BM25_ROOT, name)
+
+
+@lru_cache(maxsize=8)
+def get_bm25_index(name: str = "tender_embeddings") -> Bm25Index:
+    return Bm25Index(index_path(name))
@@ -0,0 +1,76 @@
+# embeddings/centroids.py
+#
+# Multi-vector profiles: a company profile is summarised by a few k-means
+# centroids of its chunk embeddings instead of one mean vector, so each
+# capability of a multi-capability company keeps its own query vector.
+
+from __future__ import annotations
+
+import math
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+MAX_PROFILE_CENTROIDS = int(os.getenv("MAX_PROFILE_CENTROIDS", "8"))
+KMEANS_ITERATIONS = int(os.getenv("KMEANS_ITERATIONS", "25"))
+
+
+def _unit(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def choose_k(n_vectors: int, max_centroids: int = MAX_PROFILE_CENTROIDS) -> int:
+    """Rule of thumb k ≈ sqrt(n/2), capped."""
+    if n_vectors <= 0:
+        return 0
+    return max(1, min(max_centroids, n_vectors, round(math.sqrt(n_vectors / 2))))
+
+
+def kmeans_centroids(
+    vectors: Sequence[Sequence[float]],
+    max_centroids: int = MAX_PROFILE_CENTROIDS,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> Tuple[List[List[float]], List[int]]:
+    """
+    Spherical k-means (cosine) with k-means++ seeding.
+    Returns (unit-norm centroids, cluster sizes), largest cluster first, so
+    truncating the list keeps the dominant capabilities.
+    """
+    if len(vectors) == 0:
+        return [], []
+    data = _unit(np.asarray(vectors, dtype=np.float32))
+    n = data.shape[0]
+    k = choose_k(n, max_centroids)
+
+    rng = np.random.default_rng(seed)
+
+    # k-means++ seeding on cosine distance
+    centers = [data[rng.integers(n)]]
+    closest = 1.0 - data @ centers[0]
+    for _ in range(1, k):
+        weights = np.clip(closest, 0.0, None).astype(np.float64) ** 2
+        total = weights.sum()
+        idx = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centers.append(data[idx])
+        closest = np.minimum(closest, 1.0 - data @ data[idx])
+    centroids = np.stack(centers)
+
+    labels = np.zeros(n, dtype=np.int64)
+    for it in range(max(1, iterations)):
+        new_labels = np.argmax(data @ centroids.T, axis=1)
+        if it > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = data[labels == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _unit(centroids)
+
+    sizes = np.bincount(labels, minlength=k)
+    order = [c for c in np.argsort(-sizes) if sizes[c] > 0]
+    return [centroids[c].tolist() for c in order], [int(sizes[c]) for c in order]
@@ -2,11 +2,28 @@
 
 from __future__ import annotations
 
-from typing import List
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
 import re
 
 
 _SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+# Non-empty line, already stripped of surrounding whitespace
+_PARAGRAPH = re.compile(r"[^\S\n]*(\S(?:[^\n]*\S)?)")
+_WORD = re.compile(r"\S+")
+
+# (text, start offset in the normalized source)
+_Segment = Tuple[str, int]
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # char offset (inclusive) into the normalized text
+    end: int    # char offset (exclusive) into the normalized text
+
+
+def normalize_text(text: str) -> str:
+    """Normalize line endings + strip. Chunk offsets refer to this form."""
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip()
 
 
 def _tail_overlap(text: str, overlap_chars: int) -> str:
@@ -20,64 +37,168 @@ def _tail_overlap(text: str, overlap_chars: int) -> str:
     return tail.strip()
 
 
-def chunk_text(text: str, max_chars: int = 500, overlap_chars: int = 80) -> List[str]:
+def _tail_segments(segments: List[_Segment], overlap_len: int) -> List[_Segment]:
+    """
+    Map a suffix of " ".join(segments) (length overlap_len) back onto the
+    segments it came from, so the overlap keeps its source offsets.
+    """
+    out: List[_Segment] = []
+    remaining = overlap_len
+    for seg_text, seg_start in reversed(segments):
+        if remaining <= 0:
+            break
+        if len(seg_text) >= remaining:
+            cut = len(seg_text) - remaining
+            out.append((seg_text[cut:], seg_start + cut))
+            break
+        out.append((seg_text, seg_start))
+        remaining -= len(seg_text) + 1  # +1 for the joining space
+    out.reverse()
+    return out
+
+
+def _stripped_span(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def _sentence_spans(text: str, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    pos = start
+    for m in _SENTENCE_SPLIT.finditer(text, start, end):
+        yield pos, m.start()
+        pos = m.end()
+    yield pos, end
+
+
+def _hard_split(
+    text: str,
+    start: int,
+    end: int,
+    max_len: int,
+    length_fn: Optional[Callable[[str], int]],
+) -> Iterator[Tuple[int, int]]:
+    """Split an over-budget sentence: fixed char windows, or whole words in token mode."""
+    if length_fn is None:
+        for s in range(start, end, max_len):
+            yield s, min(s + max_len, end)
+        return
+
+    piece_start: Optional[int] = None
+    piece_end = start
+    used = 0
+    for m in _WORD.finditer(text, start, end):
+        n = length_fn(m.group())
+        if piece_start is not None and used + n > max_len:
+            yield piece_start, piece_end
+            piece_start, used = None, 0
+        if piece_start is None:
+            piece_start = m.start()
+        piece_end = m.end()
+        used += n
+    if piece_start is not None:
+        yield piece_start, piece_end
+
+
+def iter_chunks(
+    text: str,
+    max_len: int = 500,
+    overlap_chars: int = 80,
+    length_fn: Optional[Callable[[str], int]] = None,
+) -> Iterator[Chunk]:
     """
-    Production chunker:
+    Streaming chunker (single linear pass):
     - Prefers paragraph boundaries
     - If a paragraph is too long, splits by sentences
     - Adds a small overlap to preserve context across chunks
+
+    Budget is max_len characters by default. Pass length_fn (e.g.
+    TenderEmbedder.count_tokens) to budget in model tokens instead; pieces
+    are then assumed to join without extra tokens and the budget is never
+    exceeded (overlap is dropped when it would not fit).
     """
-    if not text or max_chars <= 0:
-        return []
-
-    # Normalize whitespace
-    text = text.replace("\r\n", "\n").replace("\r", "\n").strip()
-
-    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
-    chunks: List[str] = []
-    current = ""
-
-    def flush():
-        nonlocal current
-        if current.strip():
-            chunks.append(current.strip())
-        current = ""
-
-    def add_piece(piece: str):
-        nonlocal current
-        piece = piece.strip()
-        if not piece:
-            return
-
-        if not current:
-            current = piece
-            return
-
-        if len(current) + 1 + len(piece) <= max_chars:
-            current += " " + piece
+    if not text or max_len <= 0:
+        return
+
+    text = normalize_text(text)
+    measure = length_fn or len
+    sep_len = 0 if length_fn is not None else 1
+
+    segments: List[_Segment] = []
+    used = 0
+
+    def emit() -> Chunk:
+        joined = " ".join(seg for seg, _ in segments)
+        last_text, last_start = segments[-1]
+        return Chunk(joined, segments[0][1], last_start + len(last_text))
+
+    def add_piece(start: int, end: int, piece_len: int) -> Optional[Chunk]:
+        """Append text[start:end] (already stripped); returns a chunk when one is flushed."""
+        nonlocal segments, used
+        piece = text[start:end]
+
+        if not segments:
+            segments, used = [(piece, start)], piece_len
+            return None
+
+        if used + sep_len + piece_len <= max_len:
+            segments.append((piece, start))
+            used += sep_len + piece_len
+            return None
+
+        # flush current chunk and start new with overlap
+        chunk = emit()
+        overlap = _tail_overlap(chunk.text, overlap_chars)
+        overlap_len = measure(overlap) if overlap else 0
+        # The model truncates at its token limit, so in token mode the
+        # budget is hard: drop the overlap rather than overflow.
+        if length_fn is not None and overlap_len + sep_len + piece_len > max_len:
+            overlap = ""
+        if overlap:
+            segments = _tail_segments(segments, len(overlap))
+            used = overlap_len + sep_len + piece_len
         else:
-            # flush current chunk and start new with overlap
-            prev = current
-            flush()
-            overlap = _tail_overlap(prev, overlap_chars)
-            current = (overlap + " " + piece).strip() if overlap else piece
+            segments, used = [], piece_len
+        segments.append((piece, start))
+        return chunk
+
+    for m in _PARAGRAPH.finditer(text):
+        p_start, p_end = m.span(1)
+        para_len = measure(m.group(1))
 
-    for para in paragraphs:
         # If para itself is too long, break it down by sentences
-        if len(para) > max_chars:
-            sentences = _SENTENCE_SPLIT.split(para)
-            for s in sentences:
-                # if even a sentence is huge, hard-split it
-                if len(s) > max_chars:
-                    start = 0
-                    while start < len(s):
-                        part = s[start : start + max_chars]
-                        add_piece(part)
-                        start += max_chars
-                else:
-                    add_piece(s)
-        else:
-            add_piece(para)
+        if para_len <= max_len:
+            chunk = add_piece(p_start, p_end, para_len)
+            if chunk is not None:
+                yield chunk
+            continue
+
+        for s_start, s_end in _sentence_spans(text, p_start, p_end):
+            sentence_len = measure(text[s_start:s_end])
+            if sentence_len <= max_len:
+                chunk = add_piece(s_start, s_end, sentence_len)
+                if chunk is not None:
+                    yield chunk
+                continue
+
+            # if even a sentence is huge, hard-split it
+            for h_start, h_end in _hard_split(text, s_start, s_end, max_len, length_fn):
+                span = _stripped_span(text, h_start, h_end)
+                if span is None:
+                    continue
+                chunk = add_piece(span[0], span[1], measure(text[span[0] : span[1]]))
+                if chunk is not None:
+                    yield chunk
+
+    if segments:
+        yield emit()
+
 
-    flush()
-    return chunks
+def chunk_text(text: str, max_chars: int = 500, overlap_chars: int = 80) -> List[str]:
+    """
+    Production chunker (character budget). See iter_chunks for the
+    streaming / token-budgeted variant.
+    """
+    return [c.text for c in iter_chunks(text, max_len=max_chars, overlap_chars=overlap_chars)]
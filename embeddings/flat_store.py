@@ -0,0 +1,594 @@
+# embeddings/flat_store.py
+#
+# In-process vector store with the same call surface as a Chroma collection
+# (upsert / get / query / delete / count).
+#
+#   <path>/vectors.f32   append-only float32 rows, read through np.memmap
+#   <path>/meta.sqlite   row -> id, document, JSON metadata, alive flag
+#   <path>/hnsw.bin      optional hnswlib graph over the same rows
+#
+# Writes never move a row: re-upserting an id appends a new row and marks the
+# old one dead, so readers in other processes only ever see the file grow.
+# Writers in several processes (job workers, the API's in-process workers)
+# serialize on an flock of <path>/write.lock, held from reading the row count
+# through the append to the SQLite commit. A torn tail left by a crashed
+# append is cut off before the next one, so rows stay aligned; only the
+# writer saves the HNSW graph.
+# Filtered queries scan the eligible rows exactly; unfiltered queries use the
+# HNSW graph when enabled (VECTOR_BACKEND=hnsw and hnswlib installed).
+#
+# Compressed mode (VECTOR_COMPRESSED=1, after `python -m embeddings.quantization`)
+# scans PCA+int8 codes in <path>/codes.i8 and rescores the best candidates
+# against vectors.f32.
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from embeddings.quantization import COMPRESS_DIMS, COMPRESS_SAMPLE, PcaInt8Codec, blocked_top_k, compressed_top_k
+except ModuleNotFoundError:
+    from quantization import COMPRESS_DIMS, COMPRESS_SAMPLE, PcaInt8Codec, blocked_top_k, compressed_top_k
+
+try:
+    import hnswlib
+except ImportError:  # optional
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: writers are only serialized within one process
+    fcntl = None
+
+# False when concurrent writer processes would corrupt a store
+INTERPROCESS_LOCKING = fcntl is not None
+
+FLAT_SCAN_BLOCK = int(os.getenv("FLAT_SCAN_BLOCK", "65536"))
+VECTOR_COMPRESSED = os.getenv("VECTOR_COMPRESSED", "0") == "1"
+# Metadata fields with a SQLite expression index (filter pushdown)
+FLAT_INDEXED_FIELDS = [
+    f.strip()
+    for f in os.getenv(
+        "FLAT_INDEXED_FIELDS", "document_id,profile_id,source,document_type,published_ts,closing_ts"
+    ).split(",")
+    if f.strip()
+]
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "128"))
+HNSW_SAVE_EVERY = int(os.getenv("HNSW_SAVE_EVERY", "50000"))
+# Eligible-row masks per distinct `where`, kept until the next write
+WHERE_MASK_CACHE = int(os.getenv("FLAT_WHERE_MASK_CACHE", "64"))
+
+_SQL_VARS = 900
+_FIELD = re.compile(r"^[A-Za-z0-9_]+$")
+_COMPARE = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+SPACES = ("cosine", "ip")
+
+logger = logging.getLogger(__name__)
+
+
+def _meta_expr(field: str) -> str:
+    if not _FIELD.match(field):
+        raise ValueError(f"Invalid metadata field {field!r}")
+    return f"json_extract(metadata, '$.{field}')"
+
+
+def where_to_sql(where: dict) -> Tuple[str, list]:
+    """Translate a Chroma `where` filter into a SQL condition + params."""
+    clauses: List[str] = []
+    params: list = []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(w) for w in cond]
+            if not parts:
+                continue
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, p in parts:
+                params.extend(p)
+            continue
+
+        expr = _meta_expr(key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, value in cond.items():
+            if op in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if op == "$in" else "1")
+                    continue
+                marks = ",".join("?" * len(values))
+                clauses.append(f"{expr} {'IN' if op == '$in' else 'NOT IN'} ({marks})")
+                params.extend(values)
+            elif op in _COMPARE:
+                clauses.append(f"{expr} {_COMPARE[op]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported where operator {op!r}")
+    return (" AND ".join(clauses) or "1"), params
+
+
+def _unit(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _truncate_to(path: Path, n_bytes: int) -> None:
+    """Drop a partial row a crashed or failed (ENOSPC) append left at the end of `path`."""
+    if path.exists() and path.stat().st_size > n_bytes:
+        os.truncate(path, n_bytes)
+
+
+def _chunked(items: Sequence, size: int = _SQL_VARS) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class FlatVectorStore:
+    """
+    Exact (flat) or HNSW vector search over memory-mapped rows. Writers in
+    any number of processes take turns on write.lock; readers never block.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        space: str = "cosine",
+        use_hnsw: bool = False,
+        compressed: Optional[bool] = None,
+    ) -> None:
+        if space not in SPACES:
+            raise ValueError(f"Unsupported space {space!r}; expected one of {SPACES}")
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.name = self.root.name
+        self.space = space
+        self._vectors_path = self.root / "vectors.f32"
+        self._hnsw_path = self.root / "hnsw.bin"
+        self._codec_path = self.root / "codec.npz"
+        self._codes_path = self.root / "codes.i8"
+        self._lock_path = self.root / "write.lock"
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(str(self.root / "meta.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT NOT NULL,
+                alive INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_chunks_live_id ON chunks(id) WHERE alive = 1;
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value);
+            """
+        )
+        for field in FLAT_INDEXED_FIELDS:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_meta_{field} ON chunks({_meta_expr(field)}) WHERE alive = 1"
+            )
+        self._conn.commit()
+
+        self.dim: Optional[int] = self._state("dim")
+        stored_space = self._state("space")
+        if stored_space and stored_space != space:
+            raise ValueError(f"{path} was built with space={stored_space!r}, not {space!r}")
+
+        self.use_hnsw = use_hnsw and hnswlib is not None
+        if use_hnsw and hnswlib is None:
+            logger.warning("hnswlib is not installed; %s falls back to flat search", self.name)
+        self._hnsw = None
+        self._hnsw_unsaved = 0
+
+        # Codes are maintained whenever a codec exists; `compressed` only
+        # decides whether queries use them
+        self.compressed = VECTOR_COMPRESSED if compressed is None else compressed
+        self._codec: Optional[PcaInt8Codec] = None
+        self._codec_mtime: Optional[int] = None
+        self._codes = np.zeros((0, 0), dtype=np.int8)
+
+        self._version: Any = object()
+        self._vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._masks: Dict[str, np.ndarray] = {}
+
+    # --- state --------------------------------------------------------------
+
+    def _state(self, key: str) -> Any:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: Any) -> None:
+        self._conn.execute(
+            "INSERT INTO state(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _bump_version(self) -> None:
+        self._conn.execute(
+            "INSERT INTO state(key, value) VALUES ('version', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+
+    def _file_rows(self) -> int:
+        if not self.dim or not self._vectors_path.exists():
+            return 0
+        return self._vectors_path.stat().st_size // (4 * self.dim)
+
+    def _refresh(self) -> None:
+        """Re-map vectors and reload the alive mask after any committed write."""
+        version = self._state("version")
+        if version == self._version:
+            return
+        self.dim = self.dim or self._state("dim")
+        n_rows = self._file_rows()
+        if n_rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+        alive = np.zeros(n_rows, dtype=bool)
+        rows = np.fromiter(
+            (r for (r,) in self._conn.execute("SELECT row FROM chunks WHERE alive = 1")), dtype=np.int64
+        )
+        alive[rows[rows < n_rows]] = True
+        self._alive = alive
+        self._masks = {}
+        self._version = version
+        self._load_codes()
+        if self.use_hnsw:
+            self._sync_hnsw()
+
+    # --- writes -------------------------------------------------------------
+
+    @contextmanager
+    def _writing(self):
+        """
+        Exclusive write access across threads and processes. Another process
+        may have written since our last look, so the dimension is re-read
+        and every row number is derived from the file size inside the lock.
+        """
+        with self._lock:
+            if fcntl is None:
+                self.dim = self.dim or self._state("dim")
+                yield
+                return
+            with open(self._lock_path, "a+b") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    self.dim = self.dim or self._state("dim")
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[Sequence[Optional[str]]] = None,
+        metadatas: Optional[Sequence[Optional[dict]]] = None,
+    ) -> None:
+        ids = list(ids)
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate ids in upsert")
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError("embeddings must be one vector per id")
+        if not ids:
+            return
+        if self.space == "cosine":
+            vectors = _unit(vectors)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+
+        with self._writing():
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._set_state("dim", self.dim)
+                self._set_state("space", self.space)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} != store dimension {self.dim}")
+
+            # Vectors first: rows not yet in SQLite are never alive
+            start = self._file_rows()
+            _truncate_to(self._vectors_path, start * 4 * self.dim)
+            with open(self._vectors_path, "ab") as fh:
+                fh.write(np.ascontiguousarray(vectors).tobytes())
+            if self._codec_path.exists():
+                self._append_codes()
+
+            for batch in _chunked(ids):
+                self._conn.execute(
+                    f"UPDATE chunks SET alive = 0 WHERE alive = 1 AND id IN ({','.join('?' * len(batch))})",
+                    list(batch),
+                )
+            self._conn.executemany(
+                "INSERT INTO chunks(row, id, document, metadata, alive) VALUES (?, ?, ?, ?, 1)",
+                [
+                    (start + i, cid, doc, json.dumps(meta or {}))
+                    for i, (cid, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                ],
+            )
+            self._bump_version()
+            self._conn.commit()
+            if self.use_hnsw:
+                self._refresh()
+                if self._hnsw_unsaved >= HNSW_SAVE_EVERY or not self._hnsw_path.exists():
+                    self._save_hnsw()
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None) -> None:
+        if ids is None and where is None:
+            raise ValueError("delete() needs ids or where")
+        with self._writing():
+            sql, params = where_to_sql(where) if where else ("1", [])
+            if ids is None:
+                self._conn.execute(f"UPDATE chunks SET alive = 0 WHERE alive = 1 AND {sql}", params)
+            else:
+                for batch in _chunked(list(ids)):
+                    self._conn.execute(
+                        f"UPDATE chunks SET alive = 0 WHERE alive = 1 AND id IN ({','.join('?' * len(batch))}) AND {sql}",
+                        list(batch) + params,
+                    )
+            self._bump_version()
+            self._conn.commit()
+
+    # --- reads --------------------------------------------------------------
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(memory-mapped vectors, alive mask) as of the last committed write."""
+        with self._lock:
+            self._refresh()
+            return self._vectors, self._alive
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def _select(self, sql: str, params: list) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("metadatas", "documents"),
+    ) -> Dict[str, Any]:
+        where_sql, params = where_to_sql(where) if where else ("1", [])
+        base = f"SELECT row, id, document, metadata FROM chunks WHERE alive = 1 AND {where_sql}"
+        if ids is None:
+            page = " LIMIT ? OFFSET ?" if limit is not None or offset else ""
+            page_params = [limit if limit is not None else -1, offset or 0] if page else []
+            rows = self._select(base + " ORDER BY row" + page, params + page_params)
+        else:
+            rows = []
+            for batch in _chunked(list(ids)):
+                rows.extend(
+                    self._select(base + f" AND id IN ({','.join('?' * len(batch))}) ORDER BY row", params + list(batch))
+                )
+            rows = rows[offset or 0 :][:limit] if limit is not None else rows[offset or 0 :]
+        return self._rows_result(rows, include)
+
+    def _rows_result(self, rows: List[tuple], include: Sequence[str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"ids": [r[1] for r in rows]}
+        if "documents" in include:
+            out["documents"] = [r[2] for r in rows]
+        if "metadatas" in include:
+            out["metadatas"] = [json.loads(r[3]) for r in rows]
+        if "embeddings" in include:
+            with self._lock:
+                self._refresh()
+                vectors = self._vectors
+            out["embeddings"] = np.asarray(vectors[[r[0] for r in rows]]) if rows else np.zeros((0, self.dim or 0), np.float32)
+        return out
+
+    def _where_mask(self, where: dict, n_rows: int) -> np.ndarray:
+        key = json.dumps(where, sort_keys=True, default=str)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None and len(mask) == n_rows:
+                return mask
+
+        sql, params = where_to_sql(where)
+        mask = np.zeros(n_rows, dtype=bool)
+        rows = np.fromiter(
+            (r for (r,) in self._select(f"SELECT row FROM chunks WHERE alive = 1 AND {sql}", params)), dtype=np.int64
+        )
+        mask[rows[rows < n_rows]] = True
+        with self._lock:
+            if len(self._masks) >= WHERE_MASK_CACHE:
+                self._masks.pop(next(iter(self._masks)))
+            self._masks[key] = mask
+        return mask
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Sequence[str] = ("metadatas", "documents", "distances"),
+    ) -> Dict[str, Any]:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if self.space == "cosine":
+            queries = _unit(queries)
+
+        with self._lock:
+            self._refresh()
+            vectors, alive = self._vectors, self._alive
+        mask = alive if where is None else self._where_mask(where, len(alive))
+        n = min(int(n_results), int(mask.sum()))
+
+        found = None
+        if n > 0 and where is None and self.use_hnsw:
+            found = self._hnsw_search(queries, n, alive)
+        if n > 0 and found is None:
+            with self._lock:
+                codec, codes = (self._codec, self._codes) if self.compressed else (None, None)
+            if codec is not None:
+                found = compressed_top_k(queries, codec, codes, vectors, mask, n)
+            else:
+                found = blocked_top_k(queries, vectors, mask, n, FLAT_SCAN_BLOCK)
+        if n <= 0:
+            found = (np.zeros((len(queries), 0), np.int64), np.zeros((len(queries), 0), np.float32))
+        return self._query_result(*found, include)
+
+    def _query_result(self, rows: np.ndarray, sims: np.ndarray, include: Sequence[str]) -> Dict[str, Any]:
+        wanted = sorted({int(r) for r in rows.ravel() if r >= 0})
+        by_row: Dict[int, tuple] = {}
+        for batch in _chunked(wanted):
+            for rec in self._select(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})", list(batch)
+            ):
+                by_row[rec[0]] = rec
+
+        out: Dict[str, Any] = {"ids": []}
+        for key in ("documents", "metadatas", "distances", "embeddings"):
+            if key in include:
+                out[key] = []
+        with self._lock:
+            vectors = self._vectors
+        for q_rows, q_sims in zip(rows, sims):
+            hits = [(int(r), float(s)) for r, s in zip(q_rows, q_sims) if r >= 0 and int(r) in by_row]
+            out["ids"].append([by_row[r][1] for r, _ in hits])
+            if "documents" in out:
+                out["documents"].append([by_row[r][2] for r, _ in hits])
+            if "metadatas" in out:
+                out["metadatas"].append([json.loads(by_row[r][3]) for r, _ in hits])
+            if "distances" in out:
+                out["distances"].append([1.0 - s for _, s in hits])
+            if "embeddings" in out:
+                out["embeddings"].append(np.asarray(vectors[[r for r, _ in hits]]))
+        return out
+
+    # --- compression ----------------------------------------------------------
+
+    def _load_codes(self) -> None:
+        if not self._codec_path.exists():
+            self._codec, self._codec_mtime = None, None
+            self._codes = np.zeros((0, 0), dtype=np.int8)
+            return
+        mtime = self._codec_path.stat().st_mtime_ns
+        if mtime != self._codec_mtime:
+            self._codec, self._codec_mtime = PcaInt8Codec.load(self._codec_path), mtime
+        dims = self._codec.dims
+        n_codes = self._codes_path.stat().st_size // dims if self._codes_path.exists() else 0
+        self._codes = (
+            np.memmap(self._codes_path, dtype=np.int8, mode="r", shape=(n_codes, dims))
+            if n_codes
+            else np.zeros((0, dims), dtype=np.int8)
+        )
+
+    def _append_codes(self) -> None:
+        """Encode rows that have no code yet (writer, under _writing())."""
+        mtime = self._codec_path.stat().st_mtime_ns
+        if self._codec is None or mtime != self._codec_mtime:
+            self._codec, self._codec_mtime = PcaInt8Codec.load(self._codec_path), mtime
+        dims = self._codec.dims
+        n_rows = self._file_rows()
+        n_codes = self._codes_path.stat().st_size // dims if self._codes_path.exists() else 0
+        if n_codes >= n_rows:
+            return
+        _truncate_to(self._codes_path, n_codes * dims)
+        vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+        with open(self._codes_path, "ab") as fh:
+            for a in range(n_codes, n_rows, FLAT_SCAN_BLOCK):
+                b = min(a + FLAT_SCAN_BLOCK, n_rows)
+                fh.write(self._codec.encode(np.asarray(vectors[a:b])).tobytes())
+
+    def fit_compression(self, dims: int = COMPRESS_DIMS, sample_size: int = COMPRESS_SAMPLE) -> Optional[PcaInt8Codec]:
+        """Learn the codec from a sample of live rows and (re)encode every row."""
+        with self._writing():
+            self._refresh()
+            live = np.flatnonzero(self._alive)
+            if not len(live):
+                return None
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(live, size=min(sample_size, len(live)), replace=False))
+            codec = PcaInt8Codec.fit(np.asarray(self._vectors[sample]), dims)
+
+            codec.save(self._codec_path)
+            self._codes_path.unlink(missing_ok=True)
+            self._append_codes()
+            self._bump_version()
+            self._conn.commit()
+            return codec
+
+    # --- HNSW ---------------------------------------------------------------
+
+    def _sync_hnsw(self) -> None:
+        """
+        Load the saved graph and add any rows appended since it was saved.
+        Readers keep the additions in memory; upsert() saves them under the
+        writer lock.
+        """
+        n_rows = self._vectors.shape[0]
+        if not n_rows:
+            return
+        if self._hnsw is None:
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            if self._hnsw_path.exists():
+                index.load_index(str(self._hnsw_path), max_elements=max(n_rows, 1024))
+            else:
+                index.init_index(max_elements=max(n_rows, 1024), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            index.set_ef(HNSW_EF_SEARCH)
+            self._hnsw = index
+
+        have = self._hnsw.get_current_count()
+        if have >= n_rows:
+            return
+        if self._hnsw.get_max_elements() < n_rows:
+            self._hnsw.resize_index(max(n_rows, 2 * self._hnsw.get_max_elements()))
+        for a in range(have, n_rows, FLAT_SCAN_BLOCK):
+            b = min(a + FLAT_SCAN_BLOCK, n_rows)
+            self._hnsw.add_items(np.asarray(self._vectors[a:b]), np.arange(a, b))
+        self._hnsw_unsaved += n_rows - have
+
+    def save_hnsw(self) -> None:
+        with self._writing():
+            self._refresh()
+            self._save_hnsw()
+
+    def _save_hnsw(self) -> None:
+        # Caller holds _writing()
+        if self._hnsw is None:
+            return
+        tmp = self._hnsw_path.with_suffix(f".tmp{os.getpid()}")
+        self._hnsw.save_index(str(tmp))
+        os.replace(tmp, self._hnsw_path)
+        self._hnsw_unsaved = 0
+
+    def _hnsw_search(self, queries: np.ndarray, n: int, alive: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Approximate top-n; None when dead rows crowd out too many hits."""
+        with self._lock:
+            if self._hnsw is None:
+                return None
+            dead = len(alive) - int(alive.sum())
+            k = min(self._hnsw.get_current_count(), n + min(dead, n) + 16)
+            labels, distances = self._hnsw.knn_query(queries, k=k)
+
+        rows = np.full((len(queries), n), -1, dtype=np.int64)
+        sims = np.full((len(queries), n), -np.inf, dtype=np.float32)
+        for q, (q_labels, q_dist) in enumerate(zip(labels, distances)):
+            keep = [(int(l), 1.0 - float(d)) for l, d in zip(q_labels, q_dist) if l < len(alive) and alive[l]][:n]
+            if len(keep) < n:
+                return None
+            rows[q] = [r for r, _ in keep]
+            sims[q] = [s for _, s in keep]
+        return rows, sims
@@ -2,8 +2,11 @@
 
 from __future__ import annotations
 
+import argparse
 import logging
-from typing import List, Optional
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
 from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime, timezone
@@ -12,13 +15,24 @@ import os
 import numpy as np
 
 try:
-    from embeddings.chunker import chunk_text
-    from embeddings.tender_embedder import TenderEmbedder
-    from embeddings.vector_store import get_chroma_collection
+    from storage.mongo import get_db
+except ModuleNotFoundError:  # run from inside embeddings/ without the repo root on sys.path
+    get_db = None
+
+try:
+    from embeddings.chunker import Chunk, iter_chunks
+    from embeddings.tender_embedder import get_embedder
+    from embeddings.vector_store import get_vector_store
+    from embeddings.centroids import kmeans_centroids
+    from embeddings.bm25_index import extract_keywords
+    from embeddings.packed_vectors import pack_profile_vectors
 except ModuleNotFoundError:
-    from chunker import chunk_text
-    from tender_embedder import TenderEmbedder
-    from vector_store import get_chroma_collection
+    from chunker import Chunk, iter_chunks
+    from tender_embedder import get_embedder
+    from vector_store import get_vector_store
+    from centroids import kmeans_centroids
+    from bm25_index import extract_keywords
+    from packed_vectors import pack_profile_vectors
 
 load_dotenv()
 
@@ -28,19 +42,20 @@ DB_NAME = os.getenv("DB_NAME", "tender_db")
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "64"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "80"))
+# Token budget per chunk (clamped to the model limit). 0 = use CHUNK_SIZE chars.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "128"))
 
 PROFILE_COLLECTION_NAME = os.getenv("PROFILE_CHROMA_COLLECTION", "profile_embeddings")
 
-mongo = MongoClient(MONGO_URI)
-db = mongo[DB_NAME]
-docling_outputs = db["docling_outputs"]
-company_profiles = db["company_profiles"]
+logger = logging.getLogger(__name__)
 
-collection = get_chroma_collection(name=PROFILE_COLLECTION_NAME)
-embedder = TenderEmbedder()
 
-logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+@lru_cache(maxsize=1)
+def _db():
+    # The process-wide client (storage/mongo.py); a private one when run from inside embeddings/
+    if get_db is not None:
+        return get_db(DB_NAME)
+    return MongoClient(MONGO_URI)[DB_NAME]
 
 
 def _combine_text_and_tables(doc: dict) -> str:
@@ -63,13 +78,31 @@ def _combine_text_and_tables(doc: dict) -> str:
     return "\n".join([text] + table_texts).strip()
 
 
-def _batch_items(items: List[str], batch_size: int) -> List[List[str]]:
+def _batch_items(items: Iterable[Chunk], batch_size: int) -> Iterator[List[Chunk]]:
+    it = iter(items)
     if batch_size <= 0:
-        return [items]
-    return [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
-
-
-def _summary_embedding(chunk_embeddings: List[List[float]]) -> List[float]:
+        yield list(it)
+        return
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _iter_chunks(text: str) -> Iterator[Chunk]:
+    if CHUNK_TOKENS > 0:
+        embedder = get_embedder()
+        return iter_chunks(
+            text,
+            max_len=min(CHUNK_TOKENS, embedder.max_tokens),
+            overlap_chars=CHUNK_OVERLAP,
+            length_fn=embedder.count_tokens,
+        )
+    return iter_chunks(text, max_len=CHUNK_SIZE, overlap_chars=CHUNK_OVERLAP)
+
+
+def _summary_embedding(chunk_embeddings: List[List[float]]) -> np.ndarray:
     """
     Create a single profile embedding from chunk embeddings:
     - average
@@ -80,113 +113,141 @@ def _summary_embedding(chunk_embeddings: List[List[float]]) -> List[float]:
     norm = np.linalg.norm(mean_vec)
     if norm > 0:
         mean_vec = mean_vec / norm
-    return mean_vec.tolist()
-
+    return mean_vec
 
-def index_pending_profiles(limit: int = 10) -> None:
-    pending = docling_outputs.find(
-        {"doc_type": "profile", "indexed": {"$ne": True}},
-        limit=limit,
-    )
-
-    for doc in pending:
-        document_id = str(doc["_id"])
-        profile_id = doc.get("profile_id")
-        profile_id_str: Optional[str] = str(profile_id) if profile_id is not None else None
-        source = doc.get("source")
 
-        if not profile_id_str:
-            logger.warning("Skipping profile doc with missing profile_id: %s", document_id)
-            continue
-
-        combined_text = _combine_text_and_tables(doc)
-        if not combined_text:
-            logger.warning("Skipping empty profile doc: %s", document_id)
-            continue
-
-        chunks = chunk_text(combined_text, max_chars=CHUNK_SIZE, overlap_chars=CHUNK_OVERLAP)
-        if not chunks:
-            logger.warning("No chunks created for profile doc: %s", document_id)
-            continue
-
-        logger.info("Indexing profile %s -> %d chunks", profile_id_str, len(chunks))
-
-        all_embeddings: List[List[float]] = []
-
-        try:
-            for batch_index, batch in enumerate(_batch_items(chunks, BATCH_SIZE)):
-                batch_embeddings = embedder.embed(batch)
-                if len(batch_embeddings) != len(batch):
-                    raise RuntimeError("Embedding count mismatch")
-
-                all_embeddings.extend(batch_embeddings)
-
-                start_index = batch_index * BATCH_SIZE
-                ids = [f"profile:{document_id}:{i}" for i in range(start_index, start_index + len(batch))]
-
-                metadatas = [
-                    {
-                        "doc_type": "profile",
-                        "profile_id": profile_id_str,
-                        "document_id": document_id,
-                        "chunk_index": i,
-                        "source": source,
-                        "model_name": embedder.model_name,
-                        "chunk_size": CHUNK_SIZE,
-                        "chunk_overlap": CHUNK_OVERLAP,
-                    }
-                    for i in range(start_index, start_index + len(batch))
-                ]
-
-                collection.upsert(ids=ids, documents=batch, embeddings=batch_embeddings, metadatas=metadatas)
-
-            # Update docling_outputs
-            docling_outputs.update_one(
-                {"_id": doc["_id"]},
+def index_profile_output(doc: dict) -> bool:
+    """
+    Chunk + embed + upsert one profile docling_outputs record and refresh
+    the profile's summary embedding. Returns True when the record was indexed.
+    """
+    document_id = str(doc["_id"])
+    profile_id = doc.get("profile_id")
+    profile_id_str: Optional[str] = str(profile_id) if profile_id is not None else None
+    source = doc.get("source")
+
+    if not profile_id_str:
+        logger.warning("Skipping profile doc with missing profile_id: %s", document_id)
+        return False
+
+    combined_text = _combine_text_and_tables(doc)
+    if not combined_text:
+        logger.warning("Skipping empty profile doc: %s", document_id)
+        return False
+
+    logger.info("Indexing profile %s (doc %s)", profile_id_str, document_id)
+
+    all_embeddings: List[List[float]] = []
+    collection = get_vector_store(name=PROFILE_COLLECTION_NAME)
+    embedder = get_embedder()
+    db = _db()
+
+    try:
+        chunk_count = 0
+        for batch in _batch_items(_iter_chunks(combined_text), BATCH_SIZE):
+            texts = [c.text for c in batch]
+            batch_embeddings = embedder.embed(texts)
+            if len(batch_embeddings) != len(batch):
+                raise RuntimeError("Embedding count mismatch")
+
+            all_embeddings.extend(batch_embeddings)
+
+            start_index = chunk_count
+            chunk_count += len(batch)
+            ids = [f"profile:{document_id}:{i}" for i in range(start_index, chunk_count)]
+
+            metadatas = [
                 {
-                    "$set": {
-                        "indexed": True,
-                        "indexed_at": datetime.now(timezone.utc),
-                        "chunk_count": len(chunks),
-                        "index_model": embedder.model_name,
-                    },
-                    "$unset": {"index_error": "", "failed_at": ""},
+                    "doc_type": "profile",
+                    "profile_id": profile_id_str,
+                    "document_id": document_id,
+                    "chunk_index": start_index + j,
+                    "char_start": c.start,
+                    "char_end": c.end,
+                    "source": source,
+                    "model_name": embedder.model_name,
+                    "chunk_size": CHUNK_SIZE,
+                    "chunk_tokens": CHUNK_TOKENS,
+                    "chunk_overlap": CHUNK_OVERLAP,
+                }
+                for j, c in enumerate(batch)
+            ]
+
+            collection.upsert(ids=ids, documents=texts, embeddings=batch_embeddings, metadatas=metadatas)
+
+        if not chunk_count:
+            logger.warning("No chunks created for profile doc: %s", document_id)
+            return False
+
+        # Update docling_outputs
+        db["docling_outputs"].update_one(
+            {"_id": doc["_id"]},
+            {
+                "$set": {
+                    "indexed": True,
+                    "indexed_at": datetime.now(timezone.utc),
+                    "chunk_count": chunk_count,
+                    "index_model": embedder.model_name,
                 },
-            )
-
-            # Store summary embedding back into company_profiles (fast query embedding)
-            summary = _summary_embedding(all_embeddings)
-            company_profiles.update_one(
-                {"_id": profile_id},
-                {
-                    "$set": {
-                        "status": "READY",
-                        "profile_embedding": summary,  # length 384
-                        "profile_chunk_count": len(chunks),
-                        "profile_embedding_model": embedder.model_name,
-                        "updated_at": datetime.now(timezone.utc),
-                    }
+                "$unset": {"index_error": "", "failed_at": "", "index_attempts": ""},
+            },
+        )
+
+        # Store summary embedding back into company_profiles (fast query embedding)
+        summary = _summary_embedding(all_embeddings)
+        centroids, centroid_sizes = kmeans_centroids(all_embeddings)
+        db["company_profiles"].update_one(
+            {"_id": profile_id},
+            {
+                "$set": {
+                    "status": "READY",
+                    **pack_profile_vectors(summary, centroids),  # BinData, 384 x float32
+                    "profile_centroid_sizes": centroid_sizes,
+                    "profile_keywords": extract_keywords([combined_text]),
+                    "profile_chunk_count": chunk_count,
+                    "profile_embedding_model": embedder.model_name,
+                    "updated_at": datetime.now(timezone.utc),
+                },
+                "$inc": {"profile_embedding_version": 1},
+            },
+        )
+
+        logger.info("Indexed profile successfully: %s", profile_id_str)
+        return True
+
+    except Exception as exc:
+        db["docling_outputs"].update_one(
+            {"_id": doc["_id"]},
+            {
+                "$set": {
+                    "indexed": False,
+                    "index_error": str(exc),
+                    "failed_at": datetime.now(timezone.utc),
                 },
-            )
+                "$inc": {"index_attempts": 1},
+            },
+        )
+        logger.exception("Failed to index profile doc %s", document_id)
+        return False
 
-            logger.info("Indexed profile successfully: %s", profile_id_str)
 
-        except Exception as exc:
-            docling_outputs.update_one(
-                {"_id": doc["_id"]},
-                {
-                    "$set": {
-                        "indexed": False,
-                        "index_error": str(exc),
-                        "failed_at": datetime.now(timezone.utc),
-                    }
-                },
-            )
-            logger.exception("Failed to index profile doc %s", document_id)
+def index_pending_profiles(limit: int = 10) -> int:
+    """limit=0 indexes every pending doc. Returns the number of docs indexed."""
+    pending = _db()["docling_outputs"].find(
+        {"doc_type": "profile", "indexed": {"$ne": True}},
+        limit=limit,
+    )
+
+    return sum(1 for doc in pending if index_profile_output(doc))
 
 
 def main():
-    index_pending_profiles(limit=10)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=int(os.getenv("INDEX_LIMIT", "10")), help="0 = all pending")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    index_pending_profiles(limit=args.limit)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+# embeddings/index_state.py
+#
+# Monotonic "generation" counters for the vector indexes. Indexers bump a
+# generation after every committed write; readers (e.g. the search cache)
+# compare generations to know when cached results went stale.
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+STATE_COLLECTION = "index_state"
+TENDER_INDEX = "tender_index"
+
+
+def bump_generation(db, name: str = TENDER_INDEX) -> int:
+    """Atomically increment and return the generation of index `name`."""
+    doc = db[STATE_COLLECTION].find_one_and_update(
+        {"_id": name},
+        {"$inc": {"generation": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(doc.get("generation", 0))
+
+
+def get_generation(db, name: str = TENDER_INDEX) -> int:
+    doc = db[STATE_COLLECTION].find_one({"_id": name}, {"generation": 1})
+    return int(doc.get("generation", 0)) if doc else 0
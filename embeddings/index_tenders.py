@@ -2,21 +2,43 @@
 
 from __future__ import annotations
 
+import argparse
 import logging
-from typing import List
+import threading
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 import os
+import time
 
 try:
-    from embeddings.chunker import chunk_text
-    from embeddings.tender_embedder import TenderEmbedder
-    from embeddings.vector_store import get_chroma_collection
+    from utils import metrics
+    from storage.doc_cost import INDEX_COST_FIELD, record_cost
+    from storage.mongo import get_db
+except ModuleNotFoundError:  # run from inside embeddings/ without the repo root on sys.path
+    metrics = None
+    INDEX_COST_FIELD, record_cost = "index_cost", None
+    get_db = None
+
+try:
+    from embeddings.chunker import Chunk, iter_chunks
+    from embeddings.tender_embedder import get_embedder
+    from embeddings.vector_store import get_vector_store
+    from embeddings.index_state import bump_generation
+    from embeddings.match_matrix import score_new_tender
+    from embeddings.bm25_index import Bm25Writer, index_path
+    from embeddings.partitions import TENDER_PARTITIONING, partition_name, register_partition, remove_document
 except ModuleNotFoundError:
-    from chunker import chunk_text
-    from tender_embedder import TenderEmbedder
-    from vector_store import get_chroma_collection
+    from chunker import Chunk, iter_chunks
+    from tender_embedder import get_embedder
+    from vector_store import get_vector_store
+    from index_state import bump_generation
+    from match_matrix import score_new_tender
+    from bm25_index import Bm25Writer, index_path
+    from partitions import TENDER_PARTITIONING, partition_name, register_partition, remove_document
 
 load_dotenv()
 
@@ -26,18 +48,39 @@ DB_NAME = os.getenv("DB_NAME", "tender_db")
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "64"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "80"))
+# Token budget per chunk (clamped to the model limit). 0 = use CHUNK_SIZE chars.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "128"))
 
 TENDER_COLLECTION_NAME = os.getenv("TENDER_CHROMA_COLLECTION", "tender_embeddings")
+# Score each newly indexed tender against all profiles (profile_matches)
+MATCH_ON_INDEX = os.getenv("MATCH_ON_INDEX", "1") == "1"
+# Maintain the on-disk BM25 index next to Chroma (hybrid search)
+BM25_ENABLED = os.getenv("BM25_ENABLED", "1") == "1"
 
-mongo = MongoClient(MONGO_URI)
-db = mongo[DB_NAME]
-docling_outputs = db["docling_outputs"]
+logger = logging.getLogger(__name__)
 
-collection = get_chroma_collection(name=TENDER_COLLECTION_NAME)
-embedder = TenderEmbedder()
+# Mongo, the vector store, the BM25 writer and the model are opened on first
+# use, not at import: see _db(), _bm25() and get_embedder()
+_bm25_writer: Optional[Bm25Writer] = None
+_bm25_lock = threading.Lock()
 
-logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+@lru_cache(maxsize=1)
+def _db():
+    # The process-wide client (storage/mongo.py); a private one when run from inside embeddings/
+    if get_db is not None:
+        return get_db(DB_NAME)
+    return MongoClient(MONGO_URI)[DB_NAME]
+
+
+def _bm25() -> Optional[Bm25Writer]:
+    """The single BM25 writer of this process (None when BM25_ENABLED is off)."""
+    global _bm25_writer
+    if BM25_ENABLED and _bm25_writer is None:
+        with _bm25_lock:
+            if _bm25_writer is None:
+                _bm25_writer = Bm25Writer(index_path(TENDER_COLLECTION_NAME))
+    return _bm25_writer
 
 
 def _combine_text_and_tables(doc: dict) -> str:
@@ -66,99 +109,242 @@ def _combine_text_and_tables(doc: dict) -> str:
     return combined
 
 
-def _batch_items(items: List[str], batch_size: int) -> List[List[str]]:
+def _epoch(value) -> Optional[int]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _filter_metadata(doc: dict) -> Dict[str, Any]:
+    """
+    Numeric / keyword fields search filters are pushed down on.
+    Older docling outputs predate these fields; fall back to the tender document.
+    """
+    fields = {k: doc.get(k) for k in ("document_type", "published_at", "closing_at")}
+    if any(v is None for v in fields.values()):
+        src = _db()["tender_documents"].find_one(
+            {"_id": doc.get("document_id")}, {"document_type": 1, "published_at": 1, "closing_at": 1}
+        ) or {}
+        fields = {k: v if v is not None else src.get(k) for k, v in fields.items()}
+
+    meta: Dict[str, Any] = {}
+    if fields["document_type"]:
+        meta["document_type"] = fields["document_type"]
+    for key, ts_key in (("published_at", "published_ts"), ("closing_at", "closing_ts")):
+        ts = _epoch(fields[key])
+        if ts is not None:
+            meta[ts_key] = ts
+    return meta
+
+
+def _batch_items(items: Iterable[Chunk], batch_size: int) -> Iterator[List[Chunk]]:
+    it = iter(items)
     if batch_size <= 0:
-        return [items]
-    return [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+        yield list(it)
+        return
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _timed(items: Iterable[Chunk], elapsed: List[float]) -> Iterator[Chunk]:
+    """Pass `items` through, adding the time spent producing them to elapsed[0]."""
+    it = iter(items)
+    while True:
+        start = time.perf_counter()
+        item = next(it, None)
+        elapsed[0] += time.perf_counter() - start
+        if item is None:
+            return
+        yield item
+
+
+def _iter_chunks(text: str) -> Iterator[Chunk]:
+    if CHUNK_TOKENS > 0:
+        embedder = get_embedder()
+        return iter_chunks(
+            text,
+            max_len=min(CHUNK_TOKENS, embedder.max_tokens),
+            overlap_chars=CHUNK_OVERLAP,
+            length_fn=embedder.count_tokens,
+        )
+    return iter_chunks(text, max_len=CHUNK_SIZE, overlap_chars=CHUNK_OVERLAP)
+
+
+def index_tender_output(doc: dict) -> bool:
+    """
+    Chunk + embed + upsert one tender docling_outputs record.
+    Returns True when the record was indexed.
+    """
+    if metrics is None:
+        return _index_tender_output(doc)
+    with metrics.span("index_tender", tender_id=doc.get("tender_id"), document_id=doc["_id"]):
+        return _index_tender_output(doc)
+
+
+def _index_tender_output(doc: dict) -> bool:
+    started = time.perf_counter()
+    document_id = str(doc["_id"])
+    tender_id = doc.get("tender_id")
+    tender_id_str = str(tender_id) if tender_id is not None else None
+    source = doc.get("source")
+
+    combined_text = _combine_text_and_tables(doc)
+    if not combined_text:
+        logger.warning("Skipping empty tender doc: %s", document_id)
+        return False
+
+    logger.info("Indexing tender %s", tender_id_str)
+    filter_meta = _filter_metadata(doc)
+    tender_meta = {"tender_id": tender_id_str, "document_id": document_id, "source": source, **filter_meta}
+
+    # Partitioned index: every chunk of a document lands in one source/month partition
+    partition = partition_name(tender_meta) if TENDER_PARTITIONING else None
+    target = get_vector_store(name=partition or TENDER_COLLECTION_NAME)
+    embedder = get_embedder()
+    db = _db()
+
+    try:
+        # Re-index: drop the chunks an earlier run left, so a shorter text or
+        # a changed source / publish month (another partition) leaves no stale ids.
+        # A fresh Docling extraction unsets indexed_at / failed_at but keeps `partition`.
+        if doc.get("indexed_at") or doc.get("failed_at") or "partition" in doc:
+            if TENDER_PARTITIONING:
+                remove_document(db, document_id, doc.get("partition"))
+            else:
+                target.delete(where={"document_id": document_id})
+
+        chunk_count = 0
+        doc_embeddings: List[List[float]] = []
+        doc_chunks: List[tuple] = []
+        # Chunks stream into the embedder; only the time spent chunking is summed
+        chunk_elapsed = [0.0]
+        for batch in _batch_items(_timed(_iter_chunks(combined_text), chunk_elapsed), BATCH_SIZE):
+            texts = [c.text for c in batch]
+            batch_embeddings = embedder.embed(texts)
+            if len(batch_embeddings) != len(batch):
+                raise RuntimeError("Embedding count mismatch")
+
+            doc_embeddings.extend(batch_embeddings)
+            start_index = chunk_count
+            chunk_count += len(batch)
+
+            ids = [f"tender:{document_id}:{i}" for i in range(start_index, chunk_count)]
+
+            metadatas = [
+                {
+                    "doc_type": "tender",
+                    "tender_id": tender_id_str,
+                    "document_id": document_id,
+                    "chunk_index": start_index + j,
+                    "char_start": c.start,
+                    "char_end": c.end,
+                    "source": source,
+                    "model_name": embedder.model_name,
+                    "chunk_size": CHUNK_SIZE,
+                    "chunk_tokens": CHUNK_TOKENS,
+                    "chunk_overlap": CHUNK_OVERLAP,
+                    **filter_meta,
+                }
+                for j, c in enumerate(batch)
+            ]
+
+            target.upsert(ids=ids, documents=texts, embeddings=batch_embeddings, metadatas=metadatas)
+            doc_chunks.extend(zip(ids, texts))
+
+        if metrics is not None:
+            metrics.CHUNK_SECONDS.labels("tender").observe(chunk_elapsed[0])
+        if not chunk_count:
+            logger.warning("No chunks created for tender doc: %s", document_id)
+            return False
+
+        db["docling_outputs"].update_one(
+            {"_id": doc["_id"]},
+            {
+                "$set": {
+                    "indexed": True,
+                    "indexed_at": datetime.now(timezone.utc),
+                    "chunk_count": chunk_count,
+                    "index_model": embedder.model_name,
+                    "partition": partition,
+                },
+                "$unset": {"index_error": "", "failed_at": "", "index_attempts": ""},
+            },
+        )
+
+        if partition:
+            register_partition(db, partition, tender_meta)
+
+        if record_cost is not None and doc.get("document_id") is not None:
+            # Cost ledger (storage/doc_cost.py), keyed by the source document like the Docling entry
+            record_cost(
+                db, doc["document_id"], "embed", time.perf_counter() - started,
+                chunk_count=chunk_count, text_chars=len(combined_text),
+                predicted_embed_s=(doc.get(INDEX_COST_FIELD) or {}).get("predicted_s"),
+            )
+
+        bm25 = _bm25()
+        if bm25 is not None:
+            bm25.add_document(document_id, tender_id_str, doc_chunks)
+
+        # New chunks are visible: invalidate cached search results
+        bump_generation(db)
+
+        if MATCH_ON_INDEX:
+            try:
+                score_new_tender(db, tender_meta, doc_embeddings)
+            except Exception:
+                logger.exception("Failed to score tender %s against profiles", document_id)
+
+        logger.info("Indexed tender doc successfully: %s (%d chunks)", document_id, chunk_count)
+        return True
+
+    except Exception as exc:
+        db["docling_outputs"].update_one(
+            {"_id": doc["_id"]},
+            {
+                "$set": {
+                    "indexed": False,
+                    "index_error": str(exc),
+                    "failed_at": datetime.now(timezone.utc),
+                },
+                "$inc": {"index_attempts": 1},
+            },
+        )
+        logger.exception("Failed to index tender doc %s", document_id)
+        return False
 
 
-def index_pending_tenders(limit: int = 10) -> None:
+def index_pending_tenders(limit: int = 10) -> int:
     """
     Index ONLY tender docs from docling_outputs into tender_embeddings Chroma collection.
+    limit=0 indexes every pending doc. Returns the number of docs indexed.
     """
     if CHUNK_SIZE <= 0:
         raise ValueError("CHUNK_SIZE must be > 0")
 
-    pending = docling_outputs.find(
+    # Highest priority, then smallest predicted embedding cost first
+    pending = _db()["docling_outputs"].find(
         {"doc_type": "tender", "indexed": {"$ne": True}},
         limit=limit,
-    )
+    ).sort([("priority", -1), (f"{INDEX_COST_FIELD}.predicted_s", 1)])
 
-    for doc in pending:
-        document_id = str(doc["_id"])
-        tender_id = doc.get("tender_id")
-        tender_id_str = str(tender_id) if tender_id is not None else None
-        source = doc.get("source")
-
-        combined_text = _combine_text_and_tables(doc)
-        if not combined_text:
-            logger.warning("Skipping empty tender doc: %s", document_id)
-            continue
-
-        chunks = chunk_text(combined_text, max_chars=CHUNK_SIZE, overlap_chars=CHUNK_OVERLAP)
-        if not chunks:
-            logger.warning("No chunks created for tender doc: %s", document_id)
-            continue
-
-        logger.info("Indexing tender %s -> %d chunks", tender_id_str, len(chunks))
-
-        try:
-            for batch_index, batch in enumerate(_batch_items(chunks, BATCH_SIZE)):
-                batch_embeddings = embedder.embed(batch)
-                if len(batch_embeddings) != len(batch):
-                    raise RuntimeError("Embedding count mismatch")
-
-                start_index = batch_index * BATCH_SIZE
-
-                ids = [f"tender:{document_id}:{i}" for i in range(start_index, start_index + len(batch))]
-
-                metadatas = [
-                    {
-                        "doc_type": "tender",
-                        "tender_id": tender_id_str,
-                        "document_id": document_id,
-                        "chunk_index": i,
-                        "source": source,
-                        "model_name": embedder.model_name,
-                        "chunk_size": CHUNK_SIZE,
-                        "chunk_overlap": CHUNK_OVERLAP,
-                    }
-                    for i in range(start_index, start_index + len(batch))
-                ]
-
-                collection.upsert(ids=ids, documents=batch, embeddings=batch_embeddings, metadatas=metadatas)
-
-            docling_outputs.update_one(
-                {"_id": doc["_id"]},
-                {
-                    "$set": {
-                        "indexed": True,
-                        "indexed_at": datetime.now(timezone.utc),
-                        "chunk_count": len(chunks),
-                        "index_model": embedder.model_name,
-                    },
-                    "$unset": {"index_error": "", "failed_at": ""},
-                },
-            )
-
-            logger.info("Indexed tender doc successfully: %s", document_id)
-
-        except Exception as exc:
-            docling_outputs.update_one(
-                {"_id": doc["_id"]},
-                {
-                    "$set": {
-                        "indexed": False,
-                        "index_error": str(exc),
-                        "failed_at": datetime.now(timezone.utc),
-                    }
-                },
-            )
-            logger.exception("Failed to index tender doc %s", document_id)
+    return sum(1 for doc in pending if index_tender_output(doc))
 
 
 def main():
-    index_pending_tenders(limit=10)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=int(os.getenv("INDEX_LIMIT", "10")), help="0 = all pending")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    if metrics is not None:
+        metrics.start_file_exporter()
+    index_pending_tenders(limit=args.limit)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,337 @@
+# embeddings/match_matrix.py
+#
+# Precomputed profile x tender match table.
+#
+# All READY profile embeddings and all tender chunk vectors are loaded into
+# NumPy matrices; tender scores (max over a tender's chunks) are computed
+# with blocked matrix multiplies and the per-profile top-k is stored in
+# `profile_matches`. When the indexer commits a tender, only that tender is
+# scored against every profile (score_new_tender); when a profile becomes
+# READY or its embedding changes, only that profile is rescored
+# (score_profile).
+#
+#   python -m embeddings.match_matrix --rebuild
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pymongo import DeleteMany, UpdateOne
+
+try:
+    from embeddings.packed_vectors import FORMAT_FIELD, unpack_embedding
+except ModuleNotFoundError:
+    from packed_vectors import FORMAT_FIELD, unpack_embedding
+
+MATCHES_COLLECTION = "profile_matches"
+MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "50"))
+MATCH_MIN_SCORE = float(os.getenv("MATCH_MIN_SCORE", "0.0"))
+CHUNK_BLOCK = int(os.getenv("MATCH_CHUNK_BLOCK", "8192"))
+PROFILE_BLOCK = int(os.getenv("MATCH_PROFILE_BLOCK", "1024"))
+PAGE_SIZE = int(os.getenv("MATCH_PAGE_SIZE", "5000"))
+
+logger = logging.getLogger(__name__)
+
+
+def tender_key(meta: dict) -> str:
+    """Same grouping key as api/services/search.py."""
+    return meta.get("tender_id") or f"doc:{meta.get('document_id')}"
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def load_profile_matrix(db) -> Tuple[List, np.ndarray]:
+    """(profile _ids, unit-norm float32 matrix) for every READY profile."""
+    ids: List = []
+    rows: List[np.ndarray] = []
+    cursor = db["company_profiles"].find(
+        {"status": "READY", "profile_embedding": {"$ne": None}},
+        {"profile_embedding": 1, FORMAT_FIELD: 1},
+    )
+    for doc in cursor:
+        vec = unpack_embedding(doc)
+        if vec is not None:
+            ids.append(doc["_id"])
+            rows.append(vec)
+    if not rows:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return ids, _normalize_rows(np.stack(rows))
+
+
+def load_tender_chunks(collection) -> Tuple[np.ndarray, List[dict]]:
+    """Page every chunk vector + metadata out of the tender collection (or each partition)."""
+    vectors: List[np.ndarray] = []
+    metadatas: List[dict] = []
+    for store in getattr(collection, "partitions", [collection]):
+        offset = 0
+        while True:
+            page = store.get(include=["embeddings", "metadatas"], limit=PAGE_SIZE, offset=offset)
+            embeddings = page.get("embeddings")
+            if embeddings is None or len(embeddings) == 0:
+                break
+            vectors.append(np.asarray(embeddings, dtype=np.float32))
+            metadatas.extend(m or {} for m in page.get("metadatas") or [])
+            offset += len(embeddings)
+            if len(embeddings) < PAGE_SIZE:
+                break
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32), []
+    return np.concatenate(vectors), metadatas
+
+
+def _group_chunks(metadatas: List[dict]) -> Tuple[np.ndarray, List[str], np.ndarray, List[dict]]:
+    """
+    Order chunks so each tender's chunks are contiguous.
+    Returns (chunk order, tender keys, start offset of each tender, tender meta).
+    """
+    keys = [tender_key(m) for m in metadatas]
+    order = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+    tender_keys: List[str] = []
+    tender_meta: List[dict] = []
+    starts: List[int] = []
+    prev = None
+    for pos, idx in enumerate(order):
+        if keys[idx] != prev:
+            prev = keys[idx]
+            tender_keys.append(prev)
+            tender_meta.append(metadatas[idx])
+            starts.append(pos)
+    return order, tender_keys, np.asarray(starts, dtype=np.int64), tender_meta
+
+
+def _tender_blocks(starts: np.ndarray, n_chunks: int) -> List[Tuple[int, int]]:
+    """Split tenders [t0, t1) so every block holds ~CHUNK_BLOCK chunks."""
+    blocks: List[Tuple[int, int]] = []
+    t0 = 0
+    n_tenders = len(starts)
+    while t0 < n_tenders:
+        limit = starts[t0] + CHUNK_BLOCK
+        t1 = int(np.searchsorted(starts, limit, side="right"))
+        t1 = max(t1, t0 + 1)
+        blocks.append((t0, min(t1, n_tenders)))
+        t0 = t1
+    return blocks
+
+
+def top_k_matches(
+    profiles: np.ndarray,
+    chunks: np.ndarray,
+    starts: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Blocked top-k of tender scores (max over chunks) for every profile.
+    `chunks` must be grouped by tender with group offsets `starts`.
+    Returns (tender indices, scores), both shaped (n_profiles, k'), best first.
+    """
+    n_profiles, n_tenders = profiles.shape[0], len(starts)
+    k = min(k, n_tenders)
+    best_s = np.full((n_profiles, k), -np.inf, dtype=np.float32)
+    best_i = np.full((n_profiles, k), -1, dtype=np.int64)
+    if k == 0:
+        return best_i, best_s
+
+    for t0, t1 in _tender_blocks(starts, chunks.shape[0]):
+        c0 = int(starts[t0])
+        c1 = int(starts[t1]) if t1 < n_tenders else chunks.shape[0]
+        block = chunks[c0:c1]
+        local_starts = starts[t0:t1] - c0
+
+        for p0 in range(0, n_profiles, PROFILE_BLOCK):
+            p1 = min(p0 + PROFILE_BLOCK, n_profiles)
+            chunk_scores = profiles[p0:p1] @ block.T                       # (pb, chunks)
+            scores = np.maximum.reduceat(chunk_scores, local_starts, axis=1)  # (pb, tenders)
+
+            cat_s = np.concatenate([best_s[p0:p1], scores], axis=1)
+            cat_i = np.concatenate(
+                [best_i[p0:p1], np.broadcast_to(np.arange(t0, t1, dtype=np.int64), scores.shape)],
+                axis=1,
+            )
+            keep = np.argpartition(-cat_s, k - 1, axis=1)[:, :k]
+            best_s[p0:p1] = np.take_along_axis(cat_s, keep, axis=1)
+            best_i[p0:p1] = np.take_along_axis(cat_i, keep, axis=1)
+
+    order = np.argsort(-best_s, axis=1)
+    return np.take_along_axis(best_i, order, axis=1), np.take_along_axis(best_s, order, axis=1)
+
+
+def _match_update(profile_id, key: str, meta: dict, score: float, now: datetime, run_id: Optional[str]) -> UpdateOne:
+    fields = {
+        "profile_id": profile_id,
+        "tender_key": key,
+        "tender_id": meta.get("tender_id"),
+        "document_id": meta.get("document_id"),
+        "source": meta.get("source"),
+        "document_type": meta.get("document_type"),
+        "published_ts": meta.get("published_ts"),
+        "closing_ts": meta.get("closing_ts"),
+        "score": round(float(score), 6),
+        "computed_at": now,
+    }
+    if run_id:
+        fields["run_id"] = run_id
+    return UpdateOne(
+        {"_id": f"{profile_id}:{key}"},
+        {"$set": fields, "$setOnInsert": {"matched_at": now}},
+        upsert=True,
+    )
+
+
+def _profile_ops(profile_id, top_i, top_s, tender_keys, tender_meta, now: datetime, run_id: str) -> List:
+    """Upserts for one profile's top-k row (tender indices / scores, best first)."""
+    return [
+        _match_update(profile_id, tender_keys[t_idx], tender_meta[t_idx], score, now, run_id)
+        for t_idx, score in zip(top_i, top_s)
+        if t_idx >= 0 and score >= MATCH_MIN_SCORE
+    ]
+
+
+def rebuild_profile_matches(db, collection, top_k: int = MATCH_TOP_K) -> int:
+    """Full recompute of profile_matches. Returns number of rows written."""
+    profile_ids, profiles = load_profile_matrix(db)
+    vectors, metadatas = load_tender_chunks(collection)
+    if not profile_ids or not metadatas:
+        logger.info("Nothing to match (profiles=%d, chunks=%d)", len(profile_ids), len(metadatas))
+        return 0
+
+    order, tender_keys, starts, tender_meta = _group_chunks(metadatas)
+    chunks = _normalize_rows(vectors[order])
+    logger.info("Matching %d profiles x %d tenders (%d chunks)", len(profile_ids), len(tender_keys), len(chunks))
+
+    top_i, top_s = top_k_matches(profiles, chunks, starts, top_k)
+
+    matches = db[MATCHES_COLLECTION]
+    run_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    written = 0
+    for p0 in range(0, len(profile_ids), PROFILE_BLOCK):
+        block_ids = profile_ids[p0 : p0 + PROFILE_BLOCK]
+        ops = []
+        for row, profile_id in enumerate(block_ids, start=p0):
+            ops.extend(_profile_ops(profile_id, top_i[row], top_s[row], tender_keys, tender_meta, now, run_id))
+        ops.append(DeleteMany({"profile_id": {"$in": block_ids}, "run_id": {"$ne": run_id}}))
+        matches.bulk_write(ops, ordered=True)
+        written += len(ops) - 1
+    return written
+
+
+def score_profile(db, profile_id, collection, top_k: int = MATCH_TOP_K) -> int:
+    """
+    Per-profile path: recompute one profile's top-k over every tender chunk
+    and swap it in with the same run_id / DeleteMany as the rebuild. A
+    profile that is not READY or has no embedding loses its rows. Returns
+    rows written.
+    """
+    matches = db[MATCHES_COLLECTION]
+    profile = db["company_profiles"].find_one(
+        {"_id": profile_id, "status": "READY"}, {"profile_embedding": 1, FORMAT_FIELD: 1}
+    )
+    vec = unpack_embedding(profile) if profile else None
+    if vec is None:
+        matches.delete_many({"profile_id": profile_id})
+        return 0
+
+    run_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    ops: List = []
+    vectors, metadatas = load_tender_chunks(collection)
+    if metadatas:
+        order, tender_keys, starts, tender_meta = _group_chunks(metadatas)
+        chunks = _normalize_rows(vectors[order])
+        profiles = _normalize_rows(np.asarray(vec, dtype=np.float32).reshape(1, -1))
+        top_i, top_s = top_k_matches(profiles, chunks, starts, top_k)
+        ops = _profile_ops(profile_id, top_i[0], top_s[0], tender_keys, tender_meta, now, run_id)
+    ops.append(DeleteMany({"profile_id": profile_id, "run_id": {"$ne": run_id}}))
+    matches.bulk_write(ops, ordered=True)
+    return len(ops) - 1
+
+
+def score_new_tender(db, meta: dict, vectors: Sequence[Sequence[float]], top_k: int = MATCH_TOP_K) -> int:
+    """
+    Incremental path: score one freshly indexed tender against all profiles
+    and merge it into each profile's stored top-k. Returns rows upserted.
+    """
+    if not vectors:
+        return 0
+    profile_ids, profiles = load_profile_matrix(db)
+    if not profile_ids:
+        return 0
+
+    chunks = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    scores = (profiles @ chunks.T).max(axis=1)  # (n_profiles,)
+
+    matches = db[MATCHES_COLLECTION]
+    floors: Dict = {
+        row["_id"]: row
+        for row in matches.aggregate(
+            [
+                {"$match": {"profile_id": {"$in": profile_ids}}},
+                {"$group": {"_id": "$profile_id", "count": {"$sum": 1}, "floor": {"$min": "$score"}}},
+            ]
+        )
+    }
+
+    key = tender_key(meta)
+    now = datetime.now(timezone.utc)
+    ops = []
+    overflow = []
+    for profile_id, score in zip(profile_ids, scores):
+        if score < MATCH_MIN_SCORE:
+            continue
+        stats = floors.get(profile_id) or {"count": 0, "floor": -np.inf}
+        if stats["count"] >= top_k and score <= stats["floor"]:
+            continue
+        ops.append(_match_update(profile_id, key, meta, score, now, None))
+        if stats["count"] >= top_k:
+            overflow.append(profile_id)
+
+    if ops:
+        matches.bulk_write(ops, ordered=False)
+
+    # Trim profiles pushed past top_k
+    for profile_id in overflow:
+        extra = [d["_id"] for d in matches.find({"profile_id": profile_id}, {"_id": 1}).sort("score", -1).skip(top_k)]
+        if extra:
+            matches.delete_many({"_id": {"$in": extra}})
+    return len(ops)
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    try:
+        from embeddings.partitions import get_tender_index
+    except ModuleNotFoundError:
+        from partitions import get_tender_index
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="recompute every profile's top-k")
+    parser.add_argument("--top-k", type=int, default=MATCH_TOP_K)
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("DB_NAME", "tender_db")]
+    collection = get_tender_index(db)
+
+    if args.rebuild:
+        written = rebuild_profile_matches(db, collection, top_k=args.top_k)
+        logger.info("profile_matches rebuilt: %d rows", written)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# embeddings/packed_vectors.py
+#
+# Profile vectors in Mongo as packed little-endian BinData instead of BSON
+# arrays of doubles: 384 floats are 1.5 KiB as float32 (0.75 KiB as float16)
+# instead of ~3.4 KiB, and decode with one np.frombuffer call.
+#
+#   company_profiles.profile_embedding      BinData, one vector
+#   company_profiles.profile_centroids      BinData, k vectors back to back
+#   company_profiles.profile_vector_format  {"v": 1, "dtype": "float32", "dim": 384}
+#
+# Documents written before the format tag still hold lists; the unpack
+# helpers accept both.
+#
+#   python -m embeddings.packed_vectors --migrate
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from bson import Binary
+
+PROFILE_VECTOR_DTYPE = os.getenv("PROFILE_VECTOR_DTYPE", "float32")
+VECTOR_DTYPES = ("float32", "float16")
+FORMAT_VERSION = 1
+
+FORMAT_FIELD = "profile_vector_format"
+VECTOR_FIELDS = ("profile_embedding", "profile_centroids")
+# Projection for profile reads that never look at the vectors (nor the
+# running sums behind them, embeddings/profile_state.py)
+WITHOUT_VECTORS: Dict[str, int] = {field: 0 for field in (*VECTOR_FIELDS, "profile_state")}
+
+logger = logging.getLogger(__name__)
+
+
+def vector_format(dim: int, dtype: str = PROFILE_VECTOR_DTYPE) -> Dict[str, Any]:
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype {dtype!r}; expected one of {VECTOR_DTYPES}")
+    return {"v": FORMAT_VERSION, "dtype": dtype, "dim": int(dim)}
+
+
+def pack_vectors(rows: Any, fmt: Dict[str, Any]) -> Optional[Binary]:
+    """One vector or a (k, dim) matrix -> BinData; None stays None."""
+    if rows is None:
+        return None
+    arr = np.asarray(rows, dtype=np.dtype(fmt["dtype"]).newbyteorder("<"))
+    if arr.shape[-1:] != (fmt["dim"],) and arr.size:
+        raise ValueError(f"Vector dimension {arr.shape[-1]} does not match format dim {fmt['dim']}")
+    return Binary(arr.tobytes())
+
+
+def pack_profile_vectors(
+    embedding: Any,
+    centroids: Any = None,
+    dtype: str = PROFILE_VECTOR_DTYPE,
+) -> Dict[str, Any]:
+    """$set fields for a profile's summary vector + centroids."""
+    if embedding is None:
+        return {"profile_embedding": None, "profile_centroids": None, FORMAT_FIELD: None}
+    fmt = vector_format(len(embedding), dtype)
+    return {
+        "profile_embedding": pack_vectors(embedding, fmt),
+        "profile_centroids": pack_vectors(centroids if centroids is not None and len(centroids) else np.zeros((0, fmt["dim"])), fmt),
+        FORMAT_FIELD: fmt,
+    }
+
+
+def _decode(value: Any, fmt: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        if not fmt:
+            raise ValueError("Packed vector without a format tag")
+        if fmt.get("v") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector format version {fmt.get('v')!r}")
+        raw = np.frombuffer(value, dtype=np.dtype(fmt["dtype"]).newbyteorder("<"))
+        return raw.astype(np.float32)
+    # legacy BSON array
+    return np.asarray(value, dtype=np.float32)
+
+
+def unpack_embedding(doc: dict) -> Optional[np.ndarray]:
+    """profile_embedding as a float32 (dim,) array, or None."""
+    vec = _decode(doc.get("profile_embedding"), doc.get(FORMAT_FIELD))
+    return vec if vec is not None and vec.size else None
+
+
+def unpack_centroids(doc: dict) -> np.ndarray:
+    """profile_centroids as a float32 (k, dim) array (k may be 0)."""
+    value = doc.get("profile_centroids")
+    fmt = doc.get(FORMAT_FIELD)
+    flat = _decode(value, fmt)
+    if flat is None or not flat.size:
+        return np.zeros((0, fmt["dim"] if fmt else 0), dtype=np.float32)
+    if flat.ndim == 2:
+        return flat
+    dim = fmt["dim"] if fmt else flat.size
+    return flat.reshape(-1, dim)
+
+
+def migrate_profiles(db, dtype: str = PROFILE_VECTOR_DTYPE, batch_size: int = 500) -> int:
+    """Re-encode profiles still holding list vectors. Returns profiles updated."""
+    from pymongo import UpdateOne
+
+    profiles = db["company_profiles"]
+    cursor = profiles.find(
+        {"profile_embedding": {"$type": "array"}},
+        {"profile_embedding": 1, "profile_centroids": 1},
+    )
+    ops = []
+    updated = 0
+    for doc in cursor:
+        fields = pack_profile_vectors(doc.get("profile_embedding"), doc.get("profile_centroids"), dtype)
+        # Only swap if the vector was not rewritten in the meantime
+        ops.append(UpdateOne({"_id": doc["_id"], "profile_embedding": {"$type": "array"}}, {"$set": fields}))
+        if len(ops) >= batch_size:
+            updated += profiles.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += profiles.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--migrate", action="store_true", help="convert list-encoded profile vectors to BinData")
+    parser.add_argument("--dtype", choices=VECTOR_DTYPES, default=PROFILE_VECTOR_DTYPE)
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("DB_NAME", "tender_db")]
+    if args.migrate:
+        logger.info("Packed %d profiles as %s", migrate_profiles(db, args.dtype), args.dtype)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# embeddings/partitions.py
+#
+# Tender index partitioned by source and month of publication
+# (TENDER_PARTITIONING=1). Each partition is its own vector collection,
+# e.g. "tender_embeddings__mha__2024-02"; the `tender_partitions`
+# registry records which sources / date ranges each one holds so a search
+# only fans out to partitions its filters can match. Cold partitions are
+# archived (kept on disk, skipped by queries) or dropped individually.
+#
+#   python -m embeddings.partitions --list
+#   python -m embeddings.partitions --migrate
+#   python -m embeddings.partitions --archive-before 2023-01
+#   python -m embeddings.partitions --drop tender_embeddings__mha__2021-07
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:
+    from embeddings.vector_store import drop_vector_store, get_vector_store
+except ModuleNotFoundError:
+    from vector_store import drop_vector_store, get_vector_store
+
+TENDER_COLLECTION_NAME = os.getenv("TENDER_CHROMA_COLLECTION", "tender_embeddings")
+TENDER_PARTITIONING = os.getenv("TENDER_PARTITIONING", "0") == "1"
+PARTITIONS_COLLECTION = "tender_partitions"
+FANOUT_WORKERS = int(os.getenv("PARTITION_FANOUT_WORKERS", "8"))
+MIGRATE_PAGE_SIZE = int(os.getenv("MATCH_PAGE_SIZE", "5000"))
+
+ACTIVE = "active"
+ARCHIVED = "archived"
+UNDATED = "undated"
+
+_SLUG = re.compile(r"[^a-z0-9]+")
+_pool: Optional[ThreadPoolExecutor] = None
+
+logger = logging.getLogger(__name__)
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=max(1, FANOUT_WORKERS), thread_name_prefix="partition")
+    return _pool
+
+
+def partition_month(published_ts: Optional[int]) -> str:
+    if published_ts is None:
+        return UNDATED
+    return datetime.fromtimestamp(int(published_ts), tz=timezone.utc).strftime("%Y-%m")
+
+
+def partition_name(meta: dict) -> str:
+    """Collection name for a chunk's metadata (source + publish month)."""
+    source = _SLUG.sub("-", str(meta.get("source") or "unknown").lower()).strip("-") or "unknown"
+    return f"{TENDER_COLLECTION_NAME}__{source}__{partition_month(meta.get('published_ts'))}"
+
+
+def register_partition(db, name: str, meta: dict) -> None:
+    """
+    Record one indexed tender in the registry (ranges used for pruning).
+    chunk_count is recounted from the partition, so re-indexing a document
+    never inflates it.
+    """
+    now = datetime.now(timezone.utc)
+    update: Dict[str, Any] = {
+        "$setOnInsert": {
+            "source": meta.get("source"),
+            "month": partition_month(meta.get("published_ts")),
+            "status": ACTIVE,
+            "created_at": now,
+        },
+        "$set": {"updated_at": now, "chunk_count": get_vector_store(name=name).count()},
+    }
+    bounds: Dict[str, Dict[str, int]] = {"$min": {}, "$max": {}}
+    for field in ("published_ts", "closing_ts"):
+        value = meta.get(field)
+        if value is not None:
+            bounds["$min"][f"min_{field}"] = int(value)
+            bounds["$max"][f"max_{field}"] = int(value)
+    update.update({op: fields for op, fields in bounds.items() if fields})
+    db[PARTITIONS_COLLECTION].update_one({"_id": name}, update, upsert=True)
+
+
+def remove_document(db, document_id: str, partition: Optional[str] = None) -> List[str]:
+    """
+    Delete a document's chunks from `partition`, or from every registered
+    partition when the previous one is unknown (indexed before the
+    partition was recorded), and recount the partitions touched.
+    """
+    names = [partition] if partition else sorted(d["_id"] for d in db[PARTITIONS_COLLECTION].find({}, {"_id": 1}))
+    now = datetime.now(timezone.utc)
+    for name in names:
+        store = get_vector_store(name=name)
+        store.delete(where={"document_id": document_id})
+        db[PARTITIONS_COLLECTION].update_one(
+            {"_id": name}, {"$set": {"chunk_count": store.count(), "updated_at": now}}
+        )
+    return names
+
+
+def select_partitions(db, spec: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Active partitions that can hold chunks matching a normalize_filters()
+    spec. A partition without a recorded range for a bounded field cannot
+    match (the per-chunk filter would drop all of its chunks anyway).
+    """
+    spec = spec or {}
+    query: Dict[str, Any] = {"status": ACTIVE}
+    if spec.get("source"):
+        query["source"] = {"$in": list(spec["source"])}
+    for field in ("published_ts", "closing_ts"):
+        for op, value in (spec.get(field) or {}).items():
+            if op in ("$gte", "$gt"):
+                query[f"max_{field}"] = {op: value}
+            elif op in ("$lte", "$lt"):
+                query[f"min_{field}"] = {op: value}
+    return sorted(doc["_id"] for doc in db[PARTITIONS_COLLECTION].find(query, {"_id": 1}))
+
+
+class FanOutIndex:
+    """
+    VectorStore over several partitions: queries run in parallel on every
+    partition and are merged into one global top-n by distance.
+    """
+
+    def __init__(self, names: Sequence[str]) -> None:
+        self.names = list(names)
+        self.partitions = [get_vector_store(name=name) for name in self.names]
+
+    def _map(self, fn) -> List[Any]:
+        if len(self.partitions) <= 1:
+            return [fn(p) for p in self.partitions]
+        return list(_executor().map(fn, self.partitions))
+
+    def count(self) -> int:
+        return sum(self._map(lambda p: p.count()))
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Sequence[str] = ("metadatas", "documents", "distances"),
+    ) -> Dict[str, Any]:
+        fields = [f for f in ("documents", "metadatas", "embeddings") if f in include]
+        n_queries = len(query_embeddings)
+
+        def one(partition):
+            total = partition.count()
+            if total <= 0:
+                return None
+            return partition.query(
+                query_embeddings=list(query_embeddings),
+                n_results=min(n_results, total),
+                where=where,
+                include=list(fields) + ["distances"],
+            )
+
+        merged: Dict[str, Any] = {"ids": [[] for _ in range(n_queries)]}
+        for f in fields + (["distances"] if "distances" in include else []):
+            merged[f] = [[] for _ in range(n_queries)]
+
+        rows: List[List[tuple]] = [[] for _ in range(n_queries)]
+        for res in self._map(one):
+            if not res:
+                continue
+            for q in range(n_queries):
+                ids = res["ids"][q]
+                cols = [res.get(f)[q] if res.get(f) is not None else [None] * len(ids) for f in fields]
+                for j, (cid, dist) in enumerate(zip(ids, res["distances"][q])):
+                    rows[q].append((dist, cid, [c[j] for c in cols]))
+
+        for q, hits in enumerate(rows):
+            hits.sort(key=lambda h: h[0])
+            for dist, cid, values in hits[:n_results]:
+                merged["ids"][q].append(cid)
+                if "distances" in merged:
+                    merged["distances"][q].append(dist)
+                for f, value in zip(fields, values):
+                    merged[f][q].append(value)
+        return merged
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("metadatas", "documents"),
+    ) -> Dict[str, Any]:
+        """Merged get; limit/offset apply to the concatenation (partition order)."""
+        fields = [f for f in ("documents", "metadatas", "embeddings") if f in include]
+        kwargs: Dict[str, Any] = {"include": list(fields)}
+        if ids is not None:
+            kwargs["ids"] = list(ids)
+        if where:
+            kwargs["where"] = where
+
+        out: Dict[str, Any] = {"ids": [], **{f: [] for f in fields}}
+        for res in self._map(lambda p: p.get(**kwargs)):
+            out["ids"].extend(res.get("ids") or [])
+            for f in fields:
+                values = res.get(f)
+                out[f].extend(list(values) if values is not None else [None] * len(res.get("ids") or []))
+        start = offset or 0
+        end = start + limit if limit is not None else None
+        return {key: values[start:end] for key, values in out.items()}
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None) -> None:
+        """Route each chunk to the partition its metadata names."""
+        groups: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas or [{}] * len(ids)):
+            groups.setdefault(partition_name(meta or {}), []).append(i)
+        for name, idx in groups.items():
+            get_vector_store(name=name).upsert(
+                ids=[ids[i] for i in idx],
+                embeddings=[embeddings[i] for i in idx],
+                documents=[documents[i] for i in idx] if documents is not None else None,
+                metadatas=[metadatas[i] for i in idx] if metadatas is not None else None,
+            )
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None) -> None:
+        self._map(lambda p: p.delete(ids=ids, where=where))
+
+
+def get_tender_index(db, spec: Optional[Dict[str, Any]] = None):
+    """The tender vector index a search should query, pruned by `spec`."""
+    if not TENDER_PARTITIONING:
+        return get_vector_store(name=TENDER_COLLECTION_NAME)
+    return FanOutIndex(select_partitions(db, spec))
+
+
+def _documents_in(store) -> List[str]:
+    metadatas = store.get(include=["metadatas"]).get("metadatas") or []
+    return sorted({m.get("document_id") for m in metadatas if m and m.get("document_id")})
+
+
+def drop_partition(db, name: str) -> int:
+    """
+    Delete a partition's vectors, its registry row, its BM25 postings and
+    its rows in profile_matches. Returns the number of documents removed.
+    """
+    try:
+        from embeddings.bm25_index import Bm25Writer, index_path
+        from embeddings.match_matrix import MATCHES_COLLECTION
+    except ModuleNotFoundError:
+        from bm25_index import Bm25Writer, index_path
+        from match_matrix import MATCHES_COLLECTION
+
+    documents = _documents_in(get_vector_store(name=name))
+    drop_vector_store(name)
+    if documents:
+        # Admin operation: run while the indexer (the BM25 writer) is idle
+        bm25 = Bm25Writer(index_path(TENDER_COLLECTION_NAME))
+        for document_id in documents:
+            bm25.delete_document(document_id)
+        db[MATCHES_COLLECTION].delete_many({"document_id": {"$in": documents}})
+    db[PARTITIONS_COLLECTION].delete_one({"_id": name})
+    return len(documents)
+
+
+def set_partition_status(db, names: Iterable[str], status: str) -> int:
+    res = db[PARTITIONS_COLLECTION].update_many(
+        {"_id": {"$in": list(names)}},
+        {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}},
+    )
+    return res.modified_count
+
+
+def migrate_unpartitioned(db) -> int:
+    """Copy the single tender collection into partitions. Returns chunks copied."""
+    source = get_vector_store(name=TENDER_COLLECTION_NAME)
+    target = FanOutIndex([])
+    copied = 0
+    offset = 0
+    while True:
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=MIGRATE_PAGE_SIZE, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        metadatas = [m or {} for m in page.get("metadatas") or [{}] * len(ids)]
+        target.upsert(ids=ids, embeddings=page["embeddings"], documents=page.get("documents"), metadatas=metadatas)
+
+        per_document: Dict[str, dict] = {}
+        for meta in metadatas:
+            per_document.setdefault(meta.get("document_id"), meta)
+        for meta in per_document.values():
+            register_partition(db, partition_name(meta), meta)
+
+        copied += len(ids)
+        offset += len(ids)
+        if len(ids) < MIGRATE_PAGE_SIZE:
+            break
+    return copied
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument("--migrate", action="store_true", help=f"split {TENDER_COLLECTION_NAME} into partitions")
+    parser.add_argument("--archive", nargs="*", default=[], metavar="NAME")
+    parser.add_argument("--archive-before", metavar="YYYY-MM", help="archive every partition published before this month")
+    parser.add_argument("--restore", nargs="*", default=[], metavar="NAME")
+    parser.add_argument("--drop", nargs="*", default=[], metavar="NAME")
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("DB_NAME", "tender_db")]
+    registry = db[PARTITIONS_COLLECTION]
+
+    if args.migrate:
+        logger.info("Copied %d chunks into partitions", migrate_unpartitioned(db))
+    archive = list(args.archive)
+    if args.archive_before:
+        archive += [
+            d["_id"]
+            for d in registry.find({"status": ACTIVE, "month": {"$lt": args.archive_before, "$ne": UNDATED}}, {"_id": 1})
+        ]
+    if archive:
+        logger.info("Archived %d partitions", set_partition_status(db, archive, ARCHIVED))
+    if args.restore:
+        logger.info("Restored %d partitions", set_partition_status(db, args.restore, ACTIVE))
+    for name in args.drop:
+        logger.info("Dropped %s (%d documents)", name, drop_partition(db, name))
+    if args.list:
+        for d in registry.find().sort("_id", 1):
+            print(f"{d['_id']:<50} {d.get('status'):<9} {d.get('chunk_count', 0):>9} chunks")
+    if not (args.list or args.migrate or archive or args.restore or args.drop):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# embeddings/profile_state.py
+#
+# Running state behind a profile's summary vectors, so documents can be
+# added or removed without re-embedding the rest of the profile.
+#
+#   company_profiles.profile_state = {
+#       "v": 1, "dim": 384, "rev": 7, "epoch": 2,
+#       "count": 1234,                    # chunk vectors folded in
+#       "sum": BinData,                   # float32 (dim,)  -> mean = sum / count
+#       "centroid_sums": BinData,         # float32 (k, dim) of unit vectors
+#       "centroid_counts": [..k ints],
+#       "term_counts": [[term, count]..], # merged per-document keyword counts
+#       "documents": [document_id, ..],   # contributions currently applied
+#   }
+#
+#   company_documents.contribution = the same fields for one document,
+#   tagged with the centroid `epoch` its centroid sums were assigned under.
+#
+# New chunk vectors join their nearest centroid (sequential k-means); the
+# profile is re-clustered from its stored vectors only when choose_k() of
+# the new chunk count asks for more centroids, or a removed contribution
+# predates the current epoch. Sums are kept in float32 whatever
+# PROFILE_VECTOR_DTYPE the published vectors use.
+
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from embeddings.centroids import MAX_PROFILE_CENTROIDS, choose_k, kmeans_centroids
+    from embeddings.packed_vectors import pack_vectors, vector_format
+except ModuleNotFoundError:
+    from centroids import MAX_PROFILE_CENTROIDS, choose_k, kmeans_centroids
+    from packed_vectors import pack_vectors, vector_format
+
+STATE_FIELD = "profile_state"
+CONTRIBUTION_FIELD = "contribution"
+STATE_VERSION = 1
+# Keyword counts kept per document; the profile's keywords are the top of their sum
+KEYWORDS_PER_DOCUMENT = 256
+PROFILE_KEYWORDS = 64
+
+
+def _unit(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _pack(arr: np.ndarray, dim: int):
+    return pack_vectors(arr, vector_format(dim, "float32"))
+
+
+def _unpack(value: Any, dim: int) -> np.ndarray:
+    if value is None:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.frombuffer(value, dtype=np.dtype("float32").newbyteorder("<")).astype(np.float32).reshape(-1, dim)
+
+
+class Contribution:
+    """One document's share of a ProfileState."""
+
+    def __init__(
+        self,
+        dim: int,
+        count: int,
+        vector_sum: np.ndarray,
+        centroid_sums: np.ndarray,
+        centroid_counts: Sequence[int],
+        term_counts: Mapping[str, int],
+        epoch: int,
+    ) -> None:
+        self.dim = dim
+        self.count = int(count)
+        self.vector_sum = np.asarray(vector_sum, dtype=np.float32)
+        self.centroid_sums = np.asarray(centroid_sums, dtype=np.float32).reshape(-1, dim)
+        self.centroid_counts = np.asarray(centroid_counts, dtype=np.int64)
+        self.term_counts = Counter(dict(term_counts))
+        self.epoch = int(epoch)
+
+    def to_doc(self) -> Dict[str, Any]:
+        return {
+            "v": STATE_VERSION,
+            "dim": self.dim,
+            "epoch": self.epoch,
+            "count": self.count,
+            "sum": _pack(self.vector_sum, self.dim),
+            "centroid_sums": _pack(self.centroid_sums, self.dim),
+            "centroid_counts": [int(c) for c in self.centroid_counts],
+            "term_counts": [[t, int(c)] for t, c in self.term_counts.most_common()],
+        }
+
+    @classmethod
+    def from_doc(cls, doc: Mapping[str, Any]) -> "Contribution":
+        if doc.get("v") != STATE_VERSION:
+            raise ValueError(f"Unsupported contribution version {doc.get('v')!r}")
+        dim = int(doc["dim"])
+        return cls(
+            dim=dim,
+            count=doc["count"],
+            vector_sum=_unpack(doc["sum"], dim)[0],
+            centroid_sums=_unpack(doc.get("centroid_sums"), dim),
+            centroid_counts=doc.get("centroid_counts") or [],
+            term_counts={t: c for t, c in doc.get("term_counts") or []},
+            epoch=doc.get("epoch", 0),
+        )
+
+
+class ProfileState:
+    """Running sums for one profile (see module doc)."""
+
+    def __init__(
+        self,
+        dim: int,
+        count: int = 0,
+        vector_sum: Optional[np.ndarray] = None,
+        centroid_sums: Optional[np.ndarray] = None,
+        centroid_counts: Optional[Sequence[int]] = None,
+        term_counts: Optional[Mapping[str, int]] = None,
+        documents: Iterable[str] = (),
+        epoch: int = 0,
+        rev: int = 0,
+    ) -> None:
+        self.dim = dim
+        self.count = int(count)
+        self.vector_sum = np.zeros(dim, dtype=np.float32) if vector_sum is None else np.asarray(vector_sum, dtype=np.float32)
+        self.centroid_sums = (
+            np.zeros((0, dim), dtype=np.float32) if centroid_sums is None
+            else np.asarray(centroid_sums, dtype=np.float32).reshape(-1, dim)
+        )
+        self.centroid_counts = np.asarray(centroid_counts if centroid_counts is not None else [], dtype=np.int64)
+        self.term_counts = Counter(dict(term_counts or {}))
+        self.documents = set(documents)
+        self.epoch = int(epoch)
+        self.rev = int(rev)
+
+    @classmethod
+    def from_profile(cls, profile: Mapping[str, Any], dim: int) -> "ProfileState":
+        """The stored state, or an empty one (rev 0) for profiles that have none."""
+        doc = profile.get(STATE_FIELD)
+        if not doc:
+            return cls(dim)
+        if doc.get("v") != STATE_VERSION:
+            raise ValueError(f"Unsupported profile state version {doc.get('v')!r}")
+        dim = int(doc["dim"])
+        return cls(
+            dim=dim,
+            count=doc["count"],
+            vector_sum=_unpack(doc["sum"], dim)[0],
+            centroid_sums=_unpack(doc.get("centroid_sums"), dim),
+            centroid_counts=doc.get("centroid_counts") or [],
+            term_counts={t: c for t, c in doc.get("term_counts") or []},
+            documents=doc.get("documents") or [],
+            epoch=doc.get("epoch", 0),
+            rev=doc.get("rev", 0),
+        )
+
+    def to_doc(self) -> Dict[str, Any]:
+        """The state to $set, with rev bumped (callers match on the old rev)."""
+        return {
+            "v": STATE_VERSION,
+            "dim": self.dim,
+            "rev": self.rev + 1,
+            "epoch": self.epoch,
+            "count": self.count,
+            "sum": _pack(self.vector_sum, self.dim),
+            "centroid_sums": _pack(self.centroid_sums, self.dim),
+            "centroid_counts": [int(c) for c in self.centroid_counts],
+            "term_counts": [[t, int(c)] for t, c in self.term_counts.most_common()],
+            "documents": sorted(self.documents),
+        }
+
+    @property
+    def k(self) -> int:
+        return len(self.centroid_counts)
+
+    def contribution(self, vectors: Sequence[Sequence[float]], keywords: Sequence[Sequence[Any]]) -> Contribution:
+        """A document's contribution, its vectors assigned to the current centroids."""
+        arr = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        centroid_sums = np.zeros((self.k, self.dim), dtype=np.float32)
+        centroid_counts = np.zeros(self.k, dtype=np.int64)
+        if self.k and len(arr):
+            unit = _unit(arr)
+            labels = np.argmax(unit @ _unit(self.centroid_sums).T, axis=1)
+            np.add.at(centroid_sums, labels, unit)
+            centroid_counts = np.bincount(labels, minlength=self.k)
+        return Contribution(
+            dim=self.dim,
+            count=len(arr),
+            vector_sum=arr.sum(axis=0) if len(arr) else np.zeros(self.dim, dtype=np.float32),
+            centroid_sums=centroid_sums,
+            centroid_counts=centroid_counts,
+            term_counts={t: c for t, c in keywords},
+            epoch=self.epoch,
+        )
+
+    def add(self, document_id: str, contrib: Contribution) -> bool:
+        """Fold in a document once; False if it is already applied."""
+        if document_id in self.documents:
+            return False
+        self.documents.add(document_id)
+        self.count += contrib.count
+        self.vector_sum += contrib.vector_sum
+        self.term_counts.update(contrib.term_counts)
+        if contrib.epoch == self.epoch and len(contrib.centroid_counts) == self.k:
+            self.centroid_sums += contrib.centroid_sums
+            self.centroid_counts += contrib.centroid_counts
+        elif self.k:
+            self.epoch = -1  # assigned under other centroids: force a re-cluster
+        return True
+
+    def subtract(self, document_id: str, contrib: Contribution) -> bool:
+        """
+        Take a document's contribution back out; False if it was not applied.
+        Centroid sums are only subtracted when assigned under this epoch,
+        otherwise needs_recluster() reports True.
+        """
+        if document_id not in self.documents:
+            return False
+        self.documents.discard(document_id)
+        self.count = max(0, self.count - contrib.count)
+        self.vector_sum -= contrib.vector_sum
+        self.term_counts.subtract(contrib.term_counts)
+        self.term_counts = +self.term_counts
+        if contrib.epoch == self.epoch and len(contrib.centroid_counts) == self.k:
+            self.centroid_sums -= contrib.centroid_sums
+            self.centroid_counts = np.maximum(self.centroid_counts - contrib.centroid_counts, 0)
+        else:
+            self.epoch = -1  # stale: force a re-cluster
+        if not self.count:
+            self.vector_sum[:] = 0.0
+            self.centroid_sums = np.zeros((0, self.dim), dtype=np.float32)
+            self.centroid_counts = np.zeros(0, dtype=np.int64)
+        return True
+
+    def needs_recluster(self, max_centroids: int = MAX_PROFILE_CENTROIDS) -> bool:
+        if self.epoch < 0:
+            return True
+        return choose_k(self.count, max_centroids) > int((self.centroid_counts > 0).sum())
+
+    def recluster(self, vectors_by_document: Mapping[str, np.ndarray], max_centroids: int = MAX_PROFILE_CENTROIDS) -> Dict[str, Dict[str, Any]]:
+        """
+        Re-run k-means over the stored vectors of the applied documents.
+        Starts a new epoch; returns {document_id: contribution fields to
+        $set} so each document's centroid share can be re-tagged.
+        """
+        docs = [d for d in vectors_by_document if d in self.documents and len(vectors_by_document[d])]
+        self.epoch = max(self.epoch, 0) + 1
+        self.centroid_sums = np.zeros((0, self.dim), dtype=np.float32)
+        self.centroid_counts = np.zeros(0, dtype=np.int64)
+        if not docs:
+            return {}
+
+        centroids, _ = kmeans_centroids(np.concatenate([vectors_by_document[d] for d in docs]), max_centroids)
+        centers = np.asarray(centroids, dtype=np.float32)
+        k = len(centers)
+        self.centroid_sums = np.zeros((k, self.dim), dtype=np.float32)
+        self.centroid_counts = np.zeros(k, dtype=np.int64)
+        updates: Dict[str, Dict[str, Any]] = {}
+        for d in docs:
+            unit = _unit(np.asarray(vectors_by_document[d], dtype=np.float32))
+            labels = np.argmax(unit @ centers.T, axis=1)
+            sums = np.zeros((k, self.dim), dtype=np.float32)
+            np.add.at(sums, labels, unit)
+            counts = np.bincount(labels, minlength=k)
+            self.centroid_sums += sums
+            self.centroid_counts += counts
+            updates[d] = {
+                "centroid_sums": _pack(sums, self.dim),
+                "centroid_counts": [int(c) for c in counts],
+                "epoch": self.epoch,
+            }
+        return updates
+
+    def embedding(self) -> Optional[np.ndarray]:
+        """Mean of all chunk vectors, or None for an empty profile."""
+        return self.vector_sum / self.count if self.count else None
+
+    def centroids(self) -> Tuple[List[List[float]], List[int]]:
+        """Unit centroids + sizes, largest first, empty clusters dropped."""
+        if not self.k:
+            return [], []
+        centers = _unit(self.centroid_sums)
+        order = [c for c in np.argsort(-self.centroid_counts, kind="stable") if self.centroid_counts[c] > 0]
+        return [centers[c].tolist() for c in order], [int(self.centroid_counts[c]) for c in order]
+
+    def keywords(self, top_n: int = PROFILE_KEYWORDS) -> List[List]:
+        return [[t, int(c)] for t, c in self.term_counts.most_common(top_n) if c > 0]
@@ -0,0 +1,188 @@
+# embeddings/quantization.py
+#
+# Compressed vector scans: a PCA projection learned from the stored vectors,
+# int8 codes per row, and exact rescoring of the best candidates against the
+# full-precision rows kept on disk.
+#
+#   python -m embeddings.quantization --collection tender_embeddings --dims 128
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+COMPRESS_DIMS = int(os.getenv("COMPRESS_DIMS", "128"))
+COMPRESS_SAMPLE = int(os.getenv("COMPRESS_SAMPLE", "100000"))
+# Candidates rescored at full precision = n_results * RESCORE_FACTOR
+RESCORE_FACTOR = float(os.getenv("RESCORE_FACTOR", "10"))
+SCAN_BLOCK = int(os.getenv("FLAT_SCAN_BLOCK", "65536"))
+
+logger = logging.getLogger(__name__)
+
+
+class PcaInt8Codec:
+    """
+    v -> int8(P (v - mean) / scale). For a query q the approximate inner
+    product is codes @ (scale * P q) (+ mean·q, constant per query), so the
+    ranking needs no decoding.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, scale: np.ndarray, explained: float = 0.0) -> None:
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)  # (dims, d)
+        self.scale = scale.astype(np.float32)            # (dims,)
+        self.explained = float(explained)
+
+    @property
+    def dims(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, sample: np.ndarray, dims: int = COMPRESS_DIMS) -> "PcaInt8Codec":
+        sample = np.asarray(sample, dtype=np.float32)
+        dims = max(1, min(dims, sample.shape[1]))
+        mean = sample.mean(axis=0)
+        centered = sample - mean
+        cov = (centered.T @ centered) / max(1, len(sample) - 1)
+        evals, evecs = np.linalg.eigh(cov.astype(np.float64))
+        order = np.argsort(evals)[::-1]
+        components = evecs[:, order[:dims]].T
+        explained = float(evals[order[:dims]].sum() / max(evals.sum(), 1e-12))
+
+        projected = centered @ components.T.astype(np.float32)
+        # 99.9th percentile, not max: a few outliers would waste the int8 range
+        scale = np.percentile(np.abs(projected), 99.9, axis=0) / 127.0
+        scale[scale <= 0] = 1.0
+        return cls(mean, components, scale, explained)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        projected = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+        return np.clip(np.rint(projected / self.scale), -127, 127).astype(np.int8)
+
+    def project_queries(self, queries: np.ndarray) -> np.ndarray:
+        return (np.asarray(queries, dtype=np.float32) @ self.components.T) * self.scale
+
+    def save(self, path: Path) -> None:
+        tmp = Path(f"{path}.tmp{os.getpid()}.npz")
+        np.savez(tmp, mean=self.mean, components=self.components, scale=self.scale, explained=self.explained)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "PcaInt8Codec":
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"], data["scale"], float(data["explained"]))
+
+
+def blocked_top_k(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    mask: np.ndarray,
+    n: int,
+    block: int = SCAN_BLOCK,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-n rows of `matrix` (any dtype, e.g. a float32 or int8 memmap)
+    by inner product with each query, over the rows where `mask` is set.
+    Returns (row indices, scores), (m, n) each, best first; -1 pads.
+    """
+    m = queries.shape[0]
+    best_s = np.full((m, n), -np.inf, dtype=np.float32)
+    best_i = np.full((m, n), -1, dtype=np.int64)
+    if n <= 0:
+        return best_i, best_s
+
+    eligible = np.flatnonzero(mask)
+    dense = len(eligible) * 2 > len(mask)
+    if dense:
+        spans = [(a, min(a + block, len(mask))) for a in range(0, len(mask), block)]
+    else:
+        spans = [(a, min(a + block, len(eligible))) for a in range(0, len(eligible), block)]
+
+    for a, b in spans:
+        if dense:
+            rows = np.arange(a, b, dtype=np.int64)
+            scores = queries @ np.asarray(matrix[a:b], dtype=np.float32).T
+            scores[:, ~mask[a:b]] = -np.inf
+        else:
+            rows = eligible[a:b]
+            scores = queries @ np.asarray(matrix[rows], dtype=np.float32).T
+
+        cat_s = np.concatenate([best_s, scores], axis=1)
+        cat_i = np.concatenate([best_i, np.broadcast_to(rows, scores.shape)], axis=1)
+        keep = np.argpartition(-cat_s, n - 1, axis=1)[:, :n]
+        best_s = np.take_along_axis(cat_s, keep, axis=1)
+        best_i = np.take_along_axis(cat_i, keep, axis=1)
+
+    order = np.argsort(-best_s, axis=1)
+    best_i = np.take_along_axis(best_i, order, axis=1)
+    best_s = np.take_along_axis(best_s, order, axis=1)
+    best_i[~np.isfinite(best_s)] = -1
+    return best_i, best_s
+
+
+def compressed_top_k(
+    queries: np.ndarray,
+    codec: PcaInt8Codec,
+    codes: np.ndarray,
+    vectors: np.ndarray,
+    mask: np.ndarray,
+    n: int,
+    rescore_factor: float = RESCORE_FACTOR,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scan the int8 codes, then rescore the top n * rescore_factor candidates
+    with the full-precision `vectors`. Rows past the end of `codes` (written
+    before the codes caught up) are always rescored.
+    """
+    n_codes = min(len(codes), len(mask))
+    n_cand = min(int(mask.sum()), max(n, int(np.ceil(n * rescore_factor))))
+    approx_i, _ = blocked_top_k(codec.project_queries(queries), codes, mask[:n_codes], n_cand)
+    tail = np.flatnonzero(mask[n_codes:]) + n_codes
+
+    best_i = np.full((len(queries), n), -1, dtype=np.int64)
+    best_s = np.full((len(queries), n), -np.inf, dtype=np.float32)
+    for q, cand in enumerate(approx_i):
+        rows = np.unique(np.concatenate([cand[cand >= 0], tail]))  # sorted: sequential disk reads
+        if not len(rows):
+            continue
+        exact = np.asarray(vectors[rows], dtype=np.float32) @ queries[q]
+        top = np.argsort(-exact)[:n]
+        best_i[q, : len(top)] = rows[top]
+        best_s[q, : len(top)] = exact[top]
+    return best_i, best_s
+
+
+def main():
+    from dotenv import load_dotenv
+
+    try:
+        from embeddings.vector_store import get_vector_store
+    except ModuleNotFoundError:
+        from vector_store import get_vector_store
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Fit the PCA+int8 codec of a flat vector store and encode its rows")
+    parser.add_argument("--collection", default=os.getenv("TENDER_CHROMA_COLLECTION", "tender_embeddings"))
+    parser.add_argument("--dims", type=int, default=COMPRESS_DIMS)
+    parser.add_argument("--sample", type=int, default=COMPRESS_SAMPLE)
+    args = parser.parse_args()
+
+    store = get_vector_store(name=args.collection)
+    if not hasattr(store, "fit_compression"):
+        raise SystemExit("Compressed mode needs VECTOR_BACKEND=flat or hnsw")
+    codec = store.fit_compression(dims=args.dims, sample_size=args.sample)
+    if codec is None:
+        logger.info("Store %s is empty; nothing to fit", args.collection)
+    else:
+        logger.info("Fitted %d-dim codec (%.1f%% variance explained)", codec.dims, 100 * codec.explained)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# embeddings/snapshot.py
+#
+# Snapshots of the vector collections as columnar files, so a lost or
+# corrupted data/chroma (or data/vectors) is restored in minutes instead of
+# re-running Docling and re-embedding everything, and new nodes can be
+# seeded from a copy.
+#
+# One file per collection (Parquet, or Arrow IPC with --format arrow):
+#
+#   id         string
+#   document   string                    chunk text
+#   metadata   string                    JSON of the chunk metadata (keys vary by doc_type)
+#   embedding  fixed_size_list<float32>  one vector per chunk
+#
+# plus manifest.json (collections, row counts, dimension, embedding model)
+# and the tender_partitions registry when the index is partitioned. Export
+# pages through the store with get(limit, offset), so stop the indexers (or
+# accept a slightly fuzzy snapshot) while it runs. Import bulk-upserts in
+# large batches and never loads the model; --bm25 rebuilds the tender BM25
+# index from the same rows.
+#
+# pyarrow is only needed here: pip install pyarrow
+#
+#   python -m embeddings.snapshot --export data/snapshots/2024-06-01
+#   python -m embeddings.snapshot --import data/snapshots/2024-06-01 --drop --bm25
+#   python -m embeddings.snapshot --import data/snapshots/2024-06-01 --backend flat   # chroma -> flat
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from embeddings.vector_store import VECTOR_BACKEND, drop_vector_store, get_vector_store
+    from embeddings.partitions import PARTITIONS_COLLECTION, TENDER_COLLECTION_NAME
+    from embeddings.bm25_index import Bm25Writer, index_path
+    from embeddings.index_state import bump_generation
+    from embeddings.tender_embedder import DEFAULT_MODEL_NAME
+except ModuleNotFoundError:
+    from vector_store import VECTOR_BACKEND, drop_vector_store, get_vector_store
+    from partitions import PARTITIONS_COLLECTION, TENDER_COLLECTION_NAME
+    from bm25_index import Bm25Writer, index_path
+    from index_state import bump_generation
+    from tender_embedder import DEFAULT_MODEL_NAME
+
+PROFILE_COLLECTION_NAME = os.getenv("PROFILE_CHROMA_COLLECTION", "profile_embeddings")
+# Rows per get()/upsert() page; Chroma's default max batch is ~5.4k
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "5000"))
+FORMAT_VERSION = 1
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+MANIFEST = "manifest.json"
+
+logger = logging.getLogger(__name__)
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ModuleNotFoundError as exc:
+        raise RuntimeError("Snapshots need pyarrow (pip install pyarrow)") from exc
+    return pa
+
+
+def _schema(pa, dim: int, collection: str):
+    return pa.schema(
+        [
+            ("id", pa.string()),
+            ("document", pa.string()),
+            ("metadata", pa.string()),
+            ("embedding", pa.list_(pa.float32(), dim)),
+        ],
+        metadata={"collection": collection, "format_version": str(FORMAT_VERSION)},
+    )
+
+
+def _open_writer(pa, path: Path, schema, fmt: str):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        # Vectors barely compress; zstd still pays off on the text and metadata columns
+        return pq.ParquetWriter(str(path), schema, compression="zstd")
+    import pyarrow.ipc
+
+    return pa.ipc.new_file(str(path), schema)
+
+
+def _iter_batches(path: Path, batch_size: int) -> Iterator[Any]:
+    """Record batches of a snapshot file, whichever format it was written in."""
+    pa = _pyarrow()
+    if path.suffix == FORMATS["parquet"]:
+        import pyarrow.parquet as pq
+
+        yield from pq.ParquetFile(str(path)).iter_batches(batch_size=batch_size)
+        return
+    import pyarrow.ipc
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for start in range(0, batch.num_rows, batch_size):
+                yield batch.slice(start, batch_size)
+
+
+def export_collection(
+    name: str,
+    path: Path,
+    fmt: str = "parquet",
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    backend: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Stream collection `name` into `path`; returns its manifest entry (rows=0 writes no file)."""
+    pa = _pyarrow()
+    store = get_vector_store(name=name, backend=backend)
+    writer = None
+    rows = 0
+    dim = 0
+    models = set()
+    started = time.perf_counter()
+    try:
+        offset = 0
+        while True:
+            page = store.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            ids = list(page.get("ids") or [])
+            if not ids:
+                break
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            metadatas = [m or {} for m in (page.get("metadatas") or [None] * len(ids))]
+            documents = page.get("documents")
+            if documents is None:
+                documents = [None] * len(ids)
+            models.update(m["model_name"] for m in metadatas if m.get("model_name"))
+
+            if writer is None:
+                dim = int(vectors.shape[1])
+                schema = _schema(pa, dim, name)
+                writer = _open_writer(pa, path, schema, fmt)
+            batch = pa.record_batch(
+                [
+                    pa.array(ids, pa.string()),
+                    pa.array(list(documents), pa.string()),
+                    pa.array([json.dumps(m, separators=(",", ":")) for m in metadatas], pa.string()),
+                    pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel(), pa.float32()), dim),
+                ],
+                schema=schema,
+            )
+            writer.write_table(pa.Table.from_batches([batch]))
+
+            rows += len(ids)
+            offset += len(ids)
+            logger.info("[%s] exported %d rows (%.0f rows/s)", name, rows, rows / (time.perf_counter() - started))
+            if len(ids) < batch_size:
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return {
+        "name": name,
+        "file": path.name if rows else None,
+        "rows": rows,
+        "dim": dim,
+        "models": sorted(models),
+        "bytes": path.stat().st_size if rows else 0,
+    }
+
+
+def _tender_rows(ids, documents, metadatas) -> Iterator[tuple]:
+    """(chunk_id, text, tender_id, document_id) of the tender chunks in one batch."""
+    for chunk_id, text, meta in zip(ids, documents, metadatas):
+        meta = meta or {}
+        if meta.get("doc_type") == "tender":
+            yield chunk_id, text or "", meta.get("tender_id"), meta.get("document_id")
+
+
+def _rebuild_split_documents(path: Path, batch_size: int, bm25: Bm25Writer, split: set) -> None:
+    """
+    Second pass for documents whose chunks were not contiguous in the file:
+    write each one again as a single segment, which tombstones the partial
+    segment the first pass committed.
+    """
+    chunks: Dict[str, List[tuple]] = {}
+    tender_ids: Dict[str, Optional[str]] = {}
+    for batch in _iter_batches(path, batch_size):
+        metadatas = [json.loads(m) if m else None for m in batch.column("metadata").to_pylist()]
+        rows = _tender_rows(batch.column("id").to_pylist(), batch.column("document").to_pylist(), metadatas)
+        for chunk_id, text, tender_id, document_id in rows:
+            if document_id in split:
+                chunks.setdefault(document_id, []).append((chunk_id, text))
+                tender_ids[document_id] = tender_id
+    for document_id, doc_chunks in chunks.items():
+        bm25.add_document(document_id, tender_ids[document_id], doc_chunks)
+
+
+def import_collection(
+    path: Path,
+    name: str,
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    backend: Optional[str] = None,
+    bm25: Optional[Bm25Writer] = None,
+) -> int:
+    """
+    Bulk-upsert one snapshot file into collection `name`. With `bm25`, the
+    collection's tender chunks are also added to that writer and committed
+    about every `batch_size` chunks, always at a document_id boundary: a
+    commit tombstones earlier segments of the same document, so a
+    document's chunks must land in a single segment. Export writes a
+    document's chunks together; the few that are not are rebuilt in a
+    second pass.
+    """
+    store = get_vector_store(name=name, backend=backend)
+    rows = 0
+    started = time.perf_counter()
+    buffered: set = set()     # documents in the uncommitted BM25 buffer
+    buffered_rows = 0
+    committed: set = set()    # documents already written to a segment
+    split: set = set()        # ... and seen again afterwards
+    current = None
+    for batch in _iter_batches(path, batch_size):
+        ids = batch.column("id").to_pylist()
+        documents = batch.column("document").to_pylist()
+        metadatas = [json.loads(m) if m else None for m in batch.column("metadata").to_pylist()]
+        column = batch.column("embedding")
+        vectors = column.flatten().to_numpy(zero_copy_only=False).reshape(len(ids), column.type.list_size)
+
+        store.upsert(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+        if bm25 is not None:
+            for chunk_id, text, tender_id, document_id in _tender_rows(ids, documents, metadatas):
+                if document_id != current:
+                    current = document_id
+                    if buffered_rows >= batch_size:
+                        bm25.commit()
+                        committed |= buffered
+                        buffered, buffered_rows = set(), 0
+                if document_id in committed:
+                    split.add(document_id)
+                    continue
+                bm25.add(chunk_id, text, tender_id, document_id)
+                buffered.add(document_id)
+                buffered_rows += 1
+
+        rows += len(ids)
+        logger.info("[%s] imported %d rows (%.0f rows/s)", name, rows, rows / (time.perf_counter() - started))
+
+    if bm25 is not None:
+        bm25.commit()
+        if split:
+            logger.info("[%s] rebuilding BM25 for %d non-contiguous documents", name, len(split))
+            _rebuild_split_documents(path, batch_size, bm25, split)
+    return rows
+
+
+def _partition_names(db) -> List[str]:
+    return sorted(doc["_id"] for doc in db[PARTITIONS_COLLECTION].find({}, {"_id": 1}))
+
+
+def export_snapshot(
+    out_dir: str,
+    collections: Optional[Sequence[str]] = None,
+    db=None,
+    fmt: str = "parquet",
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    backend: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Export `collections` (default: the tender collection, every registered
+    partition and the profile collection) into `out_dir` and write the manifest.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown snapshot format {fmt!r}; expected one of {tuple(FORMATS)}")
+    root = Path(out_dir)
+    root.mkdir(parents=True, exist_ok=True)
+
+    registry: List[dict] = []
+    if collections is None:
+        if db is not None:
+            registry = list(db[PARTITIONS_COLLECTION].find())
+        collections = [TENDER_COLLECTION_NAME] + [d["_id"] for d in registry] + [PROFILE_COLLECTION_NAME]
+
+    entries = [export_collection(name, root / f"{name}{FORMATS[fmt]}", fmt, batch_size, backend) for name in collections]
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "backend": (backend or VECTOR_BACKEND).lower(),
+        "format": fmt,
+        "collections": [e for e in entries if e["rows"]],
+    }
+    if registry:
+        from bson import json_util
+
+        # Extended JSON keeps the registry's datetimes / ints typed on the way back in
+        manifest["partitions"] = json.loads(json_util.dumps(registry))
+    (root / MANIFEST).write_text(json.dumps(manifest, indent=2) + "\n")
+    return manifest
+
+
+def read_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    manifest = json.loads((Path(snapshot_dir) / MANIFEST).read_text())
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format_version {manifest.get('format_version')!r}")
+    return manifest
+
+
+def import_snapshot(
+    snapshot_dir: str,
+    collections: Optional[Sequence[str]] = None,
+    db=None,
+    drop: bool = False,
+    rebuild_bm25: bool = False,
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    backend: Optional[str] = None,
+    force: bool = False,
+) -> Dict[str, int]:
+    """
+    Load a snapshot into the configured (or `backend`) vector store.
+    drop=True empties each target collection first (and the BM25 index when
+    rebuilding it). Refuses a snapshot embedded with a different model than
+    EMBEDDING_MODEL_NAME unless force=True: queries would be embedded with
+    one model and matched against vectors of another.
+    """
+    root = Path(snapshot_dir)
+    manifest = read_manifest(snapshot_dir)
+    entries = [e for e in manifest["collections"] if collections is None or e["name"] in collections]
+
+    models = sorted({m for e in entries for m in e.get("models", [])})
+    if not force and models and models != [DEFAULT_MODEL_NAME]:
+        raise ValueError(
+            f"Snapshot was embedded with {', '.join(models)}, but EMBEDDING_MODEL_NAME is {DEFAULT_MODEL_NAME}"
+        )
+
+    bm25_root = index_path(TENDER_COLLECTION_NAME)
+    if rebuild_bm25 and drop and collections is None:
+        shutil.rmtree(bm25_root, ignore_errors=True)
+
+    imported: Dict[str, int] = {}
+    for entry in entries:
+        name = entry["name"]
+        if drop:
+            drop_vector_store(name, backend)
+        # Tender chunks only live in the tender collection and its partitions
+        is_tender = name == TENDER_COLLECTION_NAME or name.startswith(f"{TENDER_COLLECTION_NAME}__")
+        bm25 = Bm25Writer(bm25_root) if rebuild_bm25 and is_tender else None
+        imported[name] = import_collection(root / entry["file"], name, batch_size, backend, bm25)
+        if imported[name] != entry["rows"]:
+            logger.warning("[%s] imported %d rows, manifest says %d", name, imported[name], entry["rows"])
+
+    if db is not None:
+        if manifest.get("partitions"):
+            from bson import json_util
+
+            for doc in json_util.loads(json.dumps(manifest["partitions"])):
+                if collections is None or doc["_id"] in collections:
+                    db[PARTITIONS_COLLECTION].replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        # Search results cached against the old index are stale now
+        bump_generation(db)
+    return imported
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Export / import vector collection snapshots")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--export", metavar="DIR", help="write a snapshot into DIR")
+    mode.add_argument("--import", dest="import_dir", metavar="DIR", help="load the snapshot in DIR")
+    mode.add_argument("--show", metavar="DIR", help="print a snapshot's manifest")
+    parser.add_argument("--collection", action="append", help="limit to these collections (repeatable)")
+    parser.add_argument("--format", choices=tuple(FORMATS), default="parquet")
+    parser.add_argument("--backend", default=None, help=f"vector backend to read/write (default {VECTOR_BACKEND})")
+    parser.add_argument("--batch-size", type=int, default=SNAPSHOT_BATCH_SIZE)
+    parser.add_argument("--drop", action="store_true", help="empty target collections before importing")
+    parser.add_argument("--bm25", action="store_true", help="rebuild the tender BM25 index while importing")
+    parser.add_argument("--force", action="store_true", help="import even if the embedding model differs")
+    args = parser.parse_args()
+
+    if args.show:
+        manifest = read_manifest(args.show)
+        print(f"{manifest['created_at']}  backend={manifest['backend']}  format={manifest['format']}")
+        for e in manifest["collections"]:
+            print(f"{e['name']:<50} {e['rows']:>10} rows  dim={e['dim']}  {e['bytes'] / 1024 / 1024:>8.1f} MB  {','.join(e['models'])}")
+        return
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("DB_NAME", "tender_db")]
+    if args.export:
+        manifest = export_snapshot(args.export, args.collection, db, args.format, args.batch_size, args.backend)
+        rows = sum(e["rows"] for e in manifest["collections"])
+        logger.info("Exported %d rows from %d collections to %s", rows, len(manifest["collections"]), args.export)
+    else:
+        imported = import_snapshot(
+            args.import_dir, args.collection, db,
+            drop=args.drop, rebuild_bm25=args.bm25, batch_size=args.batch_size, backend=args.backend, force=args.force,
+        )
+        logger.info("Imported %d rows into %d collections", sum(imported.values()), len(imported))
+
+
+if __name__ == "__main__":
+    main()
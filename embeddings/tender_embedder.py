@@ -3,9 +3,15 @@
 from __future__ import annotations
 
 import os
+import threading
+import time
+from functools import lru_cache
 from typing import Iterable, List, Sequence, Union
 
-from sentence_transformers import SentenceTransformer
+try:
+    from utils import metrics
+except ModuleNotFoundError:  # run from inside embeddings/ without the repo root on sys.path
+    metrics = None
 
 DEFAULT_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
 
@@ -13,7 +19,23 @@ DEFAULT_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
 class TenderEmbedder:
     def __init__(self, model_name: str | None = None) -> None:
         self.model_name = model_name or DEFAULT_MODEL_NAME
-        self.model = SentenceTransformer(self.model_name)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """
+        The SentenceTransformer, loaded on first use: importing
+        sentence_transformers pulls in torch, and loading the weights takes
+        seconds, so neither happens until something is actually embedded.
+        """
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
 
     def embed(self, texts: Union[str, Sequence[str]]) -> List[List[float]]:
         """
@@ -23,13 +45,39 @@ class TenderEmbedder:
         if not normalized:
             return []
 
+        start = time.perf_counter()
         vectors = self.model.encode(
             normalized,
             show_progress_bar=False,
             normalize_embeddings=True,
         )
+        if metrics is not None:
+            metrics.EMBED_BATCH_SECONDS.labels(self.model_name).observe(time.perf_counter() - start)
+            metrics.EMBED_TEXTS.labels(self.model_name).inc(len(normalized))
         return vectors.tolist()
 
+    @property
+    def dim(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    @property
+    def max_tokens(self) -> int:
+        """
+        Largest chunk (in tokens, excluding special tokens) the model encodes
+        without truncation.
+        """
+        limit = int(getattr(self.model, "max_seq_length", 0) or 512)
+        return max(1, limit - 2)  # [CLS] ... [SEP]
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Number of model tokens in text (no special tokens). Used as the
+        chunker's length_fn for token-aware budgeting.
+        """
+        if not text:
+            return 0
+        return len(self.model.tokenizer.tokenize(text))
+
     @staticmethod
     def _normalize_texts(texts: Union[str, Sequence[str]]) -> List[str]:
         if isinstance(texts, str):
@@ -39,3 +87,17 @@ class TenderEmbedder:
             return [t for t in texts if isinstance(t, str) and t.strip()]
 
         return []
+
+
+@lru_cache(maxsize=4)
+def _shared_embedder(model_name: str) -> TenderEmbedder:
+    return TenderEmbedder(model_name)
+
+
+def get_embedder(model_name: str | None = None) -> TenderEmbedder:
+    """
+    Process-wide embedder for `model_name` (default EMBEDDING_MODEL_NAME).
+    The indexers, the profile worker and the benchmarks share it, so the
+    model is loaded once per process, on first use.
+    """
+    return _shared_embedder(model_name or DEFAULT_MODEL_NAME)
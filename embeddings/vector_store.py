@@ -3,12 +3,15 @@
 from __future__ import annotations
 
 import os
+import threading
 from pathlib import Path
 from functools import lru_cache
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Protocol, Sequence, Tuple
 
-import chromadb
-from chromadb.config import Settings
+try:
+    from utils import metrics
+except ModuleNotFoundError:  # run from inside embeddings/ without the repo root on sys.path
+    metrics = None
 
 # ✅ Make the path explicit + stable
 DEFAULT_CHROMA_PATH = os.getenv(
@@ -17,12 +20,60 @@ DEFAULT_CHROMA_PATH = os.getenv(
 )
 DEFAULT_COLLECTION = os.getenv("CHROMA_COLLECTION", "tender_embeddings")
 
+# chroma | flat (memory-mapped exact search) | hnsw (flat + hnswlib graph)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+VECTOR_BACKENDS = ("chroma", "flat", "hnsw")
+DEFAULT_FLAT_PATH = os.getenv(
+    "FLAT_STORE_PATH",
+    str(Path(__file__).resolve().parents[1] / "data" / "vectors"),
+)
+
+
+class VectorStore(Protocol):
+    """
+    The subset of the Chroma collection API the indexers and search use.
+    A chromadb Collection satisfies it as-is; flat_store.FlatVectorStore
+    implements it in-process.
+    """
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[Sequence[Optional[str]]] = None,
+        metadatas: Optional[Sequence[Optional[dict]]] = None,
+    ) -> None: ...
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None) -> None: ...
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ...,
+    ) -> Dict[str, Any]: ...
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Sequence[str] = ...,
+    ) -> Dict[str, Any]: ...
+
+    def count(self) -> int: ...
+
 
 @lru_cache(maxsize=1)
-def get_chroma_client(persist_directory: Optional[str] = None) -> chromadb.Client:
+def get_chroma_client(persist_directory: Optional[str] = None) -> "chromadb.Client":
     """
     ✅ Always use PersistentClient for on-disk storage.
     """
+    import chromadb
+    from chromadb.config import Settings
+
     path = persist_directory or DEFAULT_CHROMA_PATH
     os.makedirs(path, exist_ok=True)
 
@@ -41,7 +92,7 @@ def get_chroma_collection(
     name: Optional[str] = None,
     persist_directory: Optional[str] = None,
     space: str = "cosine",
-) -> chromadb.Collection:
+) -> "chromadb.Collection":
     """
     Get or create a Chroma collection with safe defaults.
     """
@@ -57,3 +108,85 @@ def get_chroma_collection(
         raise RuntimeError(
             f"Failed to get/create Chroma collection {collection_name!r}"
         ) from exc
+
+
+# One store object per on-disk location for the life of the process. Never
+# evicted except by drop_vector_store: a second FlatVectorStore on the same
+# directory would have its own lock and cached state (and partitions easily
+# outnumber any fixed cache size). "flat" and "hnsw" share a directory, so
+# they share the key; whichever backend opens it first wins.
+_stores: Dict[Tuple[str, ...], VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_vector_store(
+    name: Optional[str] = None,
+    backend: Optional[str] = None,
+    space: str = "cosine",
+) -> VectorStore:
+    """
+    Vector collection `name` on the configured backend (VECTOR_BACKEND).
+    Every caller in a process shares one store object.
+    """
+    backend = (backend or VECTOR_BACKEND).lower()
+    name = name or DEFAULT_COLLECTION
+    key = _store_key(backend, name)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = _open_vector_store(backend, name, space)
+    return store
+
+
+def _store_key(backend: str, name: str) -> Tuple[str, ...]:
+    """Where the collection lives on disk: the cache key of its store object."""
+    if backend in ("flat", "hnsw"):
+        return ("flat", os.path.realpath(os.path.join(DEFAULT_FLAT_PATH, name)))
+    if backend == "chroma":
+        return ("chroma", os.path.realpath(DEFAULT_CHROMA_PATH), name)
+    raise ValueError(f"Unknown VECTOR_BACKEND {backend!r}; expected one of {VECTOR_BACKENDS}")
+
+
+def _open_vector_store(backend: str, collection_name: str, space: str) -> VectorStore:
+    if backend == "chroma":
+        store = get_chroma_collection(name=collection_name, space=space)
+    elif backend in ("flat", "hnsw"):
+        try:
+            from embeddings.flat_store import FlatVectorStore
+        except ModuleNotFoundError:
+            from flat_store import FlatVectorStore
+
+        store = FlatVectorStore(
+            os.path.join(DEFAULT_FLAT_PATH, collection_name),
+            space=space,
+            use_hnsw=backend == "hnsw",
+        )
+    else:
+        raise ValueError(f"Unknown VECTOR_BACKEND {backend!r}; expected one of {VECTOR_BACKENDS}")
+    # Timed in vector_store_seconds{op, collection}
+    return metrics.InstrumentedStore(store, collection_name) if metrics is not None else store
+
+
+def drop_vector_store(name: str, backend: Optional[str] = None) -> None:
+    """Delete collection `name` and everything stored for it."""
+    backend = (backend or VECTOR_BACKEND).lower()
+    with _stores_lock:
+        _stores.pop(_store_key(backend, name), None)
+    if backend == "chroma":
+        try:
+            from chromadb.errors import NotFoundError
+        except ImportError:  # older chromadb raises ValueError only
+            NotFoundError = ValueError
+        try:
+            get_chroma_client().delete_collection(name=name)
+        except (ValueError, NotFoundError):
+            pass  # already gone
+        return
+    if backend in ("flat", "hnsw"):
+        import shutil
+
+        shutil.rmtree(os.path.join(DEFAULT_FLAT_PATH, name), ignore_errors=True)
+        return
+    raise ValueError(f"Unknown VECTOR_BACKEND {backend!r}; expected one of {VECTOR_BACKENDS}")
@@ -0,0 +1,495 @@
+# indexing_daemon.py
+#
+# Long-running replacement for cron-driven docling_processor.py +
+# embeddings/index_*.py:
+#
+#   tender_documents (docling_status=pending) -> Docling -> docling_outputs
+#   docling_outputs  (indexed != True)        -> chunk -> embed -> Chroma
+#
+# New work is discovered through Mongo change streams; on a standalone
+# mongod (no change streams) each feed falls back to polling on a
+# (watermark field, _id) cursor. Resume tokens / watermarks are persisted in
+# `pipeline_state` so a restart continues where it left off. A failed index
+# run is retried with exponential backoff on failed_at (DAEMON_INDEX_RETRY_*),
+# picked up again by the periodic sweep.
+#
+# Both queues are ordered by priority, then predicted cost (storage/doc_cost.py):
+# profile documents ahead of tender backfill, small documents ahead of big
+# ones. Documents over the slow-lane thresholds get their own queue and
+# workers (DAEMON_SLOW_LANE_WORKERS) so they never block the fast lane.
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import queue
+import signal
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import docling_processor
+from embeddings.index_tenders import index_tender_output
+from storage.doc_cost import (
+    COST_FIELD, INDEX_COST_FIELD, SCHEDULE_SORT, SLOW_LANE, probe_document, schedule_key,
+)
+from storage.indexes import ENSURE_INDEXES_ON_STARTUP, ensure_indexes
+from storage.mongo import get_db
+from utils.metrics import QUEUE_DEPTH, QUEUE_DROPPED, register_mongo_metrics, start_file_exporter, watch_pipeline_backlog
+
+logger = logging.getLogger("indexing_daemon")
+
+POLL_INTERVAL = float(os.getenv("DAEMON_POLL_INTERVAL", "5"))
+SWEEP_INTERVAL = float(os.getenv("DAEMON_SWEEP_INTERVAL", "600"))
+MAX_IN_FLIGHT = int(os.getenv("DAEMON_MAX_IN_FLIGHT", "32"))
+DOCLING_WORKERS = int(os.getenv("DAEMON_DOCLING_WORKERS", "1"))
+INDEX_WORKERS = int(os.getenv("DAEMON_INDEX_WORKERS", "1"))
+SLOW_LANE_WORKERS = int(os.getenv("DAEMON_SLOW_LANE_WORKERS", "1"))
+DRAIN_TIMEOUT = float(os.getenv("DAEMON_DRAIN_TIMEOUT", "300"))
+INDEX_RETRY_BASE_SECONDS = float(os.getenv("DAEMON_INDEX_RETRY_BASE_SECONDS", "300"))
+INDEX_RETRY_MAX_SECONDS = float(os.getenv("DAEMON_INDEX_RETRY_MAX_SECONDS", "21600"))
+INDEX_MAX_ATTEMPTS = int(os.getenv("DAEMON_INDEX_MAX_ATTEMPTS", "5"))
+
+STATE_COLLECTION = "pipeline_state"
+
+# Server errors meaning "this deployment has no change streams"
+_NO_CHANGE_STREAMS = {40573, 40324}
+# Server errors meaning "the stored resume token is no longer usable"
+_RESUME_TOKEN_LOST = {260, 280, 286}
+
+_GET_TIMEOUT = 0.5
+
+
+class _WorkQueue:
+    """
+    Bounded priority queue of document ids (lowest key first, FIFO among
+    equal keys) with de-duplication of in-flight ids. A full queue blocks
+    the producer (the change feed), which is the backpressure path: we
+    simply stop reading the change stream.
+    """
+
+    def __init__(self, name: str, maxsize: int) -> None:
+        self.name = name
+        self._q: "queue.PriorityQueue[Any]" = queue.PriorityQueue(maxsize=max(1, maxsize))
+        self._in_flight: Set[Any] = set()
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        QUEUE_DEPTH.labels(name).set_function(self.depth)
+
+    def put(self, item_id: Any, cancel: threading.Event, key: Tuple = (), block: bool = True) -> bool:
+        """
+        Returns False only when cancelled while waiting for room. With
+        block=False a full queue drops the item instead (it stays pending
+        in Mongo and the next sweep offers it again).
+        """
+        with self._lock:
+            if item_id in self._in_flight:
+                return True
+            self._in_flight.add(item_id)
+
+        entry = (key, next(self._seq), item_id)
+        while not cancel.is_set():
+            try:
+                self._q.put(entry, timeout=_GET_TIMEOUT)
+                return True
+            except queue.Full:
+                if not block:
+                    QUEUE_DROPPED.labels(self.name).inc()
+                    logger.info("[%s] queue full, %s left for the next sweep", self.name, item_id)
+                    break
+                continue
+
+        with self._lock:
+            self._in_flight.discard(item_id)
+        return not cancel.is_set()
+
+    def get(self) -> Optional[Any]:
+        try:
+            return self._q.get(timeout=_GET_TIMEOUT)[-1]
+        except queue.Empty:
+            return None
+
+    def done(self, item_id: Any) -> None:
+        with self._lock:
+            self._in_flight.discard(item_id)
+        self._q.task_done()
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+
+def _index_retry_due(doc: dict) -> bool:
+    """
+    False while a failed index run is backing off (INDEX_RETRY_BASE_SECONDS,
+    doubling per attempt up to INDEX_RETRY_MAX_SECONDS) or out of attempts.
+    """
+    failed_at = doc.get("failed_at")
+    if not isinstance(failed_at, datetime):
+        return True
+    attempts = int(doc.get("index_attempts") or 1)
+    if attempts >= INDEX_MAX_ATTEMPTS:
+        return False
+    if failed_at.tzinfo is None:
+        failed_at = failed_at.replace(tzinfo=timezone.utc)
+    delay = min(INDEX_RETRY_MAX_SECONDS, INDEX_RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+    return (datetime.now(timezone.utc) - failed_at).total_seconds() >= delay
+
+
+class _ChangeFeed:
+    """
+    Emits documents in `collection` matching `match` (the `projection`
+    fields only): a backlog sweep first, in `sweep_sort` order, then a
+    change stream (or watermark polling).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        collection,
+        match: Dict[str, Any],
+        watermark_field: str,
+        sink: Callable[[dict, threading.Event], bool],
+        state,
+        projection: Optional[Dict[str, int]] = None,
+        sweep_sort: Optional[List[Tuple[str, int]]] = None,
+    ) -> None:
+        self.name = name
+        self.collection = collection
+        self.match = match
+        self.watermark_field = watermark_field
+        self.sink = sink
+        self.state = state
+        self.projection = {"_id": 1, **(projection or {})}
+        self.sweep_sort = sweep_sort
+        self._state_id = f"indexing_daemon:{name}"
+        self._last_sweep = 0.0
+
+    # ---- persisted state ----
+    def _load_state(self) -> dict:
+        return self.state.find_one({"_id": self._state_id}) or {}
+
+    def _save_state(self, **fields) -> None:
+        fields["updated_at"] = datetime.now(timezone.utc)
+        self.state.update_one({"_id": self._state_id}, {"$set": fields}, upsert=True)
+
+    # ---- discovery ----
+    def _sweep(self, stopping: threading.Event) -> bool:
+        """Enqueue everything currently matching (startup + periodic safety net)."""
+        self._last_sweep = time.monotonic()
+        cursor = self.collection.find(self.match, self.projection)
+        if self.sweep_sort:
+            cursor = cursor.sort(self.sweep_sort)
+        for doc in cursor:
+            if not self.sink(doc, stopping):
+                return False
+        return True
+
+    def _maybe_sweep(self, stopping: threading.Event) -> bool:
+        if time.monotonic() - self._last_sweep < SWEEP_INTERVAL:
+            return True
+        return self._sweep(stopping)
+
+    def _watch(self, stopping: threading.Event) -> None:
+        pipeline = [
+            {
+                "$match": {
+                    "operationType": {"$in": ["insert", "update", "replace"]},
+                    **{f"fullDocument.{k}": v for k, v in self.match.items()},
+                }
+            }
+        ]
+        token = self._load_state().get("resume_token")
+        with self.collection.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=token,
+            max_await_time_ms=1000,
+        ) as stream:
+            logger.info("[%s] following change stream", self.name)
+            while not stopping.is_set():
+                change = stream.try_next()
+                if change is None:
+                    if not self._maybe_sweep(stopping):
+                        return
+                    continue
+                doc = change.get("fullDocument") or {"_id": change["documentKey"]["_id"]}
+                if not self.sink({k: v for k, v in doc.items() if k in self.projection}, stopping):
+                    return
+                self._save_state(resume_token=stream.resume_token)
+
+    def _poll(self, stopping: threading.Event) -> None:
+        """
+        Page through matching documents in (watermark field, _id) order, so
+        any number of documents sharing one watermark value still advance
+        the cursor; a full page is followed at once by the next one.
+        """
+        logger.info("[%s] polling every %.1fs on %s", self.name, POLL_INTERVAL, self.watermark_field)
+        wf = self.watermark_field
+        page_size = MAX_IN_FLIGHT * 4
+        while not stopping.is_set():
+            state = self._load_state()
+            watermark, watermark_id = state.get("watermark"), state.get("watermark_id")
+            query = dict(self.match)
+            if watermark is not None and watermark_id is not None:
+                query["$or"] = [{wf: {"$gt": watermark}}, {wf: watermark, "_id": {"$gt": watermark_id}}]
+            elif watermark is not None:
+                query[wf] = {"$gte": watermark}  # state saved before _id paging
+
+            seen = 0
+            latest = (watermark, watermark_id)
+            cursor = self.collection.find(query, {**self.projection, wf: 1}).sort([(wf, 1), ("_id", 1)]).limit(page_size)
+            for doc in cursor:
+                if not self.sink(doc, stopping):
+                    return
+                seen += 1
+                if doc.get(wf) is not None:
+                    latest = (doc[wf], doc["_id"])
+
+            if latest != (watermark, watermark_id):
+                self._save_state(watermark=latest[0], watermark_id=latest[1])
+            if not self._maybe_sweep(stopping):
+                return
+            if seen < page_size:
+                stopping.wait(POLL_INTERVAL)
+
+    def run(self, stopping: threading.Event) -> None:
+        try:
+            if not self._sweep(stopping):
+                return
+            while not stopping.is_set():
+                try:
+                    self._watch(stopping)
+                except OperationFailure as exc:
+                    if exc.code in _RESUME_TOKEN_LOST:
+                        logger.warning("[%s] resume token lost, re-sweeping", self.name)
+                        self._save_state(resume_token=None)
+                        if not self._sweep(stopping):
+                            return
+                        continue
+                    if exc.code in _NO_CHANGE_STREAMS:
+                        self._poll(stopping)
+                        return
+                    raise
+                except PyMongoError:
+                    logger.exception("[%s] change stream error, retrying", self.name)
+                    stopping.wait(POLL_INTERVAL)
+        except Exception:
+            logger.exception("[%s] feed crashed", self.name)
+
+
+class IndexingDaemon:
+    def __init__(
+        self,
+        documents_collection: str = "tender_documents",
+        doc_types: Optional[List[str]] = None,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        docling_workers: int = DOCLING_WORKERS,
+        index_workers: int = INDEX_WORKERS,
+        slow_lane_workers: int = SLOW_LANE_WORKERS,
+    ) -> None:
+        db = get_db()
+        self.documents = db[documents_collection]
+        self.docling_outputs = db["docling_outputs"]
+        self.doc_types = doc_types or ["tender"]
+
+        self.indexers: Dict[str, Callable[[dict], bool]] = {"tender": index_tender_output}
+        if "profile" in self.doc_types:
+            # Only when asked for; it shares the embedder with the tender indexer
+            from embeddings.index_profiles import index_profile_output
+
+            self.indexers["profile"] = index_profile_output
+
+        self.docling_q = _WorkQueue("docling", max_in_flight)
+        self.slow_q = _WorkQueue("docling_slow", max_in_flight)
+        self.index_q = _WorkQueue("index", max_in_flight)
+
+        self.stopping = threading.Event()  # stop discovering new work
+        self.aborted = threading.Event()   # drain timed out / second signal
+        self._docling_idle = threading.Event()
+
+        state = db[STATE_COLLECTION]
+        self.feeds = [
+            _ChangeFeed(
+                "docling",
+                self.documents,
+                {"docling_status": "pending"},
+                "updated_at",
+                self._enqueue_docling,
+                state,
+                projection={COST_FIELD: 1, "priority": 1, "doc_type": 1, "profile_id": 1, "local_path": 1},
+                sweep_sort=SCHEDULE_SORT,
+            ),
+            _ChangeFeed(
+                "index",
+                self.docling_outputs,
+                {"doc_type": {"$in": self.doc_types}, "indexed": {"$ne": True}},
+                "extracted_at",
+                self._enqueue_index,
+                state,
+                projection={INDEX_COST_FIELD: 1, "priority": 1, "doc_type": 1, "failed_at": 1, "index_attempts": 1},
+                sweep_sort=[("priority", -1), (f"{INDEX_COST_FIELD}.predicted_s", 1)],
+            ),
+        ]
+        self.max_in_flight = max_in_flight
+        self._docling_count = max(1, docling_workers)
+        self._index_count = max(1, index_workers)
+        self._slow_count = max(1, slow_lane_workers)
+
+    # ---- scheduling ----
+    def _enqueue_docling(self, doc: dict, cancel: threading.Event) -> bool:
+        cost = doc.get(COST_FIELD)
+        if cost is None:
+            # Not probed at insert (older rows / other writers): probe now, it is cheap
+            full = self.documents.find_one({"_id": doc["_id"]}, {"local_path": 1}) if "local_path" not in doc else doc
+            cost = probe_document(self.documents, full) if full else None
+            doc = {**doc, COST_FIELD: cost}
+        if cost and cost.get("lane") == SLOW_LANE:
+            # Never let the slow lane back-pressure the feed
+            return self.slow_q.put(doc["_id"], cancel, schedule_key(doc), block=False)
+        return self.docling_q.put(doc["_id"], cancel, schedule_key(doc))
+
+    def _enqueue_index(self, doc: dict, cancel: threading.Event) -> bool:
+        if not _index_retry_due(doc):
+            return True  # backing off; a later sweep offers it again
+        return self.index_q.put(doc["_id"], cancel, schedule_key(doc, INDEX_COST_FIELD))
+
+    # ---- workers ----
+    def _docling_worker(self, work_q: "_WorkQueue") -> None:
+        while not self.aborted.is_set():
+            item = work_q.get()
+            if item is None:
+                if self.stopping.is_set():
+                    return
+                continue
+            try:
+                doc = self.documents.find_one({"_id": item, "docling_status": "pending"})
+                if doc and docling_processor.process_document(self.documents, doc):
+                    out = self.docling_outputs.find_one(
+                        {"document_id": item}, {INDEX_COST_FIELD: 1, "priority": 1, "doc_type": 1}
+                    )
+                    if out:
+                        # Direct hand-off: don't wait for the index feed to notice
+                        self._enqueue_index(out, self.aborted)
+            except Exception:
+                logger.exception("Docling stage failed for %s", item)
+            finally:
+                work_q.done(item)
+
+    def _index_worker(self) -> None:
+        while not self.aborted.is_set():
+            item = self.index_q.get()
+            if item is None:
+                if self.stopping.is_set() and self._docling_idle.is_set():
+                    return
+                continue
+            try:
+                doc = self.docling_outputs.find_one({"_id": item, "indexed": {"$ne": True}})
+                indexer = self.indexers.get(doc.get("doc_type")) if doc else None
+                if indexer:
+                    indexer(doc)
+            except Exception:
+                logger.exception("Index stage failed for %s", item)
+            finally:
+                self.index_q.done(item)
+
+    # ---- lifecycle ----
+    def stop(self) -> None:
+        if self.stopping.is_set():
+            logger.warning("Second stop signal: aborting drain")
+            self.aborted.set()
+            return
+        logger.info(
+            "Stopping: draining in-flight work (docling=%d, slow=%d, index=%d)",
+            self.docling_q.depth(), self.slow_q.depth(), self.index_q.depth(),
+        )
+        self.stopping.set()
+
+    def run(self) -> None:
+        feed_threads = [
+            threading.Thread(target=f.run, args=(self.stopping,), name=f"feed-{f.name}", daemon=True)
+            for f in self.feeds
+        ]
+        docling_threads = [
+            threading.Thread(target=self._docling_worker, args=(self.docling_q,), name=f"docling-{i}", daemon=True)
+            for i in range(self._docling_count)
+        ] + [
+            threading.Thread(target=self._docling_worker, args=(self.slow_q,), name=f"docling-slow-{i}", daemon=True)
+            for i in range(self._slow_count)
+        ]
+        index_threads = [
+            threading.Thread(target=self._index_worker, name=f"index-{i}", daemon=True)
+            for i in range(self._index_count)
+        ]
+        for t in docling_threads + index_threads + feed_threads:
+            t.start()
+
+        logger.info(
+            "Indexing daemon running (doc_types=%s, max_in_flight=%d)",
+            ",".join(self.doc_types),
+            self.max_in_flight,
+        )
+        while not self.stopping.is_set():
+            self.stopping.wait(1.0)
+
+        # Graceful drain: feeds stop first, then Docling, then indexing.
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        for t in feed_threads + docling_threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._docling_idle.set()
+        for t in index_threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+        if any(t.is_alive() for t in docling_threads + index_threads):
+            self.aborted.set()
+            logger.warning(
+                "Drain timed out; abandoning docling=%d slow=%d index=%d (picked up again on restart)",
+                self.docling_q.depth(),
+                self.slow_q.depth(),
+                self.index_q.depth(),
+            )
+        else:
+            logger.info("Drained cleanly")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", default=os.getenv("DOCS_COLLECTION", "tender_documents"))
+    parser.add_argument("--doc-types", default=os.getenv("DAEMON_DOC_TYPES", "tender"), help="comma separated: tender,profile")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--docling-workers", type=int, default=DOCLING_WORKERS)
+    parser.add_argument("--index-workers", type=int, default=INDEX_WORKERS)
+    parser.add_argument("--slow-lane-workers", type=int, default=SLOW_LANE_WORKERS, help="Docling workers for huge documents")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    register_mongo_metrics()
+    daemon = IndexingDaemon(
+        documents_collection=args.collection,
+        doc_types=[t.strip() for t in args.doc_types.split(",") if t.strip()],
+        max_in_flight=args.max_in_flight,
+        docling_workers=args.docling_workers,
+        index_workers=args.index_workers,
+        slow_lane_workers=args.slow_lane_workers,
+    )
+
+    if ENSURE_INDEXES_ON_STARTUP:
+        ensure_indexes(get_db())
+
+    # METRICS_FILE: queue depths, backlog counts and stage timings for a textfile collector
+    watch_pipeline_backlog(get_db)
+    start_file_exporter()
+
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import os
+import re
 import requests
 import zipfile
 import tempfile
 import time
+from datetime import datetime
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
 from storage.tender_store import upsert_tender
 from storage.pdf_store import upsert_pdf_metadata
+from utils.metrics import PAGE_FETCH_SECONDS, PDF_DOWNLOAD_SECONDS, span, start_file_exporter
 
 BASE_URL = "https://www.mha.gov.in/en/tenders"
 BASE_DOMAIN = "https://www.mha.gov.in"
@@ -24,10 +27,54 @@ DOWNLOAD_TIMEOUT = (5, 30)  # (connect, read) seconds
 MAX_RETRIES = 3
 RETRY_BACKOFF = 1.5
 
+# "01/02/2024 - 15/02/2024", "01-02-2024 to 15-02-2024 17:00", "1 Feb 2024 to 15 Feb 2024"
+_DATE_PATTERN = re.compile(
+    r"\d{1,2}[./-]\d{1,2}[./-]\d{2,4}"
+    r"|\d{1,2}(?:st|nd|rd|th)?[\s-]+[A-Za-z]{3,9}[,\s-]+\d{4}"
+    r"|[A-Za-z]{3,9}\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}"
+)
+_DATE_FORMATS = (
+    "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%y",
+    "%d %b %Y", "%d %B %Y", "%b %d %Y", "%B %d %Y",
+)
+
+
+def _parse_date(token):
+    cleaned = re.sub(r"(?<=\d)(st|nd|rd|th)", "", token)
+    cleaned = re.sub(r"[,\s-]+", " ", cleaned).strip() if re.search(r"[A-Za-z]", cleaned) else cleaned
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(cleaned, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_duration(duration):
+    """
+    Split the listing's "duration" cell into (published_at, closing_at).
+    The first date found is the publish date, the last the closing date;
+    either is None when it cannot be parsed.
+    """
+    dates = [d for d in (_parse_date(t) for t in _DATE_PATTERN.findall(duration or "")) if d]
+    if not dates:
+        return None, None
+    if len(dates) == 1:
+        return None, dates[0]
+    return dates[0], dates[-1]
+
+
 def download_pdf(pdf_url, pdf_path, headers):
     if os.path.exists(pdf_path):
         return True
 
+    start = time.perf_counter()
+    ok = _download_pdf(pdf_url, pdf_path, headers)
+    PDF_DOWNLOAD_SECONDS.labels("MHA", "ok" if ok else "failed").observe(time.perf_counter() - start)
+    return ok
+
+
+def _download_pdf(pdf_url, pdf_path, headers):
     tmp_dir = os.path.dirname(pdf_path)
     os.makedirs(tmp_dir, exist_ok=True)
 
@@ -71,6 +118,7 @@ def download_pdf(pdf_url, pdf_path, headers):
 
 def fetch_mha_tenders():
     print(" Fetching MHA tenders (Block-1)...")
+    start_file_exporter()
 
     os.makedirs(PDF_DIR, exist_ok=True)
     os.makedirs(ZIP_DIR, exist_ok=True)
@@ -83,7 +131,8 @@ def fetch_mha_tenders():
         page_url = f"{BASE_URL}?page={page}"
 
         try:
-            res = requests.get(page_url, headers=HEADERS, timeout=30)
+            with PAGE_FETCH_SECONDS.labels("MHA").time():
+                res = requests.get(page_url, headers=HEADERS, timeout=30)
             res.raise_for_status()
         except Exception:
             break
@@ -121,6 +170,7 @@ def fetch_mha_tenders():
             pdf_url = urljoin(BASE_DOMAIN, pdf_tag["href"])
             pdf_name = pdf_url.split("/")[-1]
             pdf_path = os.path.join(PDF_DIR, pdf_name)
+            published_at, closing_at = parse_duration(duration)
 
             tender_id = upsert_tender({
                 "source": "MHA",
@@ -128,11 +178,14 @@ def fetch_mha_tenders():
                 "sr_no": sr_no,
                 "title": title,
                 "duration": duration,
+                "published_at": published_at,
+                "closing_at": closing_at,
                 "page_no": page
             })
 
-            if not download_pdf(pdf_url, pdf_path, HEADERS):
-                continue
+            with span("pdf_download", source="MHA", tender_id=tender_id, tender_ref_no=tender_no):
+                if not download_pdf(pdf_url, pdf_path, HEADERS):
+                    continue
 
             if not os.path.exists(pdf_path):
                 continue
@@ -147,6 +200,8 @@ def fetch_mha_tenders():
                 "document_type": "MHA_PDF",
                 "local_path": pdf_path,
                 "pdf_url": pdf_url,
+                "published_at": published_at,
+                "closing_at": closing_at,
                 "size_kb": round(os.path.getsize(pdf_path) / 1024, 2),
                 "docling_status": "pending"
             })
@@ -0,0 +1,263 @@
+# storage/doc_cost.py
+#
+# Per-document cost: a cheap pre-pass over each PDF (page count, file size,
+# text layer present or not -> OCR needed) stored on the document as
+# `cost`, a predicted Docling time from rates learned out of the ledger, and
+# the ledger itself (`doc_costs`: actual Docling / embedding seconds per
+# document). Extraction and indexing are scheduled on it: higher `priority`
+# first (profile uploads ahead of tender backfill), then cheapest first;
+# documents over the slow-lane thresholds go to their own lane so one
+# 300-page scan cannot hold up fifty small notices.
+#
+#   python -m storage.doc_cost --backfill --collection tender_documents   # probe pending docs without `cost`
+#   python -m storage.doc_cost --rates                                    # learned seconds/page
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+COST_FIELD = "cost"
+INDEX_COST_FIELD = "index_cost"
+LEDGER_COLLECTION = "doc_costs"
+
+# Seconds per page until the ledger has enough samples to learn its own
+DOCLING_SECONDS_PER_PAGE_TEXT = float(os.getenv("DOCLING_SECONDS_PER_PAGE_TEXT", "0.6"))
+DOCLING_SECONDS_PER_PAGE_OCR = float(os.getenv("DOCLING_SECONDS_PER_PAGE_OCR", "5.0"))
+EMBED_SECONDS_PER_KCHAR = float(os.getenv("EMBED_SECONDS_PER_KCHAR", "0.02"))
+# Documents over either threshold go to the slow lane
+SLOW_LANE_PAGES = int(os.getenv("SLOW_LANE_PAGES", "150"))
+SLOW_LANE_SECONDS = float(os.getenv("SLOW_LANE_SECONDS", "300"))
+# Higher runs first; a document's own `priority` field overrides these
+PRIORITY_BY_DOC_TYPE = {"profile": 100, "tender": 0}
+# Learned rates: ledger rows considered, minimum samples, refresh period
+RATE_SAMPLES = int(os.getenv("DOC_COST_RATE_SAMPLES", "500"))
+RATE_MIN_SAMPLES = 20
+RATE_TTL_SECONDS = 600.0
+# The byte-scan probe reads at most this much of a file
+PROBE_SCAN_BYTES = 32 * 1024 * 1024
+
+FAST_LANE = "fast"
+SLOW_LANE = "slow"
+
+logger = logging.getLogger(__name__)
+
+_PAGE_OBJ = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_PAGE_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", re.S)
+_FONT = re.compile(rb"/Font\b")
+
+
+def _scan_pdf(path: str) -> Tuple[int, bool]:
+    """(pages, has_text_layer) from the raw bytes; used when pypdfium2 is missing."""
+    pages = 0
+    declared = 0
+    has_font = False
+    read = 0
+    tail = b""
+    with open(path, "rb") as f:
+        while read < PROBE_SCAN_BYTES:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            read += len(block)
+            data = tail + block
+            # Count only matches that start in the new bytes
+            pages += sum(1 for m in _PAGE_OBJ.finditer(data) if m.start() >= len(tail))
+            for m in _PAGE_COUNT.finditer(data):
+                declared = max(declared, int(m.group(1) or m.group(2)))
+            has_font = has_font or bool(_FONT.search(data))
+            tail = data[-256:]
+    # Object streams hide page objects from the scan; the page tree root still declares /Count
+    return max(pages, declared), has_font
+
+
+def probe_pdf(path: str) -> Dict[str, Any]:
+    """Page count, size and text-layer presence of one PDF, without converting it."""
+    size = os.path.getsize(path)
+    try:
+        import pypdfium2 as pdfium  # ships with docling
+    except ModuleNotFoundError:
+        pdfium = None
+
+    if pdfium is not None:
+        try:
+            pdf = pdfium.PdfDocument(path)
+            try:
+                pages = len(pdf)
+                # A few pages are enough to tell a scan from a born-digital PDF
+                has_text = any(
+                    pdf[i].get_textpage().get_text_range().strip() for i in range(min(pages, 3))
+                )
+            finally:
+                pdf.close()
+            return {"pages": pages, "size_bytes": size, "has_text_layer": has_text, "probe": "pdfium"}
+        except Exception as exc:
+            logger.debug("pdfium could not open %s (%s); scanning bytes", path, exc)
+
+    pages, has_text = _scan_pdf(path)
+    return {"pages": pages, "size_bytes": size, "has_text_layer": has_text, "probe": "scan"}
+
+
+class _Rates:
+    """Docling seconds per page (text layer / OCR), learned from the ledger and cached."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rates = {True: DOCLING_SECONDS_PER_PAGE_TEXT, False: DOCLING_SECONDS_PER_PAGE_OCR}
+        self._loaded_at = 0.0
+
+    def get(self, db=None) -> Dict[bool, float]:
+        if db is not None and time.monotonic() - self._loaded_at > RATE_TTL_SECONDS:
+            with self._lock:
+                if time.monotonic() - self._loaded_at > RATE_TTL_SECONDS:
+                    self._loaded_at = time.monotonic()
+                    try:
+                        self._rates.update(learned_rates(db))
+                    except Exception as exc:
+                        logger.warning("Could not load Docling rates from %s: %s", LEDGER_COLLECTION, exc)
+        return dict(self._rates)
+
+
+_rates = _Rates()
+
+
+def learned_rates(db) -> Dict[bool, float]:
+    """Median Docling seconds per page over recent ledger rows, by text-layer presence."""
+    rows = db[LEDGER_COLLECTION].find(
+        {"docling_s": {"$gt": 0}, "pages": {"$gt": 0}},
+        {"docling_s": 1, "pages": 1, "has_text_layer": 1},
+    ).sort("docling_at", -1).limit(RATE_SAMPLES)
+    samples: Dict[bool, list] = {True: [], False: []}
+    for row in rows:
+        # Rows from documents that were never probed carry None: unknown, not OCR
+        if row.get("has_text_layer") is None:
+            continue
+        samples[bool(row["has_text_layer"])].append(row["docling_s"] / row["pages"])
+    rates = {}
+    for has_text, values in samples.items():
+        if len(values) >= RATE_MIN_SAMPLES:
+            values.sort()
+            rates[has_text] = values[len(values) // 2]
+    return rates
+
+
+def lane_for(pages: int, predicted_s: float) -> str:
+    return SLOW_LANE if pages >= SLOW_LANE_PAGES or predicted_s >= SLOW_LANE_SECONDS else FAST_LANE
+
+
+def docling_cost(probe: Mapping[str, Any], db=None) -> Dict[str, Any]:
+    """The `cost` subdocument for a probed PDF: probe fields + prediction + lane."""
+    # An unknown text layer (None) is priced like the common case, a text PDF
+    rate = _rates.get(db)[probe.get("has_text_layer") is not False]
+    pages = int(probe.get("pages") or 0)
+    # Unknown page count (broken xref): fall back to ~100 KB per page
+    predicted = rate * (pages or max(1, probe.get("size_bytes", 0) // (100 * 1024)))
+    return {
+        **probe,
+        "predicted_s": round(predicted, 2),
+        "lane": lane_for(pages, predicted),
+        "probed_at": datetime.now(timezone.utc),
+    }
+
+
+def probe_document(collection, doc: Mapping[str, Any]) -> Optional[Dict[str, Any]]:
+    """Probe a document's local PDF and store its `cost`; None when the file is missing."""
+    path = doc.get("local_path")
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        cost = docling_cost(probe_pdf(path), collection.database)
+    except OSError as exc:
+        logger.warning("Could not probe %s: %s", path, exc)
+        return None
+    collection.update_one({"_id": doc["_id"]}, {"$set": {COST_FIELD: cost}})
+    return cost
+
+
+def index_cost(text_chars: int) -> Dict[str, Any]:
+    """Predicted chunk+embed time of an extracted text (docling_outputs.index_cost)."""
+    return {"chars": int(text_chars), "predicted_s": round(text_chars / 1000 * EMBED_SECONDS_PER_KCHAR, 3)}
+
+
+def doc_priority(doc: Mapping[str, Any]) -> int:
+    if doc.get("priority") is not None:
+        return int(doc["priority"])
+    return PRIORITY_BY_DOC_TYPE.get(doc.get("doc_type") or ("profile" if doc.get("profile_id") else "tender"), 0)
+
+
+def schedule_key(doc: Mapping[str, Any], cost_field: str = COST_FIELD) -> Tuple[int, float]:
+    """Sort key: higher priority first, then cheapest first (unknown cost sorts as free)."""
+    cost = doc.get(cost_field) or {}
+    return -doc_priority(doc), float(cost.get("predicted_s") or 0.0)
+
+
+# Mongo sort matching schedule_key (the `priority` field only; doc-type defaults are applied on insert)
+SCHEDULE_SORT = [("priority", -1), (f"{COST_FIELD}.predicted_s", 1)]
+
+
+def record_cost(db, document_id: Any, stage: str, seconds: float, **fields: Any) -> None:
+    """
+    Ledger entry for one document: `stage` is "docling" or "embed";
+    extra fields (pages, chunk_count, doc_type, ...) are stored alongside.
+    """
+    now = datetime.now(timezone.utc)
+    db[LEDGER_COLLECTION].update_one(
+        {"_id": document_id},
+        {
+            "$set": {f"{stage}_s": round(seconds, 3), f"{stage}_at": now, **fields},
+            "$setOnInsert": {"created_at": now},
+        },
+        upsert=True,
+    )
+
+
+def backfill_costs(db, collection: str, limit: int = 0) -> int:
+    """Probe pending documents that have no `cost` yet (and give them a default priority)."""
+    coll = db[collection]
+    query = {"docling_status": "pending", COST_FIELD: {"$exists": False}}
+    n = 0
+    for doc in coll.find(query, {"local_path": 1, "doc_type": 1, "profile_id": 1, "priority": 1}, limit=limit):
+        if doc.get("priority") is None:
+            coll.update_one({"_id": doc["_id"]}, {"$set": {"priority": doc_priority(doc)}})
+        if probe_document(coll, doc) is not None:
+            n += 1
+    return n
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Document cost pre-pass / ledger")
+    parser.add_argument("--backfill", action="store_true", help="probe pending documents without a cost")
+    parser.add_argument("--collection", action="append", help="default: tender_documents and company_documents")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--rates", action="store_true", help="print the learned seconds per page")
+    parser.add_argument("--probe", help="probe one PDF file and print the result")
+    args = parser.parse_args()
+
+    if args.probe:
+        print(docling_cost(probe_pdf(args.probe)))
+        return
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("DB_NAME", "tender_db")]
+    if args.backfill:
+        for collection in args.collection or ["tender_documents", "company_documents"]:
+            print(f"{collection}: probed {backfill_costs(db, collection, args.limit)} documents")
+    if args.rates:
+        learned = learned_rates(db)
+        rates = _rates.get(db)
+        for has_text, label in ((True, "text layer"), (False, "scanned/OCR")):
+            print(f"{label:>12}: {rates[has_text]:.2f} s/page ({'learned' if has_text in learned else 'default'})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# storage/indexes.py
+#
+# The Mongo indexes the pipeline and API rely on, declared in one place and
+# applied idempotently (API / worker / daemon startup, or the CLI). Work
+# queues use partial indexes so "what is still pending" stays a small
+# index no matter how large the collection grows.
+#
+#   python -m storage.indexes            # create missing indexes
+#   python -m storage.indexes --check    # explain() every hot query, exit 1 on COLLSCAN
+#   python -m storage.indexes --rebuild  # also replace indexes whose options changed
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# Apply missing indexes when the API / job workers / daemon start
+ENSURE_INDEXES_ON_STARTUP = os.getenv("MONGO_ENSURE_INDEXES", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+# IndexOptionsConflict / IndexKeySpecsConflict
+_INDEX_CONFLICT = {85, 86}
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    name: str
+    keys: List[Tuple[str, int]]
+    options: Dict[str, Any] = {}
+
+
+INDEXES: List[IndexSpec] = [
+    # Scraper upserts + docling work queue
+    IndexSpec("raw_tenders", "source_ref", [("source", ASCENDING), ("tender_ref_no", ASCENDING)]),
+    IndexSpec("tender_documents", "source_ref", [("source", ASCENDING), ("tender_ref_no", ASCENDING)]),
+    IndexSpec("tender_documents", "tender_document", [("tender_id", ASCENDING), ("document_name", ASCENDING)]),
+    IndexSpec(
+        "tender_documents", "docling_pending",
+        [("docling_status", ASCENDING), ("updated_at", ASCENDING)],
+        {"partialFilterExpression": {"docling_status": "pending"}},
+    ),
+    IndexSpec(
+        "tender_documents", "docling_schedule",
+        [("docling_status", ASCENDING), ("priority", DESCENDING), ("cost.predicted_s", ASCENDING)],
+        {"partialFilterExpression": {"docling_status": "pending"}},
+    ),
+    # Indexing work queue ("indexed != True" cannot be a partial filter: $ne is not allowed there)
+    IndexSpec("docling_outputs", "document", [("document_id", ASCENDING), ("doc_type", ASCENDING)]),
+    IndexSpec(
+        "docling_outputs", "index_queue",
+        [("doc_type", ASCENDING), ("indexed", ASCENDING), ("extracted_at", ASCENDING)],
+    ),
+    # Company profiles
+    IndexSpec("company_documents", "profile_docling", [("profile_id", ASCENDING), ("docling_status", ASCENDING)]),
+    IndexSpec(
+        "company_documents", "docling_pending",
+        [("docling_status", ASCENDING), ("updated_at", ASCENDING)],
+        {"partialFilterExpression": {"docling_status": "pending"}},
+    ),
+    IndexSpec(
+        "company_documents", "docling_schedule",
+        [("docling_status", ASCENDING), ("priority", DESCENDING), ("cost.predicted_s", ASCENDING)],
+        {"partialFilterExpression": {"docling_status": "pending"}},
+    ),
+    IndexSpec("company_profiles", "status", [("status", ASCENDING)]),
+    # Job queue (api/services/jobs.py)
+    IndexSpec(
+        "jobs", "claim_schedule",
+        [("status", ASCENDING), ("priority", DESCENDING), ("predicted_s", ASCENDING), ("available_at", ASCENDING),
+         ("_id", ASCENDING)],
+    ),
+    IndexSpec(
+        "jobs", "running_leases",
+        [("lease_expires_at", ASCENDING)],
+        {"partialFilterExpression": {"status": "running"}},
+    ),
+    IndexSpec("jobs", "profile_status", [("profile_id", ASCENDING), ("status", ASCENDING)]),
+    # Precomputed matches (embeddings/match_matrix.py)
+    IndexSpec("profile_matches", "profile_score", [("profile_id", ASCENDING), ("score", DESCENDING)]),
+    IndexSpec("profile_matches", "profile_matched_at", [("profile_id", ASCENDING), ("matched_at", DESCENDING)]),
+    # Cost ledger (storage/doc_cost.py): learned Docling rates read the newest rows
+    IndexSpec("doc_costs", "docling_at", [("docling_at", DESCENDING)]),
+    # Partition registry (embeddings/partitions.py)
+    IndexSpec("tender_partitions", "status_source", [("status", ASCENDING), ("source", ASCENDING)]),
+]
+
+
+class HotQuery(NamedTuple):
+    collection: str
+    description: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+def hot_queries() -> List[HotQuery]:
+    """The queries --check explains; ids are placeholders, only the plan matters."""
+    oid = ObjectId()
+    now = datetime.now(timezone.utc)
+    return [
+        HotQuery("raw_tenders", "tender upsert", {"source": "MHA", "tender_ref_no": "X"}),
+        HotQuery(
+            "tender_documents", "pdf upsert",
+            {"$or": [{"tender_id": oid, "document_name": "x.pdf"}, {"source": "MHA", "tender_ref_no": "X"}]},
+        ),
+        HotQuery("tender_documents", "docling backlog", {"docling_status": "pending"}),
+        HotQuery(
+            "tender_documents", "docling schedule",
+            {"docling_status": "pending"}, [("priority", DESCENDING), ("cost.predicted_s", ASCENDING)],
+        ),
+        HotQuery(
+            "tender_documents", "docling feed (watermark)",
+            {"docling_status": "pending", "updated_at": {"$gte": now}}, [("updated_at", ASCENDING)],
+        ),
+        HotQuery(
+            "tender_documents", "search result lookup",
+            {"$or": [{"tender_id": {"$in": [oid]}}, {"_id": {"$in": [oid]}}]},
+        ),
+        HotQuery("docling_outputs", "docling done check", {"document_id": oid}),
+        HotQuery("docling_outputs", "tender index backlog", {"doc_type": "tender", "indexed": {"$ne": True}}),
+        HotQuery(
+            "docling_outputs", "index feed (watermark)",
+            {"doc_type": {"$in": ["tender"]}, "indexed": {"$ne": True},
+             "$or": [{"extracted_at": {"$gt": now}}, {"extracted_at": now, "_id": {"$gt": oid}}]},
+            [("extracted_at", ASCENDING), ("_id", ASCENDING)],
+        ),
+        HotQuery(
+            "docling_outputs", "profile outputs",
+            {"doc_type": "profile", "profile_id": oid, "document_id": {"$in": [oid]}},
+        ),
+        HotQuery("company_documents", "profile pending docs", {"profile_id": oid, "docling_status": "pending"}),
+        HotQuery(
+            "company_documents", "profile unembedded docs",
+            {"profile_id": oid, "docling_status": "done", "embedding_status": {"$ne": "indexed"}},
+        ),
+        HotQuery("company_documents", "docling backlog", {"docling_status": "pending"}),
+        HotQuery(
+            "company_documents", "profile docs by cost",
+            {"profile_id": oid, "docling_status": "pending"}, [("cost.predicted_s", ASCENDING)],
+        ),
+        HotQuery("company_profiles", "READY profiles", {"status": "READY", "profile_embedding": {"$ne": None}}),
+        HotQuery(
+            "jobs", "claim",
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}},
+            ]},
+            [("priority", DESCENDING), ("predicted_s", ASCENDING), ("available_at", ASCENDING), ("_id", ASCENDING)],
+        ),
+        HotQuery("jobs", "active jobs by profile", {"profile_id": oid, "status": "queued"}),
+        HotQuery("jobs", "active jobs", {"status": {"$in": ["queued", "running"]}}),
+        HotQuery("profile_matches", "top matches", {"profile_id": oid}, [("score", DESCENDING)]),
+        HotQuery(
+            "profile_matches", "new matches feed",
+            {"profile_id": oid, "matched_at": {"$gt": now}}, [("matched_at", DESCENDING), ("score", DESCENDING)],
+        ),
+    ]
+
+
+def _same_index(existing: Dict[str, Any], spec: IndexSpec) -> bool:
+    if [tuple(k) for k in existing.get("key", [])] != [tuple(k) for k in spec.keys]:
+        return False
+    return all(existing.get(opt) == value for opt, value in spec.options.items())
+
+
+def ensure_indexes(db, collections: Optional[Iterable[str]] = None, rebuild: bool = False) -> Dict[str, List[str]]:
+    """
+    Create every declared index that is missing. An index that exists under
+    the same name with other keys/options is reported (and replaced with
+    `rebuild`). Returns {"created": [...], "conflicts": [...], "replaced": [...]}.
+    """
+    wanted = set(collections) if collections is not None else None
+    report: Dict[str, List[str]] = {"created": [], "conflicts": [], "replaced": []}
+    existing_by_coll: Dict[str, Dict[str, Any]] = {}
+
+    for spec in INDEXES:
+        if wanted is not None and spec.collection not in wanted:
+            continue
+        coll = db[spec.collection]
+        if spec.collection not in existing_by_coll:
+            existing_by_coll[spec.collection] = coll.index_information()
+        existing = existing_by_coll[spec.collection].get(spec.name)
+        label = f"{spec.collection}.{spec.name}"
+
+        if existing is not None and _same_index(existing, spec):
+            continue
+        if existing is not None:
+            if not rebuild:
+                report["conflicts"].append(label)
+                logger.warning("Index %s differs from its declaration; run with --rebuild to replace it", label)
+                continue
+            coll.drop_index(spec.name)
+            report["replaced"].append(label)
+
+        try:
+            coll.create_index(spec.keys, name=spec.name, **spec.options)
+        except OperationFailure as exc:
+            # Same keys already indexed under another name
+            if exc.code not in _INDEX_CONFLICT:
+                raise
+            report["conflicts"].append(label)
+            logger.warning("Index %s conflicts with an existing index: %s", label, exc)
+            continue
+        if label not in report["replaced"]:
+            report["created"].append(label)
+
+    if report["created"] or report["replaced"]:
+        logger.info("Mongo indexes: created %s, replaced %s", report["created"] or "-", report["replaced"] or "-")
+    return report
+
+
+def _plan_stages(node: Any) -> Iterable[Dict[str, Any]]:
+    if isinstance(node, dict):
+        if "stage" in node:
+            yield node
+        for value in node.values():
+            yield from _plan_stages(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _plan_stages(value)
+
+
+def explain_plan(db, query: HotQuery) -> Tuple[List[str], List[str]]:
+    """(stages of the winning plan, index names used)."""
+    cursor = db[query.collection].find(query.filter)
+    if query.sort:
+        cursor = cursor.sort(query.sort)
+    plan = cursor.limit(100).explain().get("queryPlanner", {}).get("winningPlan", {})
+    stages = list(_plan_stages(plan))
+    return [s["stage"] for s in stages], sorted({s["indexName"] for s in stages if s.get("indexName")})
+
+
+def check_query_plans(db, queries: Optional[Sequence[HotQuery]] = None) -> List[str]:
+    """explain() every hot query; returns the ones whose plan scans a collection."""
+    failures: List[str] = []
+    existing = set(db.list_collection_names())
+    for query in queries if queries is not None else hot_queries():
+        label = f"{query.collection}: {query.description}"
+        if query.collection not in existing:
+            # explain() on a missing collection is a bare EOF plan, which proves nothing
+            failures.append(f"{label} (collection missing; run without --check first)")
+            continue
+        stages, index_names = explain_plan(db, query)
+        if "COLLSCAN" in stages:
+            failures.append(f"{label} -> {' > '.join(stages)}")
+            logger.error("COLLSCAN  %s", label)
+        else:
+            logger.info("ok        %-55s %s", label, ", ".join(index_names) or " > ".join(stages))
+    return failures
+
+
+def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Apply the declared Mongo indexes / check hot query plans")
+    parser.add_argument("--check", action="store_true", help="explain() every hot query, exit 1 on COLLSCAN")
+    parser.add_argument("--rebuild", action="store_true", help="drop and recreate indexes whose definition changed")
+    parser.add_argument("--collection", action="append", help="limit to these collections")
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("DB_NAME", "tender_db")]
+    if args.check:
+        queries = [q for q in hot_queries() if not args.collection or q.collection in args.collection]
+        failures = check_query_plans(db, queries)
+        for failure in failures:
+            print(f"FAIL {failure}")
+        raise SystemExit(1 if failures else 0)
+
+    report = ensure_indexes(db, args.collection, rebuild=args.rebuild)
+    if report["conflicts"]:
+        raise SystemExit(f"Conflicting indexes: {', '.join(report['conflicts'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# storage/mongo.py
+#
+# The process-wide MongoClient. Scrapers, batch scripts, the indexing daemon
+# and the API (api/services/mongo.py) all share it, so a process holds one
+# connection pool instead of one per module. Nothing is created at import
+# time: the client is built on the first get_db()/get_client() call, which
+# keeps `import` cheap for CLIs and tests that never touch the database.
+
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI") or "mongodb://localhost:27017"
+DB_NAME = os.getenv("DB_NAME", "tender_db")
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+# 0 = no socket/wait-queue timeout (pymongo default)
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))
+
+_client = None
+_lock = threading.Lock()
+
+
+def client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+    }
+    if MONGO_SOCKET_TIMEOUT_MS > 0:
+        options["socketTimeoutMS"] = MONGO_SOCKET_TIMEOUT_MS
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS > 0:
+        options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    return options
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, **client_options())
+    return _client
+
+
+def get_db(name: str = None):
+    """Database `name` (default DB_NAME) on the shared client."""
+    return get_client()[name or DB_NAME]
+
+
+def close_client() -> None:
+    global _client
+    with _lock:
+        if _client is not None:
+            client, _client = _client, None
+            client.close()
@@ -1,14 +1,10 @@
-from pymongo import MongoClient
-from dotenv import load_dotenv
 from datetime import datetime
 import os
 
-load_dotenv()
+from storage.doc_cost import PRIORITY_BY_DOC_TYPE, docling_cost, probe_pdf
+from storage.mongo import get_db
 
-mongo_uri = os.getenv("MONGO_URI") or "mongodb://localhost:27017"
-client = MongoClient(mongo_uri)
-db = client["tender_db"]
-collection = db["tender_documents"]
+COLLECTION = "tender_documents"
 
 def upsert_pdf_metadata(data):
     """
@@ -16,6 +12,7 @@ def upsert_pdf_metadata(data):
     Safe for re-runs
     """
 
+    collection = get_db()[COLLECTION]
     filter_query = {
         "$or": [
             {
@@ -33,6 +30,11 @@ def upsert_pdf_metadata(data):
     update_payload = {**data}
     update_payload.pop("docling_status", None)
 
+    # Cost pre-pass: page count / size / text layer, used to order Docling work
+    local_path = data.get("local_path")
+    if local_path and os.path.exists(local_path):
+        update_payload["cost"] = docling_cost(probe_pdf(local_path), collection.database)
+
     update_data = {
         "$set": {
             **update_payload,
@@ -40,7 +42,8 @@ def upsert_pdf_metadata(data):
         },
         "$setOnInsert": {
             "created_at": datetime.utcnow(),
-            "docling_status": insert_docling_status
+            "docling_status": insert_docling_status,
+            "priority": PRIORITY_BY_DOC_TYPE["tender"]
         }
     }
 
@@ -1,14 +1,8 @@
-from pymongo import MongoClient
-from dotenv import load_dotenv
 from datetime import datetime
-import os
 
-load_dotenv()
+from storage.mongo import get_db
 
-mongo_uri = os.getenv("MONGO_URI") or "mongodb://localhost:27017"
-client = MongoClient(mongo_uri)
-db = client["tender_db"]
-collection = db["raw_tenders"]
+COLLECTION = "raw_tenders"
 
 def upsert_tender(data):
     """
@@ -16,6 +10,7 @@ def upsert_tender(data):
     Stable across re-scrapes
     """
 
+    collection = get_db()[COLLECTION]
     filter_query = {
         "source": data["source"],
         "tender_ref_no": data["tender_ref_no"]
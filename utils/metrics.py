@@ -0,0 +1,501 @@
+# utils/metrics.py
+#
+# Shared instrumentation for scrape -> Docling -> embed -> index -> search.
+# Counters, gauges and histograms rendered in the Prometheus text format
+# (no client library needed): the API serves them at /metrics, batch
+# scripts write them to METRICS_FILE (node_exporter textfile-collector
+# style, no pushgateway) via start_file_exporter().
+#
+# span() times one stage into stage_seconds{stage=...} and carries ids
+# (tender_id, profile_id, document_id, ...) down to nested spans; with
+# METRICS_SPAN_LOG set every finished span is appended there as a JSON
+# line, so one slow document can be followed end to end:
+#
+#   grep '"document_id": "65f..."' spans.jsonl
+
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+METRICS_SPAN_LOG = os.getenv("METRICS_SPAN_LOG", "")
+# Spans slower than this are also logged as warnings
+METRICS_SLOW_SPAN_SECONDS = float(os.getenv("METRICS_SLOW_SPAN_SECONDS", "10"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: Any, **kwargs: Any):
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = float(value)
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        self.function = fn
+
+    def get(self) -> float:
+        if self.function is not None:
+            return float(self.function())
+        return self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            yield f"{self.name}_total{_labels_text(self.labelnames, key)} {_number(child.get())}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        self._default().set_function(fn)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            try:
+                value = child.get()
+            except Exception as exc:
+                logger.debug("Gauge %s callback failed: %s", self.name, exc)
+                continue
+            yield f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}"
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels_text(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels_text(self.labelnames, key)} {count}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def add_collector(self, fn: Callable[[], None]) -> None:
+        """`fn` runs before every render (refresh gauges from an external source)."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for fn in collectors:
+            try:
+                fn()
+            except Exception as exc:
+                logger.warning("Metrics collector %s failed: %s", getattr(fn, "__name__", fn), exc)
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Pipeline metrics, shared by every stage
+STAGE_SECONDS = histogram("stage_seconds", "Duration of traced pipeline stages", ("stage", "outcome"))
+PAGE_FETCH_SECONDS = histogram("scrape_page_fetch_seconds", "Listing page fetch time", ("source",))
+PDF_DOWNLOAD_SECONDS = histogram("pdf_download_seconds", "PDF download time", ("source", "outcome"))
+DOCLING_SECONDS_PER_PAGE = histogram(
+    "docling_convert_seconds_per_page", "Docling conversion time divided by page count", ("doc_type",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+CHUNK_SECONDS = histogram("chunk_seconds", "Chunking time per document", ("doc_type",))
+EMBED_BATCH_SECONDS = histogram("embed_batch_seconds", "Embedding time per batch", ("model",))
+EMBED_TEXTS = counter("embedded_texts", "Texts embedded", ("model",))
+VECTOR_STORE_SECONDS = histogram("vector_store_seconds", "Vector store call time", ("op", "collection"))
+MONGO_COMMAND_SECONDS = histogram(
+    "mongo_command_seconds", "Mongo round-trip time per command", ("command", "outcome"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+HTTP_REQUEST_SECONDS = histogram("http_request_seconds", "API request latency", ("method", "route", "status"))
+DOCUMENTS = gauge("pipeline_documents", "Documents by collection and state", ("collection", "state"))
+JOBS = gauge("jobs", "Profile ingest jobs by status", ("status",))
+QUEUE_DEPTH = gauge("work_queue_depth", "Items waiting in in-process work queues", ("queue",))
+QUEUE_DROPPED = counter("work_queue_dropped", "Items a full non-blocking queue left for the next sweep", ("queue",))
+
+
+class _MongoCommandTimer(monitoring.CommandListener):
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        MONGO_COMMAND_SECONDS.labels(event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event) -> None:
+        MONGO_COMMAND_SECONDS.labels(event.command_name, "error").observe(event.duration_micros / 1e6)
+
+
+_mongo_listener_lock = threading.Lock()
+_mongo_listener_registered = False
+
+
+def register_mongo_metrics() -> None:
+    """
+    Install the mongo_command_seconds listener. pymongo listeners are global
+    but only reach clients created after registration, so entry points call
+    this before the first get_db()/get_async_db(); repeated calls are no-ops.
+    """
+    global _mongo_listener_registered
+    with _mongo_listener_lock:
+        if not _mongo_listener_registered:
+            monitoring.register(_MongoCommandTimer())
+            _mongo_listener_registered = True
+
+
+class InstrumentedStore:
+    """
+    Wraps a VectorStore (Chroma collection or FlatVectorStore) so every
+    upsert/query/get/delete lands in vector_store_seconds; everything else
+    is passed through.
+    """
+
+    _TIMED = ("upsert", "query", "get", "delete", "count")
+
+    def __init__(self, store: Any, collection: str) -> None:
+        self._store = store
+        self._collection = collection
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._store, name)
+        if name not in self._TIMED or not callable(attr):
+            return attr
+        child = VECTOR_STORE_SECONDS.labels(name, self._collection)
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            with child.time():
+                return attr(*args, **kwargs)
+
+        return timed
+
+    def __repr__(self) -> str:
+        return f"InstrumentedStore({self._store!r})"
+
+
+class Span:
+    __slots__ = ("stage", "attrs", "trace_id", "span_id", "parent_id")
+
+    def __init__(self, stage: str, attrs: Dict[str, Any], trace_id: str, parent_id: Optional[str]) -> None:
+        self.stage = stage
+        self.attrs = attrs
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+
+    def set(self, **attrs: Any) -> None:
+        """Attach more attributes (e.g. page count) before the span ends."""
+        self.attrs.update(attrs)
+
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+_span_log_lock = threading.Lock()
+
+
+def _write_span(record: Dict[str, Any]) -> None:
+    line = json.dumps(record, default=str)
+    with _span_log_lock:
+        with open(METRICS_SPAN_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Span]:
+    """
+    Time one stage. Attributes (ids) are inherited from the enclosing span,
+    so a nested "embed" span still carries the tender_id of its "index" span.
+    """
+    parent = _current_span.get()
+    inherited = dict(parent.attrs) if parent else {}
+    inherited.update({k: str(v) for k, v in attrs.items() if v is not None})
+    current = Span(stage, inherited, parent.trace_id if parent else uuid.uuid4().hex, parent.span_id if parent else None)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        STAGE_SECONDS.labels(stage, "error" if error else "ok").observe(seconds)
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "stage": stage,
+            "seconds": round(seconds, 6),
+            "trace_id": current.trace_id,
+            "span_id": current.span_id,
+            "parent_id": current.parent_id,
+            "error": error,
+            **current.attrs,
+        }
+        if METRICS_SPAN_LOG:
+            try:
+                _write_span(record)
+            except OSError as exc:
+                logger.debug("Could not write span log: %s", exc)
+        if seconds >= METRICS_SLOW_SPAN_SECONDS:
+            logger.warning("Slow %s: %.2fs %s", stage, seconds, current.attrs)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+def write_metrics_file(path: str = METRICS_FILE) -> None:
+    """Atomically write every metric to `path` (read by a textfile collector)."""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp, path)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_file_exporter(path: str = METRICS_FILE, interval: float = METRICS_FILE_INTERVAL) -> None:
+    """
+    For batch scripts: rewrite `path` every `interval` seconds and once
+    more at exit. No-op without a path (METRICS_FILE unset).
+    """
+    global _exporter_started
+    if not path:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                write_metrics_file(path)
+            except OSError as exc:
+                logger.warning("Could not write %s: %s", path, exc)
+
+    threading.Thread(target=loop, name="metrics-file-exporter", daemon=True).start()
+    atexit.register(write_metrics_file, path)
+
+
+def watch_pipeline_backlog(get_db: Callable[[], Any], ttl: float = 15.0) -> None:
+    """
+    Refresh the pending/failed document and job gauges on render, at most
+    every `ttl` seconds (each refresh is a handful of indexed counts).
+    """
+    state = {"at": 0.0}
+    lock = threading.Lock()
+
+    def collect() -> None:
+        with lock:
+            if time.monotonic() - state["at"] < ttl:
+                return
+            state["at"] = time.monotonic()
+        db = get_db()
+        for coll in ("tender_documents", "company_documents"):
+            for status in ("pending", "failed"):
+                DOCUMENTS.labels(coll, f"docling_{status}").set(db[coll].count_documents({"docling_status": status}))
+        for doc_type in ("tender", "profile"):
+            DOCUMENTS.labels("docling_outputs", f"{doc_type}_unindexed").set(
+                db["docling_outputs"].count_documents({"doc_type": doc_type, "indexed": {"$ne": True}})
+            )
+        for status in ("queued", "running", "failed"):
+            JOBS.labels(status).set(db["jobs"].count_documents({"status": status}))
+
+    REGISTRY.add_collector(collect)